@@ -2,8 +2,9 @@ import logging
 import logging.config
 import traceback
 import yaml
-from fastapi import APIRouter, File, UploadFile, HTTPException, Form
+from fastapi import APIRouter, File, UploadFile, HTTPException, Form, Request
 from fastapi.responses import JSONResponse
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 from core.workflows.document_pipeline import save_all_report_formats
@@ -12,12 +13,27 @@ from core.workflows.document_drafting import flatten_report_sections
 from core.workflows.document_editor import save_updated_outputs
 from core.utils.text_extractor import extract_text
 from core.config.rag_config import RagParameters, RagPreset
+from core.config.llm_config import MODEL_ROLES
+from core.agents.editor import EDIT_MODES
+from core.agents.section import DRAFTING_MODES
 import os
 import json
 import uuid
+import asyncio
+import functools
+from typing import Awaitable
 from typing import List
 from typing import Optional
+from typing import TypeVar
 import core.document
+import core.llm
+import core.llm_cache
+from core.metrics import UsageAccountant
+from core.metrics import registry as metrics_registry
+from core.checkpoint import checkpointer
+from core.checkpoint import new_thread_id
+from core.deadline import DeadlineExceeded
+from core.section_dependencies import SectionDependencyError
 
 with open('logging.yaml', 'r') as f:
     config = yaml.safe_load(f)
@@ -29,6 +45,32 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# How often a long-running request checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 1.0
+
+
+async def cancel_on_disconnect(request: Request, work: Awaitable[T]) -> T:
+    """
+    Runs `work` while watching the client; if it disconnects, the work is cancelled so
+    that no more model calls are made for a response nobody receives.
+
+    Raises:
+        HTTPException: 499 if the client disconnected.
+    """
+    task = asyncio.ensure_future(work)
+    try:
+        while not (await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS))[0]:
+            if await request.is_disconnected():
+                logger.info(f"Client disconnected from {request.url.path}, cancelling the request")
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise HTTPException(status_code=499, detail="Client disconnected")
+        return task.result()
+    finally:
+        task.cancel()
+
 
 class ChatRequest(BaseModel):
     """
@@ -37,9 +79,16 @@ class ChatRequest(BaseModel):
     Attributes:
         document_content (str): Full document text the user wants to ask about or modify.
         question (str): The user's specific question, instruction, or correction request.
+        thread_id (str): Thread of the report, as returned by `/process/`.
+        use_cache (bool): Answer repeated model calls from the response cache (default True).
+        edit_mode (str): "scoped" (default) has the editor patch only the paragraphs the
+            question concerns, "full" has it rewrite the whole document.
     """
     document_content: str
     question: str
+    thread_id: str
+    use_cache: bool = True
+    edit_mode: str = "scoped"
 
 class FeedbackPayload(BaseModel):
     """
@@ -82,6 +131,7 @@ async def list_templates():
 
 @router.post("/process/")
 async def process_document(
+    request: Request,
     files: List[UploadFile] = File(...),
     template_name: str = Form("proposal_template.json"),
     example_file: Optional[UploadFile] = File(None),
@@ -89,7 +139,12 @@ async def process_document(
     top_k: Optional[int] = Form(None),
     chunk_size: Optional[int] = Form(None),
     overlap: Optional[int] = Form(None),
-    rag_preset: Optional[str] = Form(None)
+    rag_preset: Optional[str] = Form(None),
+    use_cache: bool = Form(True),
+    drafting_mode: str = Form("agent"),
+    thread_id: Optional[str] = Form(None),
+    deadline_seconds: Optional[float] = Form(None),
+    partial_results: bool = Form(False)
 ):
     """
     Accepts multiple PDF or DOCX files, extracts their content,
@@ -103,16 +158,50 @@ async def process_document(
         top_k (Optional[int]): Number of top documents to retrieve (1-50)
         chunk_size (Optional[int]): Size of text chunks in tokens (100-2000)
         overlap (Optional[int]): Percentage of chunk overlap (0-50)
-        rag_preset (Optional[str]): Preset name (default, high_precision, comprehensive, fast)
+        rag_preset (Optional[str]): Preset name (default, high_precision, comprehensive, fast,
+            or recommended for the benchmark-tuned preset of the template)
+        use_cache (bool): Answer repeated model calls from the response cache and reuse
+            drafts of sections whose inputs did not change (default True)
+        drafting_mode (str): "agent" (default) lets a query model formulate each section's
+            retrieval query; "fast" retrieves with the section title and objective and
+            needs one model call per section instead of two
+        thread_id (Optional[str]): Thread to run the report on. Retrying a request that
+            was interrupted (e.g. by a server restart) with the same thread_id resumes it
+            from its last completed step instead of starting over; a new thread if omitted
+        deadline_seconds (Optional[float]): Seconds report generation may take, including
+            the text extraction of the uploads; LLM_REQUEST_DEADLINE_SECONDS if omitted, 0 for none
+        partial_results (bool): At the deadline, return the sections drafted so far
+            instead of failing; the others are listed in pending_sections
 
     Returns:
-        JSONResponse: Includes message, report, flattened sections, output paths
+        JSONResponse: Includes message, report, flattened sections, output paths,
+            usage (token and latency accounting per node and section), the thread_id
+            to pass to `/chat/` for revisions of this report, reused_sections, the
+            titles of sections taken unchanged from the section cache, and
+            pending_sections, the titles of sections not drafted before the deadline
+
+    Raises:
+        HTTPException: 400 for invalid parameters or templates, 499 if the client
+            disconnected (generation is cancelled), 504 if the deadline passed without
+            partial_results (retrying with the same thread_id resumes the report), 500
+            for any other error.
     """
     logger.info(f"Processing documents with template: {template_name}")
+    # Timings such as first_section_seconds count from the arrival of the request
+    usage = UsageAccountant()
+
+    if deadline_seconds is not None and deadline_seconds < 0:
+        raise HTTPException(status_code=400, detail="deadline_seconds must not be negative")
+
+    if drafting_mode not in DRAFTING_MODES:
+        raise HTTPException(status_code=400, detail=f"drafting_mode must be one of {', '.join(DRAFTING_MODES)}")
 
     # Initialize RAG parameters
     rag_params = None
-    if rag_preset:
+    if rag_preset and rag_preset.lower() == "recommended":
+        rag_params = RagPreset.for_template(template_name) or RagPreset.DEFAULT.model_copy()
+        logger.info(f"Using recommended RAG preset for {template_name}: {rag_params.model_dump()}")
+    elif rag_preset:
         rag_params = RagPreset.get_preset(rag_preset)
         logger.info(f"Using RAG preset: {rag_preset}")
 
@@ -145,23 +234,23 @@ async def process_document(
         raise HTTPException(status_code=400, detail="Invalid template name")
 
     try:
-        # 1. Save all uploaded reference files and extract their text
+        # 1. Save all uploaded reference files. Their texts are extracted during report
+        # generation, each in its own worker thread, and every section is drafted as soon
+        # as its own sources are extracted and loaded
         logger.info(f"Processing {len(files)} reference document(s)")
-        extracted_texts = {}
+        sources = {}
         for file in files:
-            file_path = save_uploaded_file(file)
-            text = extract_and_clean_text(file_path)
-            extracted_texts[file.filename] = text
-            logger.info(f"Extracted {len(text)} chars from {file.filename}")
+            file_path = await asyncio.to_thread(save_uploaded_file, file)
+            sources[file.filename] = functools.partial(extract_and_clean_text, file_path)
 
         # 2. Load JSON-based report structure template
-        sections = load_report_structure(f"templates/{template_name}")
+        sections = await asyncio.to_thread(load_report_structure, f"templates/{template_name}")
 
         # 3. Handle style guidance
         if example_file:
-            example_file_path = save_uploaded_file(example_file)
+            example_file_path = await asyncio.to_thread(save_uploaded_file, example_file)
             try:
-                example_text = extract_text(example_file_path)
+                example_text = await asyncio.to_thread(extract_text, example_file_path)
                 os.unlink(example_file_path)
                 logger.info(f"Extracted {len(example_text)} chars from example")
                                 
@@ -176,12 +265,22 @@ async def process_document(
 
         # 4. Generate report
 
-        report_sections = await core.document.generate(
-            sections,
-            extracted_texts,
-            example_document_text=example_text,
-            rag_params=rag_params
-        )
+        thread_id = thread_id or new_thread_id("report")
+        with core.llm_cache.bypass(not use_cache):
+            report_sections = await cancel_on_disconnect(request, core.document.generate(
+                sections,
+                sources,
+                example_document_text=example_text,
+                rag_params=rag_params,
+                usage=usage,
+                drafting_mode=drafting_mode,
+                thread_id=thread_id,
+                deadline_seconds=deadline_seconds,
+                partial=partial_results
+            ))
+        usage.finish()
+        usage_report = usage.report()
+        metrics_registry.record("process", usage_report)
         
         # Convert Pydantic models to dictionaries for backward compatibility
         aggregated_report = {k: s.model_dump() for k, s in report_sections.items()}
@@ -191,7 +290,8 @@ async def process_document(
         document_id = str(uuid.uuid4())
 
         # 6. Save the report in different formats
-        output_paths = save_all_report_formats(
+        output_paths = await asyncio.to_thread(
+            save_all_report_formats,
             aggregated_report,
             "multiple_files_combined.docx"
         )
@@ -199,23 +299,40 @@ async def process_document(
         # 7. Flatten report for frontend
         flattened = flatten_report_sections(aggregated_report)
 
+        pending_sections = core.document.pending_sections(report_sections)
         response_data = {
-            "message": "Full report successfully generated",
+            "message": f"Partial report generated, {len(pending_sections)} section(s) pending"
+            if pending_sections else "Full report successfully generated",
             "uuid": document_id,
+            "thread_id": thread_id,
+            "reused_sections": await core.document.reused_sections(thread_id),
+            "pending_sections": pending_sections,
             "report_sections": aggregated_report,
             "flattened_sections": flattened,
+            "usage": usage_report,
             **output_paths
         }
         
         
         return JSONResponse(content=response_data)
         
+    except HTTPException:
+        raise
+    except SectionDependencyError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid template: {e}")
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"{e}; retry with thread_id {thread_id} to resume the report")
     except Exception as e:
         logger.error(f"Document processing failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Document processing failed: {str(e)}")
 
+def check_edit_mode(edit_mode: str):
+    if edit_mode not in EDIT_MODES:
+        raise HTTPException(status_code=400, detail=f"edit_mode must be one of {', '.join(EDIT_MODES)}")
+
+
 @router.post("/chat/")
-async def chat_about_document(data: ChatRequest):
+async def chat_about_document(data: ChatRequest, request: Request):
     """
     Sends the document content and user instruction to the Editor AI agent for
     review, corrections, or improvements. Returns the AI-generated response
@@ -225,22 +342,36 @@ async def chat_about_document(data: ChatRequest):
         data (ChatRequest): Pydantic model containing:
             - document_content (str): Full document content for review
             - question (str): User's instruction or query for the document
+            - thread_id (str): Thread of the report returned by `/process/`
+            - use_cache (bool): Whether cached model responses may be reused
+            - edit_mode (str): "scoped" to patch only the paragraphs concerned, or "full"
 
     Returns:
         dict: Contains:
             - "answer" (str): AI editor's response
             - "uuid" (str): New unique document identifier
+            - "thread_id" (str): The thread, for further revisions
+            - "usage" (dict): Token and latency accounting of the revision
             - Paths to updated outputs
 
     Raises:
-        HTTPException: If any error occurs during the chat process.
+        HTTPException: 400 for an unknown edit_mode, 404 if the thread does not exist or
+            has expired, 499 if the client disconnected (the revision is cancelled), 500
+            if any other error occurs during the chat process.
     """
+    check_edit_mode(data.edit_mode)
 
     try:
-        response = core.document.edit(data.question, data.document_content)
+        usage = UsageAccountant()
+        with core.llm_cache.bypass(not data.use_cache):
+            response = await cancel_on_disconnect(request, core.document.edit(
+                data.question, data.document_content, data.thread_id, usage=usage, edit_mode=data.edit_mode
+            ))
+        usage.finish()
+        metrics_registry.record("chat", usage.report())
 
         # Save updated content to output formats
-        output_paths = save_updated_outputs(response)
+        output_paths = await asyncio.to_thread(save_updated_outputs, response)
 
         # Generate new document UUID for tracking
         new_uuid = str(uuid.uuid4())
@@ -248,13 +379,80 @@ async def chat_about_document(data: ChatRequest):
         return {
             "answer": response,
             "uuid": new_uuid,
+            "thread_id": data.thread_id,
+            "usage": usage.report(),
             **output_paths
         }
 
+    except HTTPException:
+        raise
+    except core.document.UnknownThreadError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Chat failed: {e}")
 
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/chat/stream/")
+async def chat_about_document_stream(data: ChatRequest):
+    """
+    Streaming variant of `/chat/`. Forwards the editor's tokens as server-sent events
+    while the revision is generated, then saves the DOCX/PDF outputs.
+
+    Args:
+        data (ChatRequest): Same payload as `/chat/`
+
+    Returns:
+        StreamingResponse: `text/event-stream` with the events:
+            - "token": {"text": str} for each piece of the revision; scoped edits send none
+            - "done": {"answer", "uuid", "thread_id", "usage", "docx_path", "pdf_path"} once
+              outputs are saved
+            - "error": {"detail": str} if the revision or saving fails
+
+    Raises:
+        HTTPException: 400 for an unknown edit_mode, 404 if the thread does not exist or
+            has expired.
+    """
+    check_edit_mode(data.edit_mode)
+    if not await core.document.awaiting_revision(data.thread_id):
+        raise HTTPException(status_code=404, detail=str(core.document.UnknownThreadError(data.thread_id)))
+
+    async def events():
+        try:
+            usage = UsageAccountant()
+            with core.llm_cache.bypass(not data.use_cache):
+                async for event in core.document.edit_stream(data.question, data.document_content,
+                                                             data.thread_id, usage, data.edit_mode):
+                    if event["type"] == "token":
+                        yield sse_event("token", {"text": event["text"]})
+                    else:
+                        response = event["revision"]
+
+            # Outputs are written only once the revision is complete
+            output_paths = await asyncio.to_thread(save_updated_outputs, response)
+            usage.finish()
+            metrics_registry.record("chat", usage.report())
+            yield sse_event("done", {
+                "answer": response,
+                "uuid": str(uuid.uuid4()),
+                "thread_id": data.thread_id,
+                "usage": usage.report(),
+                **output_paths
+            })
+
+        except Exception as e:
+            logger.error(f"Streaming chat failed: {e}", exc_info=True)
+            yield sse_event("error", {"detail": f"Chat failed: {e}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/feedback/")
 async def save_feedback(feedback: FeedbackPayload):
     """
@@ -313,6 +511,7 @@ async def save_feedback(feedback: FeedbackPayload):
 
 @router.post("/targeted-edit/")
 async def targeted_edit_document(
+    request: Request,
     example_file: UploadFile = File(...),
     reference_files: List[UploadFile] = File(...),
     section_changes: str = Form(...),
@@ -320,7 +519,10 @@ async def targeted_edit_document(
     top_k: Optional[int] = Form(None),
     chunk_size: Optional[int] = Form(None),
     overlap: Optional[int] = Form(None),
-    rag_preset: Optional[str] = Form(None)
+    rag_preset: Optional[str] = Form(None),
+    use_cache: bool = Form(True),
+    deadline_seconds: Optional[float] = Form(None),
+    partial_results: bool = Form(False)
 ):
     """
     Edit specific sections of an example document using targeted editing.    
@@ -333,7 +535,12 @@ async def targeted_edit_document(
                     "section_name": "Section name to modify",
                     "user_direction": "How to change this section"
                 }
-            ]    
+            ]
+        use_cache (bool): Answer repeated model calls from the response cache (default True)
+        deadline_seconds (Optional[float]): Seconds editing may take, counted from the end
+            of text extraction; LLM_REQUEST_DEADLINE_SECONDS if omitted, 0 for none
+        partial_results (bool): At the deadline, keep the sections edited so far and leave
+            the others unchanged instead of failing
     Returns:
         JSONResponse: Contains:
             - message (str): Success message
@@ -342,11 +549,21 @@ async def targeted_edit_document(
                 - total_sections (int): Total sections in document
                 - modified (int): Sections that were changed
                 - unchanged (int): Sections kept as-is
-    
+                - pending (int): Requested changes not made before the deadline
+            - pending_sections (list): Names of those sections
+            - usage (dict): Token and latency accounting per node and section
+
+    Raises:
+        HTTPException: 400 for invalid section changes or deadline, 499 if the client disconnected
+            (editing is cancelled), 504 if the deadline passed without partial_results,
+            500 for any other error.
     """
     import traceback
     from datetime import datetime
 
+    if deadline_seconds is not None and deadline_seconds < 0:
+        raise HTTPException(status_code=400, detail="deadline_seconds must not be negative")
+
     try:
         logger.info("Starting targeted editing workflow")
 
@@ -374,17 +591,19 @@ async def targeted_edit_document(
             logger.info(f"Using custom RAG parameters: {rag_params.model_dump()}")
 
         # Save and extract example file (preserve structure for heading detection)
-        example_path = save_uploaded_file(example_file)
-        example_text = extract_and_clean_text(example_path, preserve_structure=True)
+        example_path = await asyncio.to_thread(save_uploaded_file, example_file)
+        example_text = await asyncio.to_thread(extract_and_clean_text, example_path, preserve_structure=True)
         logger.info(f"Loaded example document: {example_file.filename} ({len(example_text)} chars)")
         
         # Save and extract reference files (preserve structure)
         reference_texts = {}
         reference_paths = []  # Track paths for cleanup
         for ref_file in reference_files:
-            ref_path = save_uploaded_file(ref_file)
+            ref_path = await asyncio.to_thread(save_uploaded_file, ref_file)
             reference_paths.append(ref_path)
-            reference_texts[ref_file.filename] = extract_and_clean_text(ref_path, preserve_structure=True)
+            reference_texts[ref_file.filename] = await asyncio.to_thread(
+                extract_and_clean_text, ref_path, preserve_structure=True
+            )
             logger.info(f"Loaded reference document: {ref_file.filename}")
         
         # Parse section changes
@@ -409,13 +628,20 @@ async def targeted_edit_document(
         
         # Run targeted editing workflow
         logger.info("Executing targeted editing pipeline...")
-        result = await core.document.targeted_edit(
-            example_document_text=example_text,
-            reference_texts=reference_texts,
-            section_changes=changes,
-            output_filename=output_filename,
-            rag_params=rag_params
-        )
+        usage = UsageAccountant()
+        with core.llm_cache.bypass(not use_cache):
+            result = await cancel_on_disconnect(request, core.document.targeted_edit(
+                example_document_text=example_text,
+                reference_texts=reference_texts,
+                section_changes=changes,
+                output_filename=output_filename,
+                rag_params=rag_params,
+                usage=usage,
+                deadline_seconds=deadline_seconds,
+                partial=partial_results
+            ))
+        usage.finish()
+        metrics_registry.record("targeted_edit", usage.report())
         
         # Cleanup temp files
         try:
@@ -435,14 +661,78 @@ async def targeted_edit_document(
             "stats": result["stats"],
             "sections_modified": result["stats"]["modified"],
             "sections_unchanged": result["stats"]["unchanged"],
-            "total_sections": result["stats"]["total_sections"]
+            "total_sections": result["stats"]["total_sections"],
+            "pending_sections": result.get("pending_sections", []),
+            "usage": usage.report()
         })
         
+    except HTTPException:
+        raise
     except json.JSONDecodeError as e:
         logger.error(f"Invalid JSON in section_changes: {e}")
         raise HTTPException(status_code=400, detail=f"Invalid JSON format in section_changes: {str(e)}")
+
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"Targeted editing not finished: {e}")
         
     except Exception as e:
         logger.error(f"Targeted editing failed: {e}", exc_info=True)
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Targeted editing failed: {str(e)}")
+
+
+@router.get("/llm-stats/")
+async def llm_stats():
+    """
+    Reports the state of the shared model scheduler and response cache.
+
+    Returns:
+        dict: Contains:
+            - "scheduler" (dict): In-flight and queued calls, admissions, configured limits and
+              token usage, including prompt tokens served from the provider's prompt cache
+            - "cache" (dict): Hits, misses, bypasses, hit rate, evictions and size on disk
+            - "sections" (dict): Adaptive section concurrency limit, sections in flight and
+              queued, requests sharing them and how often the limit was raised or cut
+            - "section_cache" (dict): Reused section drafts, misses, hit rate and size on disk
+    """
+    # The caches read their size from SQLite, in worker threads off the event loop
+    return {
+        "scheduler": core.llm.scheduler.stats(),
+        "cache": await asyncio.to_thread(core.llm.cache.stats),
+        "sections": core.llm.section_limiter.stats(),
+        "section_cache": await asyncio.to_thread(core.llm.section_cache.stats)
+    }
+
+
+@router.get("/metrics/")
+async def metrics():
+    """
+    Reports model usage aggregated over the requests served by this process.
+
+    Returns:
+        dict: Contains:
+            - "requests" (dict): Number of accounted requests per endpoint
+            - "totals" (dict): Tokens, estimated cost, calls, cache hits, retries, errors and
+              time per endpoint
+            - "nodes" (dict): The same per endpoint and graph node
+            - "models" (dict): The same per model
+            - "recent" (list): Full usage reports of the most recent requests, including sections
+            - "routing" (dict): Model each agent role is routed to
+            - "scheduler" (dict): Current model scheduler state
+            - "cache" (dict): Response cache statistics
+            - "sections" (dict): Section concurrency limiter state
+            - "section_cache" (dict): Section draft cache statistics
+            - "checkpoints" (dict): Report threads kept for revisions, their serialized size,
+              the configured limits and how many threads expired or were evicted
+    """
+    # Cache and checkpoint statistics come from SQLite, and the checkpoint store evicts
+    # expired threads first, in worker threads off the event loop
+    return {
+        **metrics_registry.snapshot(),
+        "routing": {role: core.llm.routing.model_for(role) for role in MODEL_ROLES},
+        "scheduler": core.llm.scheduler.stats(),
+        "cache": await asyncio.to_thread(core.llm.cache.stats),
+        "sections": core.llm.section_limiter.stats(),
+        "section_cache": await asyncio.to_thread(core.llm.section_cache.stats),
+        "checkpoints": await asyncio.to_thread(checkpointer.stats)
+    }
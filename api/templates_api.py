@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, Body, Query
 from pathlib import Path
 import json, os, re
 from jsonschema import validate, ValidationError
+from core.section_dependencies import SectionDependencyError, dependency_waves, template_nodes
 
 
 
@@ -16,6 +17,13 @@ with open(SCHEMA_PATH, "r", encoding="utf-8") as f:
 
 SAFE = re.compile(r"^[A-Za-z0-9._-]+$")
 
+def validate_template(body: dict):
+    try:
+        validate(body, TEMPLATE_SCHEMA)
+        dependency_waves(template_nodes(body))
+    except ValidationError as e: raise HTTPException(400, f"Schema error: {e.message}")
+    except SectionDependencyError as e: raise HTTPException(400, f"Dependency error: {e}")
+
 def safe_name(name: str) -> str:
     if not SAFE.fullmatch(name):
         raise HTTPException(400, "Invalid template name")
@@ -34,8 +42,7 @@ def get_template(name: str):
 @router.post("/api/templates")
 def create_template(name: str = Query(...), body: dict = Body(...)):
     fname = safe_name(name)
-    try: validate(body, TEMPLATE_SCHEMA)
-    except ValidationError as e: raise HTTPException(400, f"Schema error: {e.message}")
+    validate_template(body)
     tmp = TEMPLATES_DIR / (fname + ".tmp")
     out = TEMPLATES_DIR / fname
     tmp.write_text(json.dumps(body, indent=2), encoding="utf-8")
@@ -46,8 +53,7 @@ def create_template(name: str = Query(...), body: dict = Body(...)):
 def update_template(name: str, body: dict = Body(...)):
     p = TEMPLATES_DIR / safe_name(name)
     if not p.exists(): raise HTTPException(404, "Not found")
-    try: validate(body, TEMPLATE_SCHEMA)
-    except ValidationError as e: raise HTTPException(400, f"Schema error: {e.message}")
+    validate_template(body)
     tmp = Path(str(p) + ".tmp")
     tmp.write_text(json.dumps(body, indent=2), encoding="utf-8")
     os.replace(tmp, p)
@@ -0,0 +1,274 @@
+"""
+Report Pipeline Benchmark
+
+Runs the full LangGraph report pipeline (`core.document.generate`) for a template and
+reports end-to-end latency and model usage. Meant to run against the offline stand-in
+model, so no network access or API spend is needed:
+
+    LLM_BACKEND=fake python -m benchmarks.pipeline_benchmark --template proposal_template.json
+
+The latency profile of the stand-in is set with LLM_FAKE_FIRST_TOKEN_SECONDS and
+LLM_FAKE_TOKENS_PER_SECOND (see `FakeLlmConfig`). Besides the end-to-end latency, the
+time until the first section is drafted is reported; sections start as soon as their
+own sources are loaded, so it does not grow with the largest source.
+
+Model usage is accounted per graph node and per model, with the estimated cost of
+`core.metrics.MODEL_PRICES`. To compare model routings, save one run and compare
+another against it:
+
+    LLM_MODEL_QUERY= LLM_MODEL_EXTRACTOR= python -m benchmarks.pipeline_benchmark --json single_model.json
+    python -m benchmarks.pipeline_benchmark --compare single_model.json
+
+The time to build and compile each graph is reported too. The graphs are compiled once
+per process; before, every section of every request compiled a section graph and two
+ReAct agents (query and drafting).
+
+With `--edit` every generated report is also revised once per edit mode, to compare
+scoped (paragraph patch) revisions against full-document regeneration:
+
+    python -m benchmarks.pipeline_benchmark --edit "Fix the date in the scope of work"
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import time
+from typing import Optional
+import core.document
+from core.checkpoint import new_thread_id
+from core.document_patch import numbered
+from core.document_patch import split_paragraphs
+import core.llm
+import core.llm_cache
+from core.config.llm_config import MODEL_ROLES
+from core.metrics import UsageAccountant
+from core.metrics import add_usage
+from core.metrics import empty_usage
+from benchmarks.rag_benchmark import percentile, resolve_sources, walk_template_sections
+from langgraph.prebuilt import create_react_agent
+from core.agents.drafting import walk_sections
+from core.agents.editor import EDIT_MODES
+from core.agents.graph import get_graph
+from core.agents.retrieval import retriever_tool
+from core.agents.section import DRAFTING_MODES
+from core.agents.section import create_section_graph
+from core.agents.section_editor import create_section_editing_graph
+from core.agents.targeted_editing_graph import get_targeted_editing_graph
+from core.workflows.document_extraction import extract_and_clean_text, load_report_structure
+
+
+logger = logging.getLogger(__name__)
+
+
+async def run_pipeline(
+        template: str,
+        source_texts: dict[str, str],
+        example_text: Optional[str],
+        runs: int,
+        drafting_mode: str = "agent"
+) -> tuple[list[float], list[dict], dict[str, str]]:
+    """
+    Generates the report `runs` times in a row.
+
+    Returns:
+        tuple: Wall-clock seconds and the `UsageAccountant` report of each run, and the
+            text of each generated report by its thread id.
+    """
+    latencies = []
+    reports = []
+    documents = {}
+    for i in range(runs):
+        sections = load_report_structure(os.path.join("templates", template))
+        usage = UsageAccountant()
+        thread_id = new_thread_id("benchmark")
+        start = time.perf_counter()
+        report_sections = await core.document.generate(sections, source_texts, example_document_text=example_text,
+                                                       usage=usage, drafting_mode=drafting_mode, thread_id=thread_id)
+        latencies.append(time.perf_counter() - start)
+        usage.finish()
+        reports.append(usage.report())
+        documents[thread_id] = "\n\n".join(f"{s.title}\n\n{s.content}".strip() for s in walk_sections(report_sections))
+        logger.info("Run %d finished in %.2fs", i + 1, latencies[-1])
+    return latencies, reports, documents
+
+
+async def run_edits(documents: dict[str, str], question: str) -> dict[str, dict]:
+    """
+    Revises every generated report once in each edit mode.
+
+    Returns:
+        dict: Per edit mode the mean seconds and completion tokens of a revision and the
+            share of paragraphs that came back byte-identical.
+    """
+    results = {}
+    for mode in EDIT_MODES:
+        latencies, completion_tokens, kept, total = [], [], 0, 0
+        for thread_id, document in documents.items():
+            usage = UsageAccountant()
+            start = time.perf_counter()
+            revision = await core.document.edit(question, document, thread_id, usage=usage, edit_mode=mode)
+            latencies.append(time.perf_counter() - start)
+            usage.finish()
+            completion_tokens.append(usage.report()["total"]["completion_tokens"])
+            original, revised = split_paragraphs(document), split_paragraphs(revision)
+            before = [original[i][0] for i in numbered(original)]
+            after = {revised[i][0] for i in numbered(revised)}
+            kept += sum(1 for p in before if p in after)
+            total += len(before)
+        results[mode] = {
+            "mean_seconds": round(statistics.mean(latencies), 3),
+            "completion_tokens": round(statistics.mean(completion_tokens), 1),
+            "identical_paragraphs": round(kept / total, 4) if total else 1.0,
+        }
+    return results
+
+
+async def run_benchmark(
+        template: str,
+        source_texts: dict[str, str],
+        example_text: Optional[str],
+        runs: int,
+        drafting_mode: str,
+        edit: Optional[str]
+) -> tuple[list[float], list[dict], dict[str, str], Optional[dict[str, dict]]]:
+    """Runs the pipeline and, with `edit`, the revisions on one event loop."""
+    latencies, reports, documents = await run_pipeline(template, source_texts, example_text, runs, drafting_mode)
+    edits = await run_edits(documents, edit) if edit else None
+    return latencies, reports, documents, edits
+
+
+def measure_graph_builds(repeats: int = 20) -> dict[str, float]:
+    """Mean milliseconds to build and compile each graph."""
+    builders = {
+        "document": get_graph,
+        "section": create_section_graph,
+        "section_editing": create_section_editing_graph,
+        "targeted_editing": get_targeted_editing_graph,
+        "react_agent": lambda: create_react_agent(core.llm.get_model("query"), tools=[retriever_tool]),
+    }
+    timings = {}
+    for name, build in builders.items():
+        start = time.perf_counter()
+        for _ in range(repeats):
+            build()
+        timings[name] = round((time.perf_counter() - start) * 1000 / repeats, 3)
+    return timings
+
+
+def mean_usage(reports: list[dict], group: str) -> dict[str, dict]:
+    """Per-run mean of the usage of each node or model."""
+    totals: dict[str, dict] = {}
+    for report in reports:
+        for name, usage in report[group].items():
+            add_usage(totals.setdefault(name, empty_usage()), usage)
+    return {
+        name: {k: round(v / len(reports), 6) for k, v in usage.items()}
+        for name, usage in totals.items()
+    }
+
+
+def print_comparison(results: dict, baseline: dict):
+    """Prints latency and cost per run and per node against a saved baseline result."""
+    print(f"\nCompared to {baseline.get('routing')}:")
+    for key in ("mean_seconds", "p95_seconds", "mean_first_section_seconds", "cost_usd_per_run",
+                "prompt_tokens_per_run"):
+        before, after = baseline.get(key), results[key]
+        if before and after is not None:
+            print(f"{key:>28}: {before} -> {after} ({(after - before) / before:+.1%})")
+    for node, usage in results["nodes"].items():
+        before = baseline.get("nodes", {}).get(node)
+        if before:
+            print(f"{node:>28}: llm {before['llm_seconds']:.2f}s -> {usage['llm_seconds']:.2f}s,"
+                  f" ${before['cost_usd']:.4f} -> ${usage['cost_usd']:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the report generation pipeline")
+    parser.add_argument("--template", default="proposal_template.json",
+                        help="Template file name in templates/")
+    parser.add_argument("--sources-dir", nargs="+", default=["samples", "."],
+                        help="Directories searched for the template's source documents")
+    parser.add_argument("--example", help="Example document for style extraction")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--drafting-mode", choices=DRAFTING_MODES, default="agent",
+                        help="Section drafting with query agents or fast direct retrieval")
+    parser.add_argument("--use-cache", action="store_true",
+                        help="Allow the response cache; by default every run calls the model")
+    parser.add_argument("--edit", metavar="QUESTION",
+                        help="Also revise each report with this question in every edit mode")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    parser.add_argument("--compare", help="Results JSON of an earlier run to compare latency and cost against")
+    args = parser.parse_args()
+
+    sections = load_report_structure(os.path.join("templates", args.template))
+    source_names = [s.get("source", "") for s in walk_template_sections(sections)]
+    source_paths = resolve_sources(source_names, args.sources_dir)
+    if not source_paths:
+        raise SystemExit(f"None of the sources referenced by {args.template} were found")
+    source_texts = {name: extract_and_clean_text(path) for name, path in source_paths.items()}
+    example_text = extract_and_clean_text(args.example) if args.example else None
+
+    print(f"Model backend: {core.llm.model.inner._llm_type}")
+    with core.llm_cache.bypass(not args.use_cache):
+        latencies, reports, documents, edits = asyncio.run(
+            run_benchmark(args.template, source_texts, example_text, args.runs, args.drafting_mode, args.edit)
+        )
+
+    stats = core.llm.scheduler.stats()
+    first_sections = [r["first_section_seconds"] for r in reports if r["first_section_seconds"] is not None]
+    results = {
+        "template": args.template,
+        "drafting_mode": args.drafting_mode,
+        "runs": args.runs,
+        "mean_seconds": round(statistics.mean(latencies), 3),
+        "p95_seconds": round(percentile(latencies, 95), 3),
+        "mean_first_section_seconds": round(statistics.mean(first_sections), 3) if first_sections else None,
+        "model_calls_per_run": round(stats["admitted"] / args.runs, 1),
+        "prompt_tokens_per_run": stats["prompt_tokens"] // args.runs,
+        "completion_tokens_per_run": stats["completion_tokens"] // args.runs,
+        "mean_scheduler_wait_seconds": stats["mean_wait_seconds"],
+        "cost_usd_per_run": round(sum(r["total"]["cost_usd"] for r in reports) / args.runs, 6),
+    }
+    for key, value in results.items():
+        print(f"{key:>28}: {value}")
+
+    section_count = sum(1 for s in walk_template_sections(sections) if s.get("instructions"))
+    results["graph_build_ms"] = measure_graph_builds()
+    print(f"\nGraph build and compile, ms: {results['graph_build_ms']}")
+    builds = results["graph_build_ms"]
+    print(f"Saved per request by compiling once: "
+          f"{(builds['section'] + 2 * builds['react_agent']) * section_count:.1f} ms"
+          f" ({section_count} sections)")
+
+    results["routing"] = {role: core.llm.routing.model_for(role) for role in MODEL_ROLES}
+    results["nodes"] = mean_usage(reports, "nodes")
+    results["models"] = mean_usage(reports, "models")
+    print("\nPer node and model, mean of the runs:")
+    for name, usage in {**results["nodes"], **results["models"]}.items():
+        print(f"{name:>28}: {usage['calls']:g} calls, {usage['prompt_tokens']:g}+{usage['completion_tokens']:g}"
+              f" tokens, llm {usage['llm_seconds']:.2f}s, ${usage['cost_usd']:.4f}")
+
+    if edits:
+        results["edits"] = edits
+        print(f"\nRevision {args.edit!r}, mean of the runs:")
+        for mode, edit in edits.items():
+            print(f"{mode:>28}: {edit['mean_seconds']:.3f}s, {edit['completion_tokens']:g} completion tokens,"
+                  f" {edit['identical_paragraphs']:.0%} of paragraphs unchanged")
+        full, scoped = edits["full"]["mean_seconds"], edits["scoped"]["mean_seconds"]
+        if full:
+            print(f"{'scoped vs full':>28}: {(scoped - full) / full:+.1%} latency")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(results, json.load(f))
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
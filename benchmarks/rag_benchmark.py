@@ -0,0 +1,293 @@
+"""
+RAG Parameter Benchmark
+
+Sweeps chunk_size, overlap, top_k and similarity_threshold for a report template
+against its reference documents, and reports for every parameter set:
+
+- ingest time (splitting and embedding all sources into the vector store)
+- retrieval latency per section query
+- tokens that retrieval would hand to the drafting step
+- a retrieval-recall proxy (see `recall_proxy`)
+
+The best trade-off can be written out as the template's recommended preset, which
+`RagPreset.for_template()` and the "recommended" preset of `/documents/process/` pick up.
+
+Usage:
+    python -m benchmarks.rag_benchmark --template proposal_template.json --emit
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import re
+import statistics
+import time
+from datetime import datetime
+from typing import Any, Iterable, Optional
+from pydantic import BaseModel
+import core.store
+from core.config.rag_config import RagParameters, RECOMMENDED_PRESETS_DIR
+from core.utils.text_utils import count_tokens
+from core.workflows.document_extraction import extract_and_clean_text, load_report_structure
+
+
+logger = logging.getLogger(__name__)
+
+
+STOPWORDS = {
+    "about", "above", "after", "also", "among", "and", "before", "being", "below", "between",
+    "both", "brief", "briefly", "clearly", "consisting", "does", "each", "from", "have", "into",
+    "list", "more", "most", "next", "only", "other", "over", "paragraph", "paragraphs", "point",
+    "points", "provide", "section", "should", "source", "specific", "such", "than", "that",
+    "their", "them", "then", "there", "these", "they", "this", "those", "through", "under",
+    "using", "what", "when", "where", "which", "while", "will", "with", "within", "words",
+}
+
+
+class SectionQuery(BaseModel):
+    title: str
+    source: str
+    query: str
+
+
+class RagBenchmarkResult(BaseModel):
+    """
+    Measurements for one parameter set.
+
+    Attributes:
+        parameters (RagParameters): The swept parameter set.
+        ingest_seconds (float): Time to split and embed all sources.
+        mean_retrieval_ms (float): Mean retrieval latency per section query.
+        p95_retrieval_ms (float): 95th percentile retrieval latency.
+        drafting_tokens (int): Tokens of retrieved context across all sections.
+        recall_proxy (float): Mean retrieval-recall proxy across sections (0.0-1.0).
+    """
+    parameters: RagParameters
+    ingest_seconds: float
+    mean_retrieval_ms: float
+    p95_retrieval_ms: float
+    drafting_tokens: int
+    recall_proxy: float
+
+
+def walk_template_sections(sections: dict[str, Any]) -> Iterable[dict[str, Any]]:
+    for section in sections.values():
+        yield section
+        yield from walk_template_sections(section.get("subsections", {}))
+
+
+def section_queries(sections: dict[str, Any]) -> list[SectionQuery]:
+    """Builds the title-plus-objective query each drafted section retrieves with."""
+    return [
+        SectionQuery(
+            title=s["title"],
+            source=s.get("source", ""),
+            query=f"{s['title']}: {s['instructions'].get('objective', '')}"
+        )
+        for s in walk_template_sections(sections)
+        if s.get("instructions")
+    ]
+
+
+def resolve_sources(file_names: Iterable[str], search_dirs: list[str]) -> dict[str, str]:
+    """
+    Finds the reference documents a template names in its `source` fields.
+
+    Args:
+        file_names: Source file names referenced by the template.
+        search_dirs: Directories searched recursively, in order.
+
+    Returns:
+        dict[str, str]: Mapping of source file name to path on disk.
+    """
+    resolved = {}
+    for name in sorted(set(filter(None, file_names))):
+        for directory in search_dirs:
+            candidates = [os.path.join(root, name)
+                          for root, _, files in os.walk(directory) if name in files]
+            if candidates:
+                resolved[name] = sorted(candidates)[0]
+                break
+        else:
+            logger.warning("Source %s not found in %s", name, search_dirs)
+    return resolved
+
+
+def key_terms(text: str) -> set[str]:
+    return {w for w in re.findall(r"[a-z][a-z\-]{3,}", text.lower()) if w not in STOPWORDS}
+
+
+def recall_proxy(query: str, source_text: str, retrieved_text: str) -> float:
+    """
+    Retrieval-recall proxy for a section query.
+
+    There is no labelled ground truth for which chunks a section needs, so the
+    proxy measures how many of the query's key terms that occur anywhere in the
+    source also occur in the retrieved context.
+
+    Returns:
+        float: Recall proxy between 0.0 and 1.0 (1.0 when the source holds none of the terms).
+    """
+    reachable = key_terms(query) & key_terms(source_text)
+    if not reachable:
+        return 1.0
+    return len(reachable & key_terms(retrieved_text)) / len(reachable)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_sweep(
+        sections: dict[str, Any],
+        source_texts: dict[str, str],
+        chunk_sizes: list[int],
+        overlaps: list[int],
+        top_ks: list[int],
+        thresholds: list[float]
+) -> list[RagBenchmarkResult]:
+    """
+    Runs the parameter sweep. Sources are ingested once per (chunk_size, overlap)
+    pair and every (top_k, similarity_threshold) pair is measured against it.
+
+    Returns:
+        list[RagBenchmarkResult]: One result per parameter set.
+    """
+    queries = [q for q in section_queries(sections) if q.source in source_texts]
+    results = []
+
+    for chunk_size, overlap in itertools.product(chunk_sizes, overlaps):
+        ingest_params = RagParameters(chunk_size=chunk_size, overlap=overlap)
+        core.store.clear_store()
+        start = time.perf_counter()
+        core.store.add_sources(source_texts, rag_params=ingest_params)
+        ingest_seconds = time.perf_counter() - start
+        logger.info("Ingested chunk_size=%d overlap=%d%% in %.2fs",
+                    ingest_params.chunk_size, overlap, ingest_seconds)
+
+        for top_k, threshold in itertools.product(top_ks, thresholds):
+            params = RagParameters(
+                chunk_size=chunk_size,
+                overlap=overlap,
+                top_k=top_k,
+                similarity_threshold=threshold
+            )
+            latencies, recalls, tokens = [], [], 0
+            for q in queries:
+                retriever = core.store.as_retriever([q.source], rag_params=params)
+                start = time.perf_counter()
+                docs = retriever.invoke(q.query)
+                latencies.append((time.perf_counter() - start) * 1000)
+                retrieved_text = "\n\n".join(d.page_content for d in docs)
+                tokens += count_tokens(retrieved_text)
+                recalls.append(recall_proxy(q.query, source_texts[q.source], retrieved_text))
+
+            results.append(RagBenchmarkResult(
+                parameters=params,
+                ingest_seconds=round(ingest_seconds, 3),
+                mean_retrieval_ms=round(statistics.mean(latencies), 2) if latencies else 0.0,
+                p95_retrieval_ms=round(percentile(latencies, 95), 2) if latencies else 0.0,
+                drafting_tokens=tokens,
+                recall_proxy=round(statistics.mean(recalls), 4) if recalls else 0.0
+            ))
+
+    core.store.clear_store()
+    return results
+
+
+def recommend(
+        results: list[RagBenchmarkResult],
+        tolerance: float = 0.95
+) -> Optional[RagBenchmarkResult]:
+    """
+    Picks the cheapest parameter set whose recall proxy is within `tolerance`
+    of the best one: fewest drafting tokens, then lowest retrieval latency,
+    then shortest ingest.
+    """
+    if not results:
+        return None
+    best_recall = max(r.recall_proxy for r in results)
+    candidates = [r for r in results if r.recall_proxy >= best_recall * tolerance]
+    return min(candidates, key=lambda r: (r.drafting_tokens, r.mean_retrieval_ms, r.ingest_seconds))
+
+
+def emit_recommendation(template_name: str, result: RagBenchmarkResult) -> str:
+    """
+    Writes the recommended preset of a template to `outputs/rag_presets/<template>.json`.
+
+    Returns:
+        str: Path to the saved file
+    """
+    os.makedirs(RECOMMENDED_PRESETS_DIR, exist_ok=True)
+    name = os.path.splitext(os.path.basename(template_name))[0]
+    path = os.path.join(RECOMMENDED_PRESETS_DIR, f"{name}.json")
+    data = {
+        "template": os.path.basename(template_name),
+        "generated_at": datetime.now().isoformat(),
+        "parameters": result.parameters.model_dump(),
+        "metrics": result.model_dump(exclude={"parameters"})
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    return path
+
+
+def print_report(results: list[RagBenchmarkResult], recommended: Optional[RagBenchmarkResult]):
+    header = f"{'chunk':>6} {'ovl%':>5} {'top_k':>6} {'thresh':>7} {'ingest_s':>9} " \
+             f"{'ret_ms':>8} {'p95_ms':>8} {'tokens':>8} {'recall':>7}"
+    print(header)
+    print("-" * len(header))
+    for r in sorted(results, key=lambda r: (-r.recall_proxy, r.drafting_tokens)):
+        p = r.parameters
+        marker = "  <- recommended" if r is recommended else ""
+        print(f"{p.chunk_size:>6} {p.overlap:>5} {p.top_k:>6} {p.similarity_threshold:>7.2f} "
+              f"{r.ingest_seconds:>9.2f} {r.mean_retrieval_ms:>8.2f} {r.p95_retrieval_ms:>8.2f} "
+              f"{r.drafting_tokens:>8} {r.recall_proxy:>7.3f}{marker}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and tune RAG parameters for a template")
+    parser.add_argument("--template", default="proposal_template.json",
+                        help="Template file name in templates/")
+    parser.add_argument("--sources-dir", nargs="+", default=["samples", "."],
+                        help="Directories searched for the template's source documents")
+    parser.add_argument("--chunk-sizes", nargs="+", type=int, default=[256, 512, 1024])
+    parser.add_argument("--overlaps", nargs="+", type=int, default=[10, 15, 20])
+    parser.add_argument("--top-ks", nargs="+", type=int, default=[3, 5, 10])
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[0.5, 0.6, 0.7, 0.8])
+    parser.add_argument("--tolerance", type=float, default=0.95,
+                        help="Fraction of the best recall proxy a recommendation must reach")
+    parser.add_argument("--emit", action="store_true",
+                        help="Write the recommended preset to outputs/rag_presets/")
+    parser.add_argument("--json", dest="json_path", help="Also write all results to this JSON file")
+    args = parser.parse_args()
+
+    sections = load_report_structure(os.path.join("templates", args.template))
+    source_names = [s.get("source", "") for s in walk_template_sections(sections)]
+    source_paths = resolve_sources(source_names, args.sources_dir)
+    if not source_paths:
+        raise SystemExit(f"None of the sources referenced by {args.template} were found")
+
+    source_texts = {name: extract_and_clean_text(path) for name, path in source_paths.items()}
+    print(f"Benchmarking {args.template} against {', '.join(source_paths.values())}\n")
+
+    results = run_sweep(sections, source_texts, args.chunk_sizes, args.overlaps,
+                        args.top_ks, args.thresholds)
+    recommended = recommend(results, args.tolerance)
+    print_report(results, recommended)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump([r.model_dump() for r in results], f, indent=2)
+
+    if args.emit and recommended:
+        path = emit_recommendation(args.template, recommended)
+        print(f"\nRecommended preset saved to: {path}")
+
+
+if __name__ == "__main__":
+    main()
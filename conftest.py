@@ -0,0 +1,19 @@
+"""
+Settings shared by the tests. `core.llm` builds its models when it is first imported,
+so the offline backend is configured here, before any test module imports core.
+"""
+
+import os
+import tempfile
+
+
+# The fake backend answers without network access
+_workdir = tempfile.mkdtemp(prefix="report_tests_")
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("OPENAI_API_KEY", "fake")
+os.environ.setdefault("LLM_REQUESTS_PER_SECOND", "0")
+os.environ.setdefault("LLM_FAKE_FIRST_TOKEN_SECONDS", "0.05")
+os.environ.setdefault("LLM_FAKE_TOKENS_PER_SECOND", "0")
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+os.environ.setdefault("LLM_SECTION_CACHE_ENABLED", "false")
+os.environ.setdefault("CHECKPOINT_PATH", os.path.join(_workdir, "checkpoints.sqlite"))
@@ -3,60 +3,32 @@ import logging
 from typing import Any
 from typing import Iterable
 from typing import Optional
-from langchain_classic.tools.retriever import create_retriever_tool
-from langchain_core.prompts.chat import PromptTemplate
-from langgraph.prebuilt import create_react_agent
+from langchain_core.callbacks.manager import adispatch_custom_event
+from langgraph.config import get_config
+import core.deadline
 import core.llm
-from core.agents.section import create_section_graph
+import core.store
+from core.checkpoint import checkpointer
+from core.config.llm_config import llm_backend
+from core.metrics import SECTION_DRAFTED_EVENT
+from core.metrics import SECTION_METADATA_KEY
+from core.section_cache import fingerprint
+from core.section_cache import section_cache_key
+from core.section_dependencies import SectionNode
+from core.section_dependencies import dependency_waves
+from core.section_dependencies import resolve_dependencies
+from core.section_dependencies import template_nodes
+from core.agents.retrieval import retrieval_config
+from core.agents.section import DRAFTING_PROMPT
+from core.agents.section import QUERY_PROMPT
+from core.agents.section import section_graph
 from core.agents.state import DocumentPreparationState
-from core.agents.state import SectionState
 from core.agents.state import TemplateSectionDef
 
 
 logger = logging.getLogger(__name__)
 
 
-drafting_agent = create_react_agent(
-    core.llm.model,
-    tools=[],
-    prompt="""You are a highly skilled **Document Drafting Agent**.
-
-    Based on previously extracted insights and user instructions, your task is to generate well-structured, formal, and paragraph-style content for specific sections (e.g., Executive Summary, Why This Company, Risk Assessment, Scope of Work, etc.).
-
-    Unless told otherwise, write in **formal tone** using professional business language.
-
-    Do not include the section title or any headings unless explicitly asked. Avoid bullet points unless the prompt specifically requests them.
-
-    If the information available is insufficient to complete the draft, say so politely.
-
-    Always end your output with the word:
-    TERMINATE"""
-)
-
-
-drafting_prompt = PromptTemplate.from_template(
-    """You are assigned to draft a section of a of a report.  Follw the specified instructions strictly.  According to the provided *Objective* and *Title*, use the provided tool to query for the relevant information you need.
-
-    - Write **only** the draft content.
-    - Do **not** include commentary, explanations, or apologies.
-    - End each section with the marker: === END OF SECTION ===
-    
-    {{#style_guidance}}
-    STYLE GUIDELINES TO FOLLOW:
-    {{style_guidance}}
-    
-    {{/style_guidance}}
-
-    Title: {{title}}
-    Objective: {{instructions.objective}}
-    Tone: {{instructions.tone}}
-    Length: {{instructions.length}}
-    Format: {{instructions.format}}
-    """,
-    template_format="mustache"
-)
-
-
 def walk_sections(
         sections: dict[str, TemplateSectionDef]
 ) -> Iterable[TemplateSectionDef]:
@@ -68,48 +40,144 @@ def walk_sections(
 
 async def fetch_section_draft(
         section: TemplateSectionDef,
-        style_guidance: str
+        style_guidance: str,
+        drafting_mode: str = "agent",
+        request: str = "default",
+        upstream: str = ""
 ) -> str:
     if section.instructions:
-        graph = create_section_graph(section)
-        state = { "section": section, "style_guidance": style_guidance }
-        output = await graph.ainvoke(state)
+        state = {
+            "section": section,
+            "style_guidance": style_guidance,
+            "drafting_mode": drafting_mode,
+            "upstream": upstream
+        }
+        # Sections of all requests share one adaptive concurrency limit
+        async with core.llm.section_limiter.slot(request):
+            output = await section_graph.ainvoke(state, config={
+                "configurable": retrieval_config([section.source]),
+                "metadata": {SECTION_METADATA_KEY: section.title}
+            })
         return output["messages"][-1].content
     else:
         return ""
 
 
-async def draft_sections(state: DocumentPreparationState):
-    style_guidance = format_style_guidance(state.style_guidelines)
-    all_draft_sections = [fetch_section_draft(s, style_guidance)
-                          for s in walk_sections(state.sections)]
-    contents = await asyncio.gather(*all_draft_sections)
-    for s, c in zip(walk_sections(state.sections), contents):
-        s.content = c
+def format_upstream(sections: Iterable[TemplateSectionDef]) -> str:
+    """The drafts a dependent section is written from, each under its title."""
+    return "\n\n".join(f"## {s.title}\n{s.content}" for s in sections if s.content)
 
 
-def get_extractions(
+def section_key(
         section: TemplateSectionDef,
-        source_extractions: dict[str, dict[str, dict[str, str]]]
-) -> dict[str, str]:
-    if extractions := source_extractions.get(section.source):
-        return extractions.get(section.title) or {}
+        style_guidance: str,
+        drafting_mode: str,
+        upstream: str = ""
+) -> str:
+    """
+    Section cache key of a section drafted now, computed without retrieving anything:
+    it holds the ids of all chunks of the section's source and the retrieval parameters,
+    which determine what either drafting mode can retrieve. A section written from
+    upstream drafts retrieves nothing, the key holds those drafts instead.
+    """
+    if upstream:
+        chunk_ids = [fingerprint(upstream)]
     else:
-        return {}
+        chunk_ids = core.store.source_chunk_ids([section.source])
+    model_config = {
+        "backend": llm_backend(),
+        "drafting_mode": drafting_mode,
+        "drafting": core.llm.routing.model_for("drafting"),
+        "query": core.llm.routing.model_for("query") if drafting_mode == "agent" else None,
+        "prompts": fingerprint(QUERY_PROMPT.template + DRAFTING_PROMPT.template),
+        "rag_params": core.store.current_store().rag_params.model_dump(),
+    }
+    instructions = section.instructions.model_dump() if section.instructions else None
+    return section_cache_key(section.title, instructions, chunk_ids, style_guidance, model_config)
 
 
-def gen_prompt_source(
-        sections: dict[str, TemplateSectionDef],
-        source_extractions: dict[str, dict[str, dict[str, str]]]        
-) -> Iterable[TemplateSectionDef]:
-    for s in walk_sections(sections):
-        s.data = get_extractions(s, source_extractions)
-        yield s
+def section_nodes(sections: dict[str, TemplateSectionDef]) -> list[SectionNode]:
+    """The sections in `walk_sections` order, with their keys and dependencies."""
+    return template_nodes({k: s.model_dump() for k, s in sections.items()})
 
 
-def fill_contents(sections: dict[str, TemplateSectionDef], contents: list[str]):
-    for s, c in zip(walk_sections(sections), contents):
-        s.content = c
+async def draft_sections(state: DocumentPreparationState) -> list[str]:
+    """
+    Drafts all sections with instructions into their `content`. Sections run in
+    dependency waves (see `core.section_dependencies`): a section with `depends_on` is
+    started as soon as the sections it depends on are drafted, and written from their
+    drafts instead of its source. Any other section starts once its own source is in
+    the vector store (see `core.store.ingesting`), while larger sources are still loading.
+    Every finished section is reported to the run's callbacks as a `SECTION_DRAFTED_EVENT`.
+
+    Drafting stops at the request deadline (see `core.deadline`). With partial results
+    the sections not drafted by then are marked `pending`, otherwise the run fails.
+
+    Returns:
+        list[str]: Titles of the sections taken from the section cache, in template order.
+
+    Raises:
+        DeadlineExceeded: If the deadline passed and the request did not ask for partial results.
+    """
+    style_guidance = format_style_guidance(state.style_guidelines)
+    sections = list(walk_sections(state.sections))
+    nodes = section_nodes(state.sections)
+    upstream_of = resolve_dependencies(nodes)
+    waves = dependency_waves(nodes)
+    if len(waves) > 1:
+        logger.info(f"Drafting {len(sections)} section(s) in {len(waves)} dependency waves")
+
+    # Every finished section is saved on the thread, a resumed run only drafts the rest
+    thread_id = get_config()["configurable"].get("thread_id")
+    saved = await checkpointer.asaved_sections(thread_id) if thread_id else {}
+    if saved:
+        logger.info(f"Resuming drafting with {len(saved)} section(s) already drafted")
+
+    async def draft(i: int) -> bool:
+        reused = await draft_content(i)
+        if sections[i].instructions:
+            await adispatch_custom_event(SECTION_DRAFTED_EVENT, {"title": sections[i].title, "reused": reused})
+        return reused
+
+    async def draft_content(i: int) -> bool:
+        section = sections[i]
+        key = f"{i}:{section.title}"
+        if key in saved:
+            section.content = saved[key]
+            return False
+        if upstream_of[i]:
+            await asyncio.gather(*(tasks[j] for j in upstream_of[i]))
+        elif section.instructions:
+            await core.store.sources_ready([section.source])
+        upstream = format_upstream(sections[j] for j in upstream_of[i])
+        # Sections whose inputs did not change since an earlier report are not drafted again
+        cache_key = section_key(section, style_guidance, state.drafting_mode, upstream) if section.instructions else None
+        content = await asyncio.to_thread(core.llm.section_cache.lookup, cache_key) if cache_key else None
+        reused = content is not None
+        if not reused:
+            content = await fetch_section_draft(section, style_guidance, state.drafting_mode,
+                                                thread_id or "default", upstream)
+            if cache_key:
+                await asyncio.to_thread(core.llm.section_cache.update, cache_key, section.title, content)
+        if thread_id:
+            await checkpointer.asave_section(thread_id, key, content)
+        section.content = content
+        return reused
+
+    # Started in wave order; a dependent section waits for the tasks of its upstream sections
+    tasks: dict[int, asyncio.Task] = {}
+    for wave in waves:
+        for i in wave:
+            tasks[i] = asyncio.create_task(draft(i))
+    unfinished = await core.deadline.finish_by_deadline(tasks)
+    for i in unfinished:
+        sections[i].pending = True
+    if unfinished:
+        logger.warning(f"Deadline passed with {len(unfinished)} section(s) pending")
+    reused_sections = [sections[i].title for i in sorted(tasks) if i not in unfinished and tasks[i].result()]
+    if reused_sections:
+        logger.info(f"Reused {len(reused_sections)} cached section draft(s): {', '.join(reused_sections)}")
+    return reused_sections
 
 
 def format_style_guidance(style_guidelines: Optional[dict[str, Any]]) -> str:
@@ -142,5 +210,5 @@ def format_style_guidance(style_guidelines: Optional[dict[str, Any]]) -> str:
 
 
 async def drafting_node(state: DocumentPreparationState):
-    await draft_sections(state)
-    return { "sections": state.sections}
+    reused_sections = await draft_sections(state)
+    return { "sections": state.sections, "reused_sections": reused_sections }
@@ -1,13 +1,28 @@
+import logging
 from langchain_core.prompts.chat import PromptTemplate
 from langgraph.types import interrupt
 from langgraph.prebuilt import create_react_agent
 import core.llm
+from core.document_patch import DocumentPatch
+from core.document_patch import PatchError
+from core.document_patch import apply_patch
+from core.document_patch import number_paragraphs
+from core.structured_output import StructuredOutputError
+from core.structured_output import ainvoke_structured
+from core.structured_output import to_messages
 from core.agents.state import DocumentPreparationState
 from core.agents.state import TemplateSectionDef
 
 
+logger = logging.getLogger(__name__)
+
+
+# "scoped" returns a patch of the paragraphs that change, "full" the whole revised document
+EDIT_MODES = ("scoped", "full")
+
+
 editor_agent = create_react_agent(
-    core.llm.model,
+    core.llm.get_model("editor"),
     tools=[],
     prompt="""You are a highly capable document revision assistant. Your role is to apply user-specified corrections to an existing document or report.
 
@@ -41,17 +56,62 @@ editor_prompt = PromptTemplate.from_template(
 )
 
 
-def human_revision_node(state: DocumentPreparationState):
+scoped_editor_prompt = PromptTemplate.from_template(
+    """You are a document revision assistant. Your task is to apply the user's request to the document below by editing only the paragraphs it concerns.
+
+    Instructions:
+    - The document is split into numbered paragraphs, e.g. [3].
+    - Reply with a JSON object {{"edits": [...]}} that lists only the paragraphs that change. Each edit is one of:
+      {{"paragraph": <number>, "action": "replace", "text": "<the complete new paragraph>"}}
+      {{"paragraph": <number>, "action": "insert_after", "text": "<a new paragraph>"}} (paragraph 0 inserts at the start)
+      {{"paragraph": <number>, "action": "delete"}}
+    - Do not include the paragraph numbers in the text. Keep each paragraph's formatting, such as headings and list markers.
+    - Leave all other paragraphs out of the reply; they are kept exactly as they are.
+    - Reply {{"edits": []}} if nothing needs to change.
+
+    --- DOCUMENT START ---
+    {document}
+    --- DOCUMENT END ---
+
+    User's question:
+    {question}"""
+)
+
+
+async def human_revision_node(state: DocumentPreparationState):
     revision_request = interrupt({"text_to_revise": state.revision})
     return revision_request
 
 
-def editor_node(state: DocumentPreparationState):
-    prompt = editor_prompt.format(
-        document=state.revision,
-        question=state.revision_question
-    )
-    responses = editor_agent.invoke({"messages": [("user", prompt)]})
-    revision = responses["messages"][-1].text()
+async def full_edit(document: str, question: str) -> str:
+    """Has the editor rewrite the whole document."""
+    prompt = editor_prompt.format(document=document, question=question)
+    responses = await editor_agent.ainvoke({"messages": [("user", prompt)]})
+    return responses["messages"][-1].text().split("TERMINATE")[0].strip()
+
+
+async def scoped_edit(document: str, question: str) -> tuple[str, list[int]]:
+    """
+    Has the editor reply with a patch of the paragraphs the request concerns and applies it.
+
+    Returns:
+        tuple: The revised document and the numbers of the paragraphs that were edited.
+
+    Raises:
+        StructuredOutputError: If the editor's reply is not a valid patch.
+        PatchError: If the patch does not fit the document.
+    """
+    prompt = scoped_editor_prompt.format(document=number_paragraphs(document), question=question)
+    patch = await ainvoke_structured(core.llm.get_model("editor"), to_messages(prompt), DocumentPatch)
+    return apply_patch(document, patch)
+
 
-    return { "revision": revision }
+async def editor_node(state: DocumentPreparationState):
+    if state.edit_mode == "scoped":
+        try:
+            revision, edited = await scoped_edit(state.revision, state.revision_question)
+            logger.info(f"Scoped revision edited paragraph(s) {edited}")
+            return { "revision": revision }
+        except (StructuredOutputError, PatchError) as e:
+            logger.warning(f"Scoped revision failed, revising the whole document: {e}")
+    return { "revision": await full_edit(state.revision, state.revision_question) }
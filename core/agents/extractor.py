@@ -1,17 +1,32 @@
-import json
+import asyncio
 import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from typing import Any
 from typing import Iterable
+from typing import Optional
 from langchain_core.prompts import PromptTemplate
-from langgraph.prebuilt import create_react_agent
+from langgraph.config import get_config
+from pydantic import RootModel
+import core.deadline
 import core.llm
+import core.store
 from core.agents.state import DocumentPreparationState
 from core.agents.state import TemplateSectionDef
+from core.config.llm_config import ExtractionConfig
+from core.structured_output import ainvoke_structured
+from core.structured_output import to_messages
+from core.utils.text_utils import split_token_windows
 
 
 logger = logging.getLogger(__name__)
 
 
+extraction_config = ExtractionConfig.from_env()
+
+
+# The document comes before the section titles so that calls over the same source
+# share a prompt prefix the provider can cache.
 extractor_prompt = PromptTemplate.from_template(
     """You are a skilled **Document Extractor Agent**.
 
@@ -33,25 +48,30 @@ extractor_prompt = PromptTemplate.from_template(
        }
     4. Always include `"Company Name"` in every section.
     5. Only include facts from the document (no outside knowledge).
-    6. End your message with **TERMINATE**.
+    6. Reply with the JSON object only.
+
+    --- START DOCUMENT ---
+    {{source_text}}
+    --- END DOCUMENT ---
+    {{#part}}
+
+    The document above is part {{part}} of a longer document. Extract only facts stated in this part and return an empty object for sections it has nothing on.
+    {{/part}}
 
     Section Titles:
     {{#titles}}
       {{.}}
     {{/titles}}
-
-    --- START DOCUMENT ---
-    {{source_text}}
-    --- END DOCUMENT ---
     """,
     template_format="mustache"
 )
 
 
-extractor_agent = create_react_agent(
-    core.llm.model,
-    tools=[],
-    prompt="""You are a skilled **Document Extractor Agent**.
+class SourceExtraction(RootModel[dict[str, dict[str, Any]]]):
+    """Facts extracted from one source document, keyed by section title."""
+
+
+EXTRACTOR_SYSTEM_PROMPT = """You are a skilled **Document Extractor Agent**.
 
     Your task is to analyze the full document content and extract **structured, factual information** organized by predefined section titles.
 
@@ -70,8 +90,7 @@ extractor_agent = create_react_agent(
     - If a section has no relevant information, return an empty object for that section.
     - Do NOT summarize or interpret — only extract direct facts and values.
 
-    End your response with the word: TERMINATE"""
-)
+    Respond with a single JSON object."""
 
 
 def collect_titles_with_same_source(
@@ -87,27 +106,181 @@ def collect_titles_with_same_source(
         )
     
     
-def extract_key_data(
-        sections: dict[str, TemplateSectionDef],
-        source_file_name: str,
-        source_text: str
+def merge_extractions(
+        titles: list[str],
+        window_extractions: list[dict[str, dict[str, Any]]]
+) -> dict[str, dict[str, Any]]:
+    """
+    Merges the per-window extractions of one source, in window order.
+
+    A fact found in a single window, or with the same value in every window, is kept as
+    is. Differing values found for the same fact in several windows are collected into a
+    list in window order, with duplicates dropped and each value keeping its type. The
+    company name is taken from the first window that has one. The result does not
+    depend on the order in which the windows finished.
+    """
+    merged: dict[str, dict[str, Any]] = {title: {} for title in titles}
+    found: dict[tuple[str, str], list[Any]] = {}
+    for extraction in window_extractions:
+        for title, facts in extraction.items():
+            section = merged.setdefault(title, {})
+            for key, value in facts.items():
+                if value in (None, "", [], {}):
+                    continue
+                values = found.setdefault((title, key), [])
+                if not values:
+                    section[key] = value
+                elif key == "Company Name" or value in values:
+                    continue
+                values.append(value)
+                if len(values) > 1:
+                    section[key] = list(values)
+    return merged
+
+
+async def extract_window(
+        titles: list[str],
+        window: str,
+        part: str,
+        limit: asyncio.Semaphore
 ) -> dict[str, dict[str, Any]]:
-    titles = collect_titles_with_same_source(sections, source_file_name)
     message = extractor_prompt.format(
         titles=titles,
-        source_text=source_text
+        source_text=window,
+        part=part
     )
     logger.debug("Extractor message: %s", message)
-    response = extractor_agent.invoke({"messages": [("user", message)]})
-    logger.debug("Extractor response: %s", response)
-    extractions = response["messages"][-1].text()
-    return json.loads(extractions.split("TERMINATE")[0])
+    async with limit:
+        extraction = await ainvoke_structured(
+            core.llm.get_model("extractor"),
+            to_messages(message, EXTRACTOR_SYSTEM_PROMPT),
+            SourceExtraction
+        )
+    logger.debug("Extractor response: %s", extraction)
+    return extraction.root
 
 
-def extractor_node(
-        state: DocumentPreparationState
+async def extract_key_data(
+        sections: dict[str, TemplateSectionDef],
+        source_file_name: str,
+        source_text: str,
+        limit: Optional[asyncio.Semaphore] = None
 ) -> dict[str, dict[str, Any]]:
-    extractions = { source: extract_key_data(state.sections, source, text)
-                    for source, text in state.source_texts.items() }
+    """
+    Extracts the facts of every section that uses the source.
+
+    Sources longer than `extraction_config.window_tokens` are extracted map-reduce style:
+    split into overlapping windows, extracted concurrently and merged with
+    `merge_extractions`. The windows in flight are bounded by `limit`, which the sources
+    of one report share, see `extract_sources`; by `max_concurrency` if not given.
+    """
+    titles = list(collect_titles_with_same_source(sections, source_file_name))
+    windows = split_token_windows(
+        source_text,
+        extraction_config.window_tokens,
+        extraction_config.overlap_tokens
+    )
+    if len(windows) > 1:
+        logger.info("Extracting %s in %d windows", source_file_name, len(windows))
+    limit = limit or asyncio.Semaphore(extraction_config.max_concurrency)
+    window_extractions = await asyncio.gather(*(
+        extract_window(titles, window, f"{i + 1} of {len(windows)}" if len(windows) > 1 else "", limit)
+        for i, window in enumerate(windows)
+    ))
+    # Every section gets an entry, even if the model left it out
+    return merge_extractions(titles, window_extractions)
+
+
+async def load_source_texts(state: DocumentPreparationState) -> dict[str, str]:
+    """
+    The texts of the sources: those in the state and those `core.store.ingesting` loads
+    for the request, e.g. from uploaded files, once they are loaded.
+    """
+    return {**await core.store.source_texts(), **state.source_texts}
+
+
+async def extract_sources(state: DocumentPreparationState) -> dict[str, dict[str, Any]]:
+    """
+    Extracts the facts of all sources concurrently once their texts are loaded. At most
+    `max_concurrency` windows of the report's sources are extracted at a time, and the
+    calls share the limits of the model scheduler; sources that no section uses are
+    skipped.
+    """
+    source_texts = await load_source_texts(state)
+    sources = {
+        source: text for source, text in source_texts.items()
+        if any(True for _ in collect_titles_with_same_source(state.sections, source))
+    }
+    if skipped := source_texts.keys() - sources.keys():
+        logger.info("Skipping extraction of unreferenced sources: %s", sorted(skipped))
+    limit = asyncio.Semaphore(extraction_config.max_concurrency)
+    results = await asyncio.gather(*(
+        extract_key_data(state.sections, source, text, limit) for source, text in sources.items()
+    ))
+    extractions = dict(zip(sources, results))
     logger.debug("Extraction key data: %s", extractions)
-    return { "source_extractions": extractions }
+    return extractions
+
+
+# Fact extractions running in the background of a graph run, by thread, see `extracting_in_background`
+_background: ContextVar[Optional[dict[str, asyncio.Task]]] = ContextVar("background_extractions", default=None)
+
+
+@asynccontextmanager
+async def extracting_in_background():
+    """
+    Lets `extractor_node` start fact extraction as a background task of the enclosed
+    graph run, which `extraction_join_node` waits for. Nodes that run meanwhile, such
+    as drafting, do not wait for it, as they would for a node of the same superstep.
+    Extractions still running when the run is done, e.g. because it failed, are cancelled.
+    """
+    tasks: dict[str, asyncio.Task] = {}
+    token = _background.set(tasks)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+
+def _thread_id() -> str:
+    return get_config()["configurable"].get("thread_id") or ""
+
+
+async def extractor_node(state: DocumentPreparationState) -> dict[str, Any]:
+    """
+    Starts the fact extraction of all sources in the background, see
+    `extracting_in_background`, and returns at once. Outside of that, the facts are
+    extracted here.
+    """
+    background = _background.get()
+    if background is None:
+        return {"source_extractions": await extract_sources(state)}
+    # The task keeps this node's config, so its model calls are accounted to this node
+    background[_thread_id()] = asyncio.create_task(extract_sources(state))
+    return {}
+
+
+async def extraction_join_node(state: DocumentPreparationState) -> dict[str, Any]:
+    """
+    Waits for the fact extraction started by `extractor_node` and keeps the loaded
+    source texts in the state, so the report can be resumed from them. A resumed run
+    whose extraction was lost with the interrupted one extracts the facts again. Past
+    the deadline of a request for partial results the report goes on without them.
+    """
+    background = _background.get()
+    task = background.pop(_thread_id(), None) if background else None
+    if task is None and state.source_extractions:
+        return {}
+    try:
+        async with core.deadline.enforce():
+            extractions = await task if task else await extract_sources(state)
+            source_texts = await load_source_texts(state)
+    except core.deadline.DeadlineExceeded:
+        if not core.deadline.partial_results():
+            raise
+        logger.warning("Deadline passed before the facts of the sources were extracted")
+        return {"source_extractions": {}}
+    return {"source_texts": source_texts, "source_extractions": extractions}
@@ -0,0 +1,51 @@
+from typing import Optional
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables import ensure_config
+from langchain_core.tools import StructuredTool
+import core.store
+from core.config.rag_config import RagParameters
+
+
+RETRIEVER_TOOL_NAME = "retrieve_relevant_information"
+
+
+def retrieval_config(sources: list[str], rag_params: Optional[RagParameters] = None) -> dict:
+    """
+    The `configurable` that points the shared `retriever_tool` at a request's sources,
+    e.g. `graph.ainvoke(state, config={"configurable": retrieval_config([...])})`.
+
+    It extends the configurable of the enclosing run, so a graph invoked inside a node
+    keeps that node's thread and checkpoint namespace.
+    """
+    configurable = {**(ensure_config().get("configurable") or {}), "sources": sources}
+    if rag_params:
+        configurable["rag_params"] = rag_params
+    return configurable
+
+
+def _retriever(config: RunnableConfig):
+    # Resolved per call: every request has a vector store of its own, see `core.store.request_store`
+    configurable = config.get("configurable") or {}
+    return core.store.as_retriever(configurable.get("sources") or [], configurable.get("rag_params"))
+
+
+def _format(documents: list[Document]) -> str:
+    return "\n\n".join(d.page_content for d in documents)
+
+
+def retrieve(query: str, config: RunnableConfig) -> str:
+    return _format(_retriever(config).invoke(query, config))
+
+
+async def aretrieve(query: str, config: RunnableConfig) -> str:
+    return _format(await _retriever(config).ainvoke(query, config))
+
+
+# One tool for every graph: the sources and RAG parameters come from the run config
+retriever_tool = StructuredTool.from_function(
+    func=retrieve,
+    coroutine=aretrieve,
+    name=RETRIEVER_TOOL_NAME,
+    description="Search and return relavent information about the report"
+)
@@ -1,15 +1,15 @@
 import logging
-from langchain_classic.tools.retriever import create_retriever_tool
+from langchain_core.messages import ToolMessage
 from langchain_core.prompts.chat import PromptTemplate
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import START
 from langgraph.graph import END
 from langgraph.graph import StateGraph
 from langgraph.prebuilt import ToolNode
 from langgraph.prebuilt import tools_condition
-from langgraph.prebuilt import create_react_agent
 import core.llm
-import core.store
-from core.agents.state import DocumentPreparationState
+from core.agents.retrieval import RETRIEVER_TOOL_NAME
+from core.agents.retrieval import retriever_tool
 from core.agents.state import SectionState
 from core.agents.state import TemplateSectionDef
 
@@ -17,6 +17,9 @@ from core.agents.state import TemplateSectionDef
 logger = logging.getLogger(__name__)
 
 
+DRAFTING_MODES = ("agent", "fast")
+
+
 QUERY_PROMPT = PromptTemplate.from_template(
     """You are a researcher for a specific section in a report.  According the the provided *Objective* and *Title*, formulate a query and apply the query to the tool provided to retrieve the information you need.
     Title: {{title}}
@@ -77,85 +80,103 @@ def format_style_guidance(style_guidelines: dict) -> str:
     return "\n".join(format_dict(style_guidelines))
 
 
-def create_query_agent(section: TemplateSectionDef, retriever_tool):
-    agent = create_react_agent(
-        core.llm.model,
-        tools=[retriever_tool]
-    )
-    return agent
+# Built once per process; the retriever tool reads the section's sources from the run config
+query_model = core.llm.get_model("query").bind_tools([retriever_tool])
+drafting_model = core.llm.get_model("drafting")
 
 
-def query_node(state: SectionState):
+async def query_node(state: SectionState):
+    """Asks the query model for a retriever tool call; the "retrieve" node runs it."""
     section = state["section"]
     logger.info("running query node: %s", section)
-    retriever = core.store.as_retriever([section.source])
     if section.instructions:
-        retriever_tool = create_retriever_tool(
-            retriever,
-            "retrieve_relevant_information",
-            "Search and return relavent information about the report"
-        )
-        agent = create_query_agent(section, retriever_tool)
         prompt = QUERY_PROMPT.format(
             title=section.title,
             objective=section.instructions.objective
         )
-        response = agent.invoke({"messages": [("user", prompt)]})
+        response = await query_model.ainvoke([("user", prompt)])
         logger.debug("Query response: %s", response)
-        return {"messages": [response["messages"][-1]]}
+        return {"messages": [response]}
     else:
         raise TypeError("section instructions is None")
 
 
-def drafting_node(state: SectionState):
+def section_query(section: TemplateSectionDef) -> str:
+    """The retrieval query of fast drafting: the section title and its objective."""
+    objective = section.instructions.objective if section.instructions else ""
+    return f"{section.title}: {objective}" if objective else section.title
+
+
+async def direct_retrieval_node(state: SectionState, config: RunnableConfig):
+    """
+    Retrieves with `section_query` without a model call. Used by fast drafting, and when
+    the query model of agent drafting answers without calling the retriever.
+    """
+    section = state["section"]
+    query = section_query(section)
+    logger.info("running direct retrieval: %s", query)
+    content = await retriever_tool.ainvoke({"query": query}, config)
+    return {"messages": [ToolMessage(content, tool_call_id="direct_retrieval", name=RETRIEVER_TOOL_NAME)]}
+
+
+def route_query(state: SectionState) -> str:
+    # Sections written from upstream drafts need no retrieval
+    if state.get("upstream"):
+        return "drafting_node"
+    return "direct_retrieval_node" if state.get("drafting_mode") == "fast" else "query_node"
+
+
+async def drafting_node(state: SectionState):
     section = state["section"]
     logger.info("running drafting node: %s", section)
     prompt = DRAFTING_PROMPT.format(
         title=section.title,
         instructions=section.instructions,
         style_guidance=state["style_guidance"],
-        content=state["messages"][-1].content
+        content=state.get("upstream") or state["messages"][-1].content
     )
-    agent = create_react_agent(core.llm.model)
-    response = agent.invoke({"messages": [{"user", prompt}]})
+    response = await drafting_model.ainvoke([("user", prompt)])
     logger.debug("Drafting response: %s", response)
-    return {"messages": [response["messages"][-1]]}
+    return {"messages": [response]}
 
 
-def create_section_graph_limit_sources(sources: list[str]):
-    retriever = core.store.as_retriever(sources)
-    retriever_tool = create_retriever_tool(
-        retriever,
-        "retrieve_relevant_information",
-        "Search and return relavent information about the report"
-    )
+def create_section_graph():
+    """
+    Builds the section drafting graph. It does not depend on the section or request:
+    run it with `config={"configurable": retrieval_config(sources)}`.
 
-    workflow = StateGraph(SectionState)    
+    With `drafting_mode` "fast" in the state the query model is skipped and the section
+    is retrieved with its title and objective, one model call per section instead of two.
+    A section with `upstream` drafts in the state is written from them without retrieval.
+    """
+    workflow = StateGraph(SectionState)
     workflow.add_node(query_node)
     workflow.add_node("retrieve", ToolNode([retriever_tool]))
+    workflow.add_node(direct_retrieval_node)
     workflow.add_node(drafting_node)
 
-    workflow.add_edge(START, "query_node")
+    workflow.add_conditional_edges(START, route_query, ["query_node", "direct_retrieval_node", "drafting_node"])
     workflow.add_conditional_edges(
         "query_node",
         tools_condition,
         {
             "tools": "retrieve",
-            END: END
+            END: "direct_retrieval_node"
         },
     )
     workflow.add_edge("retrieve", "drafting_node")
+    workflow.add_edge("direct_retrieval_node", "drafting_node")
     workflow.add_edge("drafting_node", END)
     
-    graph = workflow.compile()
+    # Runs many times concurrently inside one node of the document graph: it must not
+    # share that graph's checkpoints, an interrupted section is simply drafted again
+    graph = workflow.compile(checkpointer=False)
     return graph
 
 
-def create_section_graph(section: TemplateSectionDef):
-    return create_section_graph_limit_sources([section.source])
+section_graph = create_section_graph()
 
 
 if __name__ == "__main__":
-    graph = create_section_graph_limit_sources([])
-    chart = graph.get_graph().draw_mermaid()
+    chart = section_graph.get_graph().draw_mermaid()
     print(chart)
@@ -1,17 +1,23 @@
 import logging
-import re
-import json
+from pydantic import BaseModel
 from core.agents.state import SectionEditState
 from langgraph.graph import START, END, StateGraph
-from langgraph.prebuilt import ToolNode, tools_condition, create_react_agent
-from langchain_classic.tools.retriever import create_retriever_tool
+from langgraph.prebuilt import ToolNode, tools_condition
 from langchain_core.prompts.chat import PromptTemplate
-from core.llm import model
-import core.store
+from core.llm import get_model
+from core.agents.retrieval import retriever_tool
+from core.structured_output import ainvoke_structured
+from core.structured_output import to_messages
 
 logger = logging.getLogger(__name__)
 
 
+class SectionEdit(BaseModel):
+    """Reply of the section editor: the rewritten section and its updated title."""
+    title: str = ""
+    content: str = ""
+
+
 QUERY_PROMPT_FOR_EDITING = PromptTemplate.from_template(
     """You are a researcher helping to rewrite a section of a document. 
     
@@ -19,45 +25,24 @@ QUERY_PROMPT_FOR_EDITING = PromptTemplate.from_template(
     User's Editing Direction: {user_direction}
     
     Formulate a query and use the retrieval tool to find relevant information that will help rewrite this section according to the user's direction.
-    """,
-    template_format="mustache"
+    """
 )
 
 
+# Laid out for provider-side prompt-prefix caching: the instructions and the full
+# document context are identical for every section edited in one request and come
+# first; everything specific to the section follows in a short suffix.
 EDIT_SECTION_WITH_LLM_PROMPT = PromptTemplate.from_template(
-    """You are rewriting the "{section_title}" section of a document. Your goal is to preserve the section's ORIGINAL PURPOSE and STRUCTURE while updating the content.
-
-    **RETRIEVED REFERENCE MATERIALS:**
-    {retrieved_content}
-
-    **CHANGE DIRECTION:**
-    {user_direction}
-
-    **ORIGINAL SECTION TO REWRITE:**
-    Section: {section_title}
-    ```
-    {original_content}
-    ```
-
-    **STRUCTURAL REQUIREMENTS (MUST PRESERVE):**
-    - Original section length: ~{original_length} words (maintain similar length ±20%)
-    - Number of paragraphs: {paragraph_count} (maintain same paragraph structure)
-    {format_requirement}
-    - Section's role: This section serves a specific purpose in the document - preserve that purpose while updating content
-
-    **FULL DOCUMENT CONTEXT:**
-    ```
-    {document_context}
-    ```
+    """You are rewriting one section of a document. Your goal is to preserve the section's ORIGINAL PURPOSE and STRUCTURE while updating the content.
 
     **INSTRUCTIONS:**
     1. **Identify the purpose**: What is this section trying to accomplish in the original document?
     2. **Preserve the structure**: Keep the same format (paragraphs, lists, organization)
     3. **Maintain the role**: Ensure the rewritten section serves the same purpose as the original
-    4. **Update content**: Apply the change direction: {user_direction}
-    5. **Use references**: Draw new content from the reference materials provided
+    4. **Update content**: Apply the change direction given below
+    5. **Use references**: Draw new content from the reference materials provided below
     6. **Match tone**: Keep the same level of formality and writing style as the original
-    7. **Keep length**: Aim for similar word count (~{original_length} words)
+    7. **Keep length**: Aim for the word count given in the structural requirements
 
     **OUTPUT REQUIREMENTS:**
     - Output a JSON object with two fields: "title" and "content"
@@ -73,13 +58,35 @@ EDIT_SECTION_WITH_LLM_PROMPT = PromptTemplate.from_template(
     "content": "Rewritten section content here..."
     }}
 
+    **FULL DOCUMENT CONTEXT:**
+    ```
+    {document_context}
+    ```
+
+    **ORIGINAL SECTION TO REWRITE:**
+    Section: {section_title}
+    ```
+    {original_content}
+    ```
+
+    **STRUCTURAL REQUIREMENTS (MUST PRESERVE):**
+    - Original section length: ~{original_length} words (maintain similar length ±20%)
+    - Number of paragraphs: {paragraph_count} (maintain same paragraph structure)
+    {format_requirement}
+    - Section's role: This section serves a specific purpose in the document - preserve that purpose while updating content
+
+    **RETRIEVED REFERENCE MATERIALS:**
+    {retrieved_content}
+
+    **CHANGE DIRECTION:**
+    {user_direction}
+
     Output (JSON only, no other text):
-    """,
-    template_format="mustache"
+    """
 )
 
 
-def create_section_editing_graph(sources: list[str]):
+def create_section_editing_graph():
     """
     Create a LangGraph workflow for editing a single section.
     
@@ -87,19 +94,13 @@ def create_section_editing_graph(sources: list[str]):
     1. Query node: Formulates search query based on user direction
     2. Retrieve node: Fetches relevant documents from vector store
     3. Edit node: Rewrites section using retrieved context
-    
-    Args:
-        sources: List of source filenames to limit RAG retrieval
+
+    The graph does not depend on the request; the sources to retrieve from are
+    passed with `config={"configurable": retrieval_config(sources)}`.
         
     Returns:
         Compiled LangGraph for section editing
     """
-    retriever = core.store.as_retriever(sources)
-    retriever_tool = create_retriever_tool(
-        retriever,
-        "retrieve_relevant_information",
-        "Search and return relavent information about the report"
-    )
     workflow = StateGraph(SectionEditState)
     workflow.add_node("query", query_node_for_section_editing)
     workflow.add_node("retrieve", ToolNode([retriever_tool]))
@@ -111,52 +112,42 @@ def create_section_editing_graph(sources: list[str]):
         tools_condition,
         {
             "tools": "retrieve",
-            END: END
+            # Without a retrieval the section is rewritten from the query model's answer
+            END: "edit_section_with_llm_node"
         },
     )
     workflow.add_edge("retrieve", "edit_section_with_llm_node")
     workflow.add_edge("edit_section_with_llm_node", END)
 
-    graph = workflow.compile()
+    # Runs many times concurrently inside one node: it must not share that graph's checkpoints
+    graph = workflow.compile(checkpointer=False)
     return graph
 
 
 
-def create_query_agent_for_editing(retriever_tool):
-    """Create a ReAct agent with retrieval tool for query formulation."""
-    agent = create_react_agent(
-        model,
-        tools=[retriever_tool]
-    )
-    return agent
+# Built once per process; the retriever tool reads the sources from the run config
+query_model_for_editing = get_model("query").bind_tools([retriever_tool])
 
 
-def query_node_for_section_editing(state: SectionEditState):
+async def query_node_for_section_editing(state: SectionEditState):
     """
     Node that formulates a search query based on the editing task.
     
-    Uses a ReAct agent to determine what information is needed from
-    the reference documents to complete the editing task.
+    Asks the query model for a retriever tool call covering the information
+    needed from the reference documents; the "retrieve" node runs it.
     """
     logger.info(f"Running query node for section: {state['section_title']}")
-    retriever = core.store.as_retriever(state["sources"])
-    retriever_tool = create_retriever_tool(
-        retriever,
-        "retrieve_relevant_information",
-        "Search and return relavent information about the report"
-    )
-    agent = create_query_agent_for_editing(retriever_tool)
     prompt = QUERY_PROMPT_FOR_EDITING.format(
         section_title=state["section_title"],
         user_direction=state["user_direction"]
     )
     
-    response = agent.invoke({"messages": [("user", prompt)]})
+    response = await query_model_for_editing.ainvoke([("user", prompt)])
     
-    return {"messages": [response["messages"][-1]]}
+    return {"messages": [response]}
 
 
-def edit_section_with_llm_node(state: SectionEditState) -> dict:
+async def edit_section_with_llm_node(state: SectionEditState) -> dict:
     """
     Edit a section using LLM based on user direction and reference materials.
     
@@ -202,14 +193,9 @@ def edit_section_with_llm_node(state: SectionEditState) -> dict:
     
     # Call LLM
     logger.debug(f"Calling LLM for section: {section_title}")
-    response = model.invoke(prompt)
-    response_text = response.content if hasattr(response, 'content') else str(response)
-    
-    # Clean up response (remove markdown, explanations) and extract JSON
-    cleaned_text = clean_llm_response(response_text)
-    result = json.loads(cleaned_text)
-    new_title = result.get("title", section_title)  # Fallback to original if missing
-    new_content = result.get("content", "")
+    result = await ainvoke_structured(get_model("section_editor"), to_messages(prompt), SectionEdit)
+    new_title = result.title or section_title  # Fallback to original if missing
+    new_content = result.content
 
     if not new_content:
         logger.warning(f"Empty content in LLM response for section '{section_title}'")
@@ -240,73 +226,4 @@ def edit_section_with_llm_node(state: SectionEditState) -> dict:
     }
 
 
-def clean_llm_response(text: str) -> str:
-    """
-    Clean up LLM response to extract JSON content.
-    
-    Handles various formats:
-    - Plain JSON
-    - JSON in code blocks (```json ... ```)
-    - JSON with extra explanatory text
-    
-    Args:
-        text: Raw LLM response text
-        
-    Returns:
-        Cleaned JSON string
-    """
-    # First, try to find JSON object in the text using regex
-    # Look for {...} pattern (JSON object)
-    json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', text, re.DOTALL)
-    if json_match:
-        json_str = json_match.group(0)
-        # Try to parse it to validate it's valid JSON
-        try:
-            json.loads(json_str)  # Validate it's valid JSON
-            return json_str.strip()
-        except json.JSONDecodeError:
-            pass  # Continue to other methods
-    
-    # Remove markdown code blocks (```json ... ``` or ``` ... ```)
-    text = re.sub(r'```[\w]*\n?', '', text)
-    text = re.sub(r'```\s*$', '', text, flags=re.MULTILINE)
-    
-    # Remove common prefixes that might appear before JSON
-    prefixes = [
-        "Here is the result:",
-        "Here's the output:",
-        "Output:",
-        "Result:",
-        "JSON:",
-        "Here is the rewritten section:",
-        "Rewritten section:",
-        "Here's the updated content:",
-        "Updated content:",
-        "Here is the modified section:",
-    ]
-    for prefix in prefixes:
-        if text.strip().lower().startswith(prefix.lower()):
-            text = text[len(prefix):].strip()
-    
-    # Try to find JSON object again after cleaning
-    json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', text, re.DOTALL)
-    if json_match:
-        json_str = json_match.group(0)
-        try:
-            json.loads(json_str)  # Validate
-            return json_str.strip()
-        except json.JSONDecodeError:
-            pass
-    
-    # If no JSON found, return cleaned text (might be plain JSON)
-    cleaned = text.strip()
-    
-    # Try to parse as-is to validate
-    try:
-        json.loads(cleaned)
-        return cleaned
-    except json.JSONDecodeError:
-        # If it's not valid JSON, log warning and return as-is
-        logger.warning("Could not extract valid JSON from LLM response, returning cleaned text")
-        return cleaned
-
+section_editing_graph = create_section_editing_graph()
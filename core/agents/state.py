@@ -2,6 +2,7 @@ from typing import Any
 from typing import Optional
 from langgraph.graph import MessagesState
 from pydantic import BaseModel
+from core.config.rag_config import RagParameters
 
 
 class TemplateInstruction(BaseModel):
@@ -30,12 +31,18 @@ class TemplateSectionDef(BaseModel):
         source (str): The reference source of the content for this section.
         instructions (Optional[TemplateInstruction]): Instructions specific to this section.
         content (str): The generated content of the section.
+        depends_on (list[str]): Keys of the sections whose drafts this section is written
+            from instead of its source.
+        pending (bool): The request's deadline passed before the section was drafted; its
+            content is empty.
     """
     title: str
     subsections: dict[str, "TemplateSectionDef"]
     source: str
     instructions: Optional[TemplateInstruction]
     content: str
+    depends_on: list[str] = []
+    pending: bool = False
 
 class DocumentPreparationState(BaseModel):
     """
@@ -49,6 +56,14 @@ class DocumentPreparationState(BaseModel):
         example_document_text (Optional[str]): Text from example document for style extraction.
         revision_question (Optional[str]): A question to guide the revision process.
         revision (Optional[str]): The current revision text.
+        drafting_mode (str): "agent" to let a query model formulate each section's
+            retrieval query, "fast" to retrieve with the section title and objective.
+        rag_params (Optional[RagParameters]): Chunking and retrieval parameters of the run,
+            kept to rebuild the vector store when an interrupted run is resumed.
+        reused_sections (list[str]): Titles of the sections whose drafts were taken from
+            the section cache because their inputs did not change.
+        edit_mode (str): "scoped" to revise only the paragraphs a revision question
+            concerns, "full" to have the editor rewrite the whole document.
     """
     sections: dict[str, TemplateSectionDef]
     source_texts: dict[str, str]
@@ -57,11 +72,17 @@ class DocumentPreparationState(BaseModel):
     example_document_text: Optional[str]
     revision_question: Optional[str]
     revision: Optional[str]
+    drafting_mode: str = "agent"
+    rag_params: Optional[RagParameters] = None
+    reused_sections: list[str] = []
+    edit_mode: str = "scoped"
 
 
 class SectionState(MessagesState):
     section: TemplateSectionDef
     style_guidance: str
+    drafting_mode: str
+    upstream: str
 
 
 class SectionChange(BaseModel):
@@ -86,6 +107,7 @@ class TargetedEditingState(BaseModel):
         output_filename (str): Path for output file
         example_sections (dict): Parsed sections from example
         modified_sections (dict): Sections that were changed
+        pending_sections (list): Requested section changes not made before the deadline
         stats (dict): Statistics about the editing process
     """
     # Input
@@ -97,6 +119,7 @@ class TargetedEditingState(BaseModel):
     # Intermediate
     example_sections: dict[str, dict] = {}
     modified_sections: dict[str, dict] = {}
+    pending_sections: list[str] = []
     
     # Output
     stats: dict = {}
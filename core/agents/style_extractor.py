@@ -1,12 +1,16 @@
-import json
+import asyncio
 import logging
-from typing import Any, Dict
-from datetime import datetime
-import os
+from typing import Any
 from langchain_core.prompts import PromptTemplate
-from langgraph.prebuilt import create_react_agent
+from pydantic import RootModel
 import core.llm
+import core.llm_cache
 from core.agents.state import DocumentPreparationState
+from core.section_cache import fingerprint
+from core.style_cache import style_cache
+from core.style_cache import style_cache_key
+from core.structured_output import ainvoke_structured
+from core.structured_output import to_messages
 
 
 logger = logging.getLogger(__name__)
@@ -73,15 +77,15 @@ style_extractor_prompt = PromptTemplate.from_template(
     {example_text}
     --- END EXAMPLE DOCUMENT ---
 
-    Analyze the document and provide the style guidelines as a valid JSON dictionary.
-    End your response with: TERMINATE"""
+    Analyze the document and provide the style guidelines as a valid JSON dictionary."""
 )
 
 
-style_extractor_agent = create_react_agent(
-    core.llm.model,
-    tools=[],
-    prompt="""You are a skilled **Document Style Extractor Agent**.
+class StyleGuidelines(RootModel[dict[str, Any]]):
+    """Style guidelines extracted from an example document."""
+
+
+STYLE_EXTRACTOR_SYSTEM_PROMPT = """You are a skilled **Document Style Extractor Agent**.
 
     Your task is to analyze the full document content and extract **comprehensive style guidelines** that can be used to generate similar documents.
 
@@ -92,88 +96,14 @@ style_extractor_agent = create_react_agent(
     - Focus on patterns that can be replicated in new documents
     - Be specific and actionable in your descriptions
 
-    End your response with the word: TERMINATE"""
-)
+    Respond with a single JSON object."""
 
 
-def parse_style_response(response_text: str) -> dict[str, Any]:
-    """
-    Parse the style extractor agent's response into a structured format.
-    
-    Args:
-        response_text (str): Raw response from the style extractor agent
-        
-    Returns:
-        dict[str, Any]: Parsed style guidelines
-    """
-    try:
-        # Remove TERMINATE marker
-        cleaned = response_text.split("TERMINATE")[0].strip()
-        
-        # Try to find and parse JSON content
-        if "{" in cleaned and "}" in cleaned:
-            start_idx = cleaned.find("{")
-            end_idx = cleaned.rfind("}") + 1
-            json_text = cleaned[start_idx:end_idx]
-            
-            # Parse as JSON
-            parsed_dict = json.loads(json_text)
-            return parsed_dict
-        else:
-            # Fallback: return raw analysis
-            logger.warning("Could not parse style response as JSON")
-            return {
-                "raw_analysis": cleaned,
-                "extraction_note": "Style analysis provided in text format"
-            }
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON parsing error: {e}")
-        return {
-            "raw_analysis": response_text,
-            "parse_error": str(e)
-        }
-    except Exception as e:
-        logger.error(f"Error parsing style response: {e}")
-        return {
-            "raw_analysis": response_text,
-            "error": str(e)
-        }
+# Part of the style cache key, so guidelines are extracted again when a prompt changes
+STYLE_PROMPT_VERSION = fingerprint(style_extractor_prompt.template + STYLE_EXTRACTOR_SYSTEM_PROMPT)
 
-def save_style_guidelines(style_guidelines: Dict[str, Any], filename: str = None) -> str:
-    """
-    Save extracted style guidelines to a JSON file.
-    
-    Args:
-        style_guidelines (Dict[str, Any]): The style guidelines to save
-        filename (str, optional): Custom filename, otherwise auto-generated
-        
-    Returns:
-        str: Path to the saved file
-    """
-    output_dir = "outputs/style_guidelines"
-    os.makedirs(output_dir, exist_ok=True)
-    
-    if filename is None:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"style_guidelines_{timestamp}.json"
-    
-    if not filename.endswith('.json'):
-        filename += '.json'
-    
-    filepath = os.path.join(output_dir, filename)
-    
-    # Add metadata
-    style_data = {
-        "extracted_at": datetime.now().isoformat(),
-        "style_guidelines": style_guidelines
-    }
-    
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(style_data, f, indent=2, ensure_ascii=False)
-    
-    return filepath
-    
-def style_extractor_node(state: DocumentPreparationState) -> dict[str, Any]:
+
+async def style_extractor_node(state: DocumentPreparationState) -> dict[str, Any]:
     """
     LangGraph node that extracts style guidelines from an example document.
     
@@ -188,6 +118,13 @@ def style_extractor_node(state: DocumentPreparationState) -> dict[str, Any]:
         logger.info("No example document provided, skipping style extraction")
         return {"style_guidelines": None}
     
+    cache_key = style_cache_key(
+        state.example_document_text,
+        f"{STYLE_PROMPT_VERSION}:{core.llm.routing.model_for('style')}"
+    )
+    if not core.llm_cache.bypassed() and (cached := await asyncio.to_thread(style_cache.lookup, cache_key)) is not None:
+        return {"style_guidelines": cached}
+
     logger.info("Extracting style guidelines from example document")
     
     # Create prompt
@@ -197,19 +134,23 @@ def style_extractor_node(state: DocumentPreparationState) -> dict[str, Any]:
     
     logger.debug("Style extraction prompt: %s", message[:500])
     
-    # Call style extractor agent
-    response = style_extractor_agent.invoke({"messages": [("user", message)]})
-    
-    logger.debug("Style extractor response: %s", response)
-    
-    # Extract and parse the response
-    style_text = response["messages"][-1].content
-    style_guidelines = parse_style_response(style_text)
+    # Invalid replies are repaired by the model instead of failing the request
+    style_guidelines = (await ainvoke_structured(
+        core.llm.get_model("style"),
+        to_messages(message, STYLE_EXTRACTOR_SYSTEM_PROMPT),
+        StyleGuidelines
+    )).root
     
     logger.info("Style guidelines extracted: %s", list(style_guidelines.keys()))
 
     try:
-        saved_path = save_style_guidelines(style_guidelines)
+        saved_path = await asyncio.to_thread(
+            style_cache.store,
+            cache_key,
+            style_guidelines,
+            prompt_version=STYLE_PROMPT_VERSION,
+            model=core.llm.routing.model_for("style")
+        )
         logger.info("Style guidelines saved to: %s", saved_path)
     except Exception as e:
         logger.error("Failed to save style guidelines: %s", e)
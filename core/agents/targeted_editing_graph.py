@@ -1,5 +1,4 @@
 from langgraph.graph import START, END, StateGraph
-from langgraph.checkpoint.memory import MemorySaver
 from core.agents.state import TargetedEditingState
 from core.agents.targeted_editing_nodes import (
     parse_example_node,
@@ -13,7 +12,7 @@ def get_targeted_editing_graph():
     Build LangGraph workflow for targeted section editing.
     
     Returns:
-        Compiled LangGraph instance with checkpointer
+        Compiled LangGraph instance
     """
     
     # Create state graph
@@ -30,9 +29,8 @@ def get_targeted_editing_graph():
     builder.add_edge("edit_sections", "assemble_document")
     builder.add_edge("assemble_document", END)
     
-    # Compile with checkpointer for state persistence
-    checkpointer = MemorySaver()
-    graph = builder.compile(checkpointer=checkpointer)
+    # Targeted edits are never resumed, so their state is not checkpointed
+    graph = builder.compile(checkpointer=False)
     
     return graph
 
@@ -2,13 +2,18 @@ import logging
 import re
 import asyncio
 from typing import Optional, Tuple
+from langgraph.config import get_config
+import core.deadline
+import core.llm
 from core.agents.state import TargetedEditingState
-from core.agents.section_editor import create_section_editing_graph
+from core.agents.retrieval import retrieval_config
+from core.agents.section_editor import section_editing_graph
+from core.metrics import SECTION_METADATA_KEY
 
 logger = logging.getLogger(__name__)
 
 
-def parse_example_node(state: TargetedEditingState) -> dict:
+async def parse_example_node(state: TargetedEditingState) -> dict:
     """
     Node 1: Parse example document into sections.
     """
@@ -35,7 +40,8 @@ async def edit_single_section(
     example_sections: dict,
     example_document_text: str,
     sources: list[str],
-    graph
+    graph,
+    request: str = "default"
 ) -> Tuple[Optional[str], Optional[dict]]:
     """
     Edit a single section using the provided graph.
@@ -45,7 +51,8 @@ async def edit_single_section(
         example_sections: Dictionary of parsed sections from example document
         example_document_text: Full text of example document
         sources: List of source filenames for RAG retrieval
-        graph: Compiled section editing graph (reused for efficiency)
+        graph: Compiled section editing graph, shared by all requests
+        request: Key of the request for fair sharing of the section concurrency limit
     
     Returns:
         Tuple of (matching_key, section_data) or (None, None) if section not found
@@ -68,14 +75,18 @@ async def edit_single_section(
     
     logger.info(f"Editing section: {section_data['title']}")
     
-    # Edit using the shared graph (async invoke for parallel execution)
-    result = await graph.ainvoke({
-        "section_title": section_data["title"],
-        "original_content": section_data["content"],
-        "user_direction": section_change.user_direction,
-        "full_document": example_document_text,
-        "sources": sources
-    })
+    # Edit using the shared graph, within the section concurrency limit of all requests
+    async with core.llm.section_limiter.slot(request):
+        result = await graph.ainvoke({
+            "section_title": section_data["title"],
+            "original_content": section_data["content"],
+            "user_direction": section_change.user_direction,
+            "full_document": example_document_text,
+            "sources": sources
+        }, config={
+            "configurable": retrieval_config(sources),
+            "metadata": {SECTION_METADATA_KEY: section_data["title"]}
+        })
     
     logger.info(f"  ✓ Section edited: {section_data['title']} ({len(result['new_content'])} chars)")
     
@@ -88,45 +99,59 @@ async def edit_single_section(
 async def edit_sections_node(state: TargetedEditingState) -> dict:
     """
     Node 2: Edit specified sections based on user directions.
-    Uses parallel execution for better performance.
+    Uses parallel execution for better performance. Changes not made by the request
+    deadline are left out and listed in `pending_sections` if the request asked for
+    partial results.
     """
     logger.info(f"Editing {len(state.section_changes)} sections")
     
-    # Create graph ONCE (all sections use same sources, so reuse for efficiency)
+    # The section editing graph is compiled once per process, sources come with each call
     sources = list(state.reference_texts.keys())
-    section_edit_graph = create_section_editing_graph(sources=sources)
+    request = get_config()["configurable"].get("thread_id") or "default"
     
     # Prepare all edit tasks for parallel execution
-    edit_tasks = [
-        edit_single_section(
+    edit_tasks = {
+        i: asyncio.create_task(edit_single_section(
             section_change,
             state.example_sections,
             state.example_document_text,
             sources,
-            section_edit_graph
-        )
-        for section_change in state.section_changes
-    ]
+            section_editing_graph,
+            request
+        ))
+        for i, section_change in enumerate(state.section_changes)
+    }
     
-    # Execute all edits in parallel using asyncio.gather
+    # Execute all edits in parallel, admitted by the shared section concurrency limit
     logger.info(f"Running {len(edit_tasks)} section edits in parallel...")
-    results = await asyncio.gather(*edit_tasks)
+    unfinished = await core.deadline.finish_by_deadline(edit_tasks)
     
     # Collect results (filter out sections that weren't found)
     modified_sections = {}
-    for matching_key, section_data in results:
+    for i, task in edit_tasks.items():
+        if i in unfinished:
+            continue
+        matching_key, section_data = task.result()
         if matching_key is not None:
             modified_sections[matching_key] = section_data
+    pending_sections = [state.section_changes[i].section_name for i in unfinished]
     
     logger.info(f"Completed editing {len(modified_sections)} sections")
+    if pending_sections:
+        logger.warning(f"Deadline passed before editing: {', '.join(pending_sections)}")
     
-    return {"modified_sections": modified_sections}
+    return {"modified_sections": modified_sections, "pending_sections": pending_sections}
 
 
-def assemble_document_node(state: TargetedEditingState) -> dict:
+async def assemble_document_node(state: TargetedEditingState) -> dict:
     """
     Node 3: Assemble final document with modified and unchanged sections.
     """
+    # Building and saving the DOCX blocks, keep it off the event loop
+    return await asyncio.to_thread(assemble_document, state)
+
+
+def assemble_document(state: TargetedEditingState) -> dict:
     logger.info("Assembling final document")
     
     from docx import Document
@@ -163,7 +188,8 @@ def assemble_document_node(state: TargetedEditingState) -> dict:
         "stats": {
             "total_sections": len(state.example_sections),
             "modified": modified_count,
-            "unchanged": unchanged_count
+            "unchanged": unchanged_count,
+            "pending": len(state.pending_sections)
         }
     }
 
@@ -0,0 +1,178 @@
+"""
+Record/replay of chat model and embedding calls.
+
+In record mode every chat model request and every embedding batch made by the pipeline
+is executed for real and appended to a cassette file together with its latency. In
+replay mode the same requests are answered from the cassette, with the recorded latency
+or none, so our own code paths (extraction, retrieval, assembly, rendering) can be
+profiled offline and without provider variance.
+
+    LLM_CASSETTE=cassettes/proposal.jsonl LLM_CASSETTE_MODE=record python -m benchmarks.pipeline_benchmark --runs 1
+    LLM_CASSETTE=cassettes/proposal.jsonl LLM_CASSETTE_MODE=replay python -m benchmarks.pipeline_benchmark
+
+Chat requests are matched by their normalized messages and call parameters (see
+`core.llm_cache.cache_key`), embedding batches by their texts. Replayed calls still
+pass the scheduler of `core.llm`; set LLM_REQUESTS_PER_SECOND=0 to profile without its
+rate limit.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Optional
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from core.config.llm_config import CassetteConfig
+from core.llm_cache import cache_key
+from core.llm_cache import deserialize_result
+from core.llm_cache import serialize_result
+
+
+logger = logging.getLogger(__name__)
+
+
+class CassetteMissError(KeyError):
+    """A call in replay mode that the cassette has no recording of."""
+
+
+class Cassette:
+    """
+    A cassette file of recorded calls, one JSON object per line:
+    {"kind": "chat" | "embedding" | "embedding_query", "key": ..., "seconds": ..., "value": ...}
+    """
+
+    def __init__(self, config: CassetteConfig):
+        self.config = config
+        self._lock = threading.Lock()
+        self._entries: dict[tuple[str, str], dict[str, Any]] = {}
+        if config.mode == "replay":
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(config.path) or ".", exist_ok=True)
+
+    @property
+    def replaying(self) -> bool:
+        return self.config.mode == "replay"
+
+    def _load(self):
+        with open(self.config.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault((entry["kind"], entry["key"]), entry)
+        logger.info(f"Loaded {len(self._entries)} recorded calls from {self.config.path}")
+
+    def record(self, kind: str, key: str, seconds: float, value: Any):
+        entry = {"kind": kind, "key": key, "seconds": round(seconds, 4), "value": value}
+        with self._lock:
+            if (kind, key) in self._entries:
+                return
+            self._entries[(kind, key)] = entry
+            with open(self.config.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def lookup(self, kind: str, key: str) -> dict[str, Any]:
+        try:
+            return self._entries[(kind, key)]
+        except KeyError:
+            raise CassetteMissError(
+                f"No recorded {kind} call {key[:12]} in {self.config.path}; re-record the cassette"
+            ) from None
+
+    def replay_seconds(self, entry: dict[str, Any]) -> float:
+        return entry["seconds"] if self.config.latency == "recorded" else 0.0
+
+
+def chat_key(model_name: Optional[str], messages, stop, kwargs) -> str:
+    # Only the routed model name is part of the key, so a replay does not need the provider model
+    return cache_key({"model_name": model_name}, messages, stop=stop, **kwargs)
+
+
+def embedding_key(texts: list[str]) -> str:
+    return hashlib.sha256(json.dumps(texts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class CassetteChatModel(BaseChatModel):
+    """Records the calls of `inner` to the cassette, or replays them without `inner`."""
+    cassette: Any
+    inner: Optional[BaseChatModel] = None
+    model_name: Optional[str] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cassette-{self.inner._llm_type}" if self.inner else "cassette"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return self.inner._identifying_params if self.inner else {"model_name": self.model_name or "cassette"}
+
+    def bind_tools(self, tools, **kwargs):
+        if self.inner:
+            return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+        # Replay: bind the tools the way the recording model did, in OpenAI format
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key = chat_key(self.model_name, messages, stop, kwargs)
+        if self.cassette.replaying:
+            entry = self.cassette.lookup("chat", key)
+            time.sleep(self.cassette.replay_seconds(entry))
+            return deserialize_result(entry["value"])
+        start = time.perf_counter()
+        result = self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self.cassette.record("chat", key, time.perf_counter() - start, serialize_result(result))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key = chat_key(self.model_name, messages, stop, kwargs)
+        if self.cassette.replaying:
+            entry = self.cassette.lookup("chat", key)
+            await asyncio.sleep(self.cassette.replay_seconds(entry))
+            return deserialize_result(entry["value"])
+        start = time.perf_counter()
+        result = await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self.cassette.record("chat", key, time.perf_counter() - start, serialize_result(result))
+        return result
+
+
+class CassetteEmbeddings(Embeddings):
+    """Records the embedding batches of `inner` to the cassette, or replays them without `inner`."""
+
+    def __init__(self, cassette: Cassette, inner: Optional[Embeddings] = None):
+        self.cassette = cassette
+        self.inner = inner
+
+    def _call(self, kind: str, texts: list[str], embed) -> list[list[float]]:
+        key = embedding_key(texts)
+        if self.cassette.replaying:
+            entry = self.cassette.lookup(kind, key)
+            time.sleep(self.cassette.replay_seconds(entry))
+            return entry["value"]
+        start = time.perf_counter()
+        vectors = embed(texts)
+        self.cassette.record(kind, key, time.perf_counter() - start, vectors)
+        return vectors
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._call("embedding", list(texts), lambda batch: self.inner.embed_documents(batch))
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._call("embedding_query", [text], lambda batch: [self.inner.embed_query(batch[0])])[0]
+
+
+def load_cassette() -> Optional[Cassette]:
+    """The cassette configured through LLM_CASSETTE*, or None when record/replay is off."""
+    config = CassetteConfig.from_env()
+    if not config.path:
+        return None
+    logger.info(f"LLM cassette {config.path} in {config.mode} mode")
+    return Cassette(config)
+
+
+cassette = load_cassette()
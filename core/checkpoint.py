@@ -0,0 +1,485 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any, Iterator, Optional, Sequence
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions
+from langgraph.checkpoint.base import Checkpoint
+from langgraph.checkpoint.base import CheckpointMetadata
+from langgraph.checkpoint.base import CheckpointTuple
+from langgraph.checkpoint.memory import InMemorySaver
+from core.config.llm_config import CheckpointConfig
+
+
+logger = logging.getLogger(__name__)
+
+
+def new_thread_id(kind: str) -> str:
+    """A thread id for one report or editing session, e.g. `report-<uuid4>`."""
+    return f"{kind}-{uuid.uuid4()}"
+
+
+def _size(value: Any) -> int:
+    """Bytes of a stored value: serialized `(type, bytes)` pairs nested in tuples."""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, tuple):
+        return sum(_size(v) for v in value)
+    return 0
+
+
+def _pack(data: bytes) -> bytes:
+    return zlib.compress(data) if data else data
+
+
+def _unpack(data: bytes) -> bytes:
+    return zlib.decompress(data) if data else data
+
+
+class SqliteCheckpointStore:
+    """
+    Durable copy of the checkpoints of `BoundedMemorySaver` in a SQLite file.
+
+    Values are stored as the checkpointer serialized them (msgpack), zlib-compressed.
+    A thread is written as its checkpoints, channel values and pending writes are put
+    and read back in full when a restarted process resumes it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Must hold the lock. Opens the database on first use."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS threads ("
+                " thread_id TEXT PRIMARY KEY,"
+                " last_used REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS threads_last_used ON threads (last_used);"
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                " thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL,"
+                " parent_id TEXT, type TEXT NOT NULL, checkpoint BLOB NOT NULL,"
+                " metadata_type TEXT NOT NULL, metadata BLOB NOT NULL,"
+                " PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id));"
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                " thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, channel TEXT NOT NULL,"
+                " version TEXT NOT NULL, type TEXT NOT NULL, value BLOB NOT NULL,"
+                " PRIMARY KEY (thread_id, checkpoint_ns, channel, version));"
+                "CREATE TABLE IF NOT EXISTS writes ("
+                " thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL,"
+                " task_id TEXT NOT NULL, idx INTEGER NOT NULL, channel TEXT NOT NULL,"
+                " type TEXT NOT NULL, value BLOB NOT NULL, task_path TEXT NOT NULL,"
+                " PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx));"
+                "CREATE TABLE IF NOT EXISTS sections ("
+                " thread_id TEXT NOT NULL, section TEXT NOT NULL, content TEXT NOT NULL,"
+                " PRIMARY KEY (thread_id, section));"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def save(
+            self,
+            thread_id: str,
+            checkpoints: Sequence[tuple] = (),
+            blobs: Sequence[tuple] = (),
+            writes: Sequence[tuple] = ()
+    ):
+        """
+        Stores entries of one thread in a single transaction, in the layout of
+        `InMemorySaver`: `(ns, id, entry)` checkpoints, `(key, value)` blobs and
+        `(outer_key, inner_key, value)` writes.
+        """
+        with self._lock:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO threads VALUES (?, ?)", (thread_id, time.time()))
+            conn.executemany(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(thread_id, ns, checkpoint_id, parent, c[0], _pack(c[1]), m[0], _pack(m[1]))
+                 for ns, checkpoint_id, (c, m, parent) in checkpoints]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)",
+                [(thread_id, ns, channel, str(version), value[0], _pack(value[1]))
+                 for (_, ns, channel, version), value in blobs]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(thread_id, ns, checkpoint_id, task_id, idx, channel, value[0], _pack(value[1]), task_path)
+                 for (_, ns, checkpoint_id), (task_id, idx), (_, channel, value, task_path) in writes]
+            )
+            conn.commit()
+
+    def save_section(self, thread_id: str, section: str, content: str):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO threads VALUES (?, ?)", (thread_id, time.time()))
+            conn.execute("INSERT OR REPLACE INTO sections VALUES (?, ?, ?)", (thread_id, section, content))
+            conn.commit()
+
+    def touch(self, thread_id: str):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("UPDATE threads SET last_used = ? WHERE thread_id = ?", (time.time(), thread_id))
+            conn.commit()
+
+    def load(self, thread_id: str) -> Optional[dict[str, Any]]:
+        """
+        Returns:
+            Optional[dict]: "checkpoints", "blobs", "writes" and "sections" of the thread
+                in the layout of `save`, or None if the thread is not stored.
+        """
+        with self._lock:
+            conn = self._connection()
+            if conn.execute("SELECT 1 FROM threads WHERE thread_id = ?", (thread_id,)).fetchone() is None:
+                return None
+            checkpoints = [
+                (ns, checkpoint_id, ((c_type, _unpack(c)), (m_type, _unpack(m)), parent))
+                for ns, checkpoint_id, parent, c_type, c, m_type, m in conn.execute(
+                    "SELECT checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata"
+                    " FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            ]
+            blobs = [
+                ((thread_id, ns, channel, version), (value_type, _unpack(value)))
+                for ns, channel, version, value_type, value in conn.execute(
+                    "SELECT checkpoint_ns, channel, version, type, value FROM blobs WHERE thread_id = ?",
+                    (thread_id,))
+            ]
+            writes = [
+                ((thread_id, ns, checkpoint_id), (task_id, idx),
+                 (task_id, channel, (value_type, _unpack(value)), task_path))
+                for ns, checkpoint_id, task_id, idx, channel, value_type, value, task_path in conn.execute(
+                    "SELECT checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path"
+                    " FROM writes WHERE thread_id = ?", (thread_id,))
+            ]
+            sections = dict(conn.execute(
+                "SELECT section, content FROM sections WHERE thread_id = ?", (thread_id,)
+            ).fetchall())
+        return {"checkpoints": checkpoints, "blobs": blobs, "writes": writes, "sections": sections}
+
+    def delete(self, thread_ids: Sequence[str]):
+        with self._lock:
+            conn = self._connection()
+            for table in ("threads", "checkpoints", "blobs", "writes", "sections"):
+                conn.executemany(f"DELETE FROM {table} WHERE thread_id = ?", [(t,) for t in thread_ids])
+            conn.commit()
+
+    def idle_threads(self, before: float) -> list[str]:
+        """Threads last used before the given time."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT thread_id FROM threads WHERE last_used < ?", (before,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            conn = self._connection()
+            threads = conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+        size = sum(os.path.getsize(p) for p in (self.path, f"{self.path}-wal") if os.path.exists(p))
+        return {"threads": threads, "bytes": size, "path": self.path}
+
+
+@dataclass
+class _ThreadUsage:
+    last_used: float
+    bytes: int = 0
+    blob_keys: set = field(default_factory=set)
+    write_keys: set = field(default_factory=set)
+    sections: dict[str, str] = field(default_factory=dict)
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """
+    `InMemorySaver` that forgets threads instead of growing until restart.
+
+    The serialized size of every thread's checkpoints, channel values and pending writes
+    is accounted as they are stored. A thread expires `ttl_seconds` after it was last
+    read or written, and the least recently used threads are evicted while the total
+    size or the number of threads exceeds its limit. The thread being written is never
+    evicted by its own write.
+
+    With a `store`, every write is also made durable. Evicted threads then only leave
+    memory and are loaded back from the store when used again, also by a restarted
+    process; expired threads are deleted from both. Without a store, resuming an
+    evicted thread finds no checkpoint.
+
+    Besides checkpoints, the drafts of single sections can be saved per thread, so a
+    drafting step that was interrupted keeps the sections it had finished.
+
+    The async methods do the same in a worker thread, so graphs run with `ainvoke` do
+    not compress values or wait for SQLite on the event loop.
+    """
+
+    # Expired threads are looked up on disk at most this often
+    STORE_EXPIRY_INTERVAL = 60.0
+
+    def __init__(self, config: CheckpointConfig, store: Optional[SqliteCheckpointStore] = None):
+        super().__init__()
+        self.config = config
+        self.store = store
+        self._lock = threading.RLock()
+        self._threads: dict[str, _ThreadUsage] = {}
+        self._total_bytes = 0
+        self._counters = {"expired": 0, "evicted": 0, "deleted": 0, "loaded": 0}
+        self._store_expired_at = 0.0
+
+    @property
+    def max_bytes(self) -> int:
+        return int(self.config.max_megabytes * 1024 * 1024)
+
+    def _usage(self, thread_id: str) -> _ThreadUsage:
+        """Must hold the lock."""
+        usage = self._threads.get(thread_id)
+        if usage is None:
+            usage = self._threads[thread_id] = _ThreadUsage(last_used=time.time())
+        return usage
+
+    def _account(self, thread_id: str, added: int):
+        """Must hold the lock."""
+        usage = self._usage(thread_id)
+        usage.bytes += added
+        usage.last_used = time.time()
+        self._total_bytes += added
+
+    def _load(self, thread_id: str) -> bool:
+        """Must hold the lock. Makes sure a stored thread is in memory, returns whether the thread exists."""
+        if thread_id in self._threads:
+            return True
+        data = self.store.load(thread_id) if self.store else None
+        if data is None:
+            return False
+        usage = self._usage(thread_id)
+        added = 0
+        for ns, checkpoint_id, entry in data["checkpoints"]:
+            self.storage[thread_id][ns][checkpoint_id] = entry
+            added += _size(entry)
+        for key, value in data["blobs"]:
+            self.blobs[key] = value
+            usage.blob_keys.add(key)
+            added += _size(value)
+        for outer_key, inner_key, value in data["writes"]:
+            self.writes.setdefault(outer_key, {})[inner_key] = value
+            usage.write_keys.add(outer_key)
+            added += _size(value)
+        usage.sections = data["sections"]
+        added += _size(tuple(usage.sections.values()))
+        self._account(thread_id, added)
+        self._counters["loaded"] += 1
+        logger.info(f"Loaded checkpoint thread {thread_id} from {self.store.path}")
+        return True
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            self._evict(keep=None)
+            if not self._load(thread_id):
+                return None
+            self._threads[thread_id].last_used = time.time()
+            if self.store:
+                self.store.touch(thread_id)
+            return super().get_tuple(config)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    def list(self, config: Optional[RunnableConfig], **kwargs) -> Iterator[CheckpointTuple]:
+        with self._lock:
+            if config and not self._load(config["configurable"]["thread_id"]):
+                return iter(())
+            return iter(list(super().list(config, **kwargs)))
+
+    def put(
+            self,
+            config: RunnableConfig,
+            checkpoint: Checkpoint,
+            metadata: CheckpointMetadata,
+            new_versions: ChannelVersions
+    ) -> RunnableConfig:
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            checkpoint_ns = config["configurable"]["checkpoint_ns"]
+            self._load(thread_id)
+            saved = super().put(config, checkpoint, metadata, new_versions)
+            usage = self._usage(thread_id)
+            entry = self.storage[thread_id][checkpoint_ns][checkpoint["id"]]
+            added = _size(entry)
+            blobs = []
+            for k, v in new_versions.items():
+                key = (thread_id, checkpoint_ns, k, v)
+                blobs.append((key, self.blobs[key]))
+                if key not in usage.blob_keys:
+                    usage.blob_keys.add(key)
+                    added += _size(self.blobs[key])
+            if self.store:
+                self.store.save(thread_id, checkpoints=[(checkpoint_ns, checkpoint["id"], entry)], blobs=blobs)
+            self._account(thread_id, added)
+            self._evict(keep=thread_id)
+            return saved
+
+    async def aput(
+            self,
+            config: RunnableConfig,
+            checkpoint: Checkpoint,
+            metadata: CheckpointMetadata,
+            new_versions: ChannelVersions
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    def put_writes(
+            self,
+            config: RunnableConfig,
+            writes: Sequence[tuple[str, Any]],
+            task_id: str,
+            task_path: str = ""
+    ) -> None:
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            outer_key = (
+                thread_id,
+                config["configurable"].get("checkpoint_ns", ""),
+                config["configurable"]["checkpoint_id"]
+            )
+            self._load(thread_id)
+            before = dict(self.writes.get(outer_key, {}))
+            super().put_writes(config, writes, task_id, task_path)
+            after = self.writes.get(outer_key, {})
+            added = {k: v for k, v in after.items() if before.get(k) is not v}
+            if self.store and added:
+                self.store.save(thread_id, writes=[(outer_key, k, v) for k, v in added.items()])
+            self._usage(thread_id).write_keys.add(outer_key)
+            self._account(thread_id, _size(tuple(after.values())) - _size(tuple(before.values())))
+
+    async def aput_writes(
+            self,
+            config: RunnableConfig,
+            writes: Sequence[tuple[str, Any]],
+            task_id: str,
+            task_path: str = ""
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    def saved_sections(self, thread_id: str) -> dict[str, str]:
+        """Section drafts saved on the thread with `save_section`, by section key."""
+        with self._lock:
+            if not self._load(thread_id):
+                return {}
+            return dict(self._threads[thread_id].sections)
+
+    def save_section(self, thread_id: str, section: str, content: str):
+        with self._lock:
+            self._load(thread_id)
+            usage = self._usage(thread_id)
+            previous = usage.sections.get(section)
+            usage.sections[section] = content
+            if self.store:
+                self.store.save_section(thread_id, section, content)
+            self._account(thread_id, _size(content) - _size(previous or ""))
+
+    async def asaved_sections(self, thread_id: str) -> dict[str, str]:
+        return await asyncio.to_thread(self.saved_sections, thread_id)
+
+    async def asave_section(self, thread_id: str, section: str, content: str):
+        await asyncio.to_thread(self.save_section, thread_id, section, content)
+
+    def _drop(self, thread_id: str):
+        """Must hold the lock. Removes a thread from memory only."""
+        usage = self._threads.pop(thread_id, None)
+        if usage is None:
+            return
+        self.storage.pop(thread_id, None)
+        for key in usage.blob_keys:
+            self.blobs.pop(key, None)
+        for key in usage.write_keys:
+            self.writes.pop(key, None)
+        self._total_bytes -= usage.bytes
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._drop(thread_id)
+            if self.store:
+                self.store.delete([thread_id])
+
+    def _evict(self, keep: Optional[str]):
+        """Must hold the lock. Drops expired threads, then least recently used ones over the limits."""
+        now = time.time()
+        if self.config.ttl_seconds:
+            expired = [t for t, u in self._threads.items()
+                       if t != keep and now - u.last_used > self.config.ttl_seconds]
+            for thread_id in expired:
+                self._drop(thread_id)
+            if self.store and now - self._store_expired_at > min(self.STORE_EXPIRY_INTERVAL, self.config.ttl_seconds):
+                self._store_expired_at = now
+                expired = set(expired) | {t for t in self.store.idle_threads(now - self.config.ttl_seconds)
+                                          if t != keep and t not in self._threads}
+            if expired and self.store:
+                self.store.delete(sorted(expired))
+            self._counters["expired"] += len(expired)
+
+        def over_limits() -> bool:
+            return ((self.max_bytes and self._total_bytes > self.max_bytes) or
+                    (self.config.max_threads and len(self._threads) > self.config.max_threads))
+
+        if not over_limits():
+            return
+        evicted = 0
+        for thread_id in sorted(self._threads, key=lambda t: self._threads[t].last_used):
+            if not over_limits():
+                break
+            if thread_id == keep:
+                continue
+            # Durable threads stay in the store and are loaded again on use
+            self._drop(thread_id)
+            evicted += 1
+        self._counters["evicted"] += evicted
+        logger.info(f"Checkpointer evicted {evicted} thread(s) from memory, {self._total_bytes} bytes remain")
+
+    def forget(self, thread_id: str):
+        """Deletes a finished thread that will not be resumed."""
+        with self._lock:
+            if self._load(thread_id):
+                self._counters["deleted"] += 1
+            self.delete_thread(thread_id)
+
+    def has_thread(self, thread_id: str) -> bool:
+        with self._lock:
+            self._evict(keep=None)
+            return self._load(thread_id)
+
+    async def ahas_thread(self, thread_id: str) -> bool:
+        return await asyncio.to_thread(self.has_thread, thread_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._evict(keep=None)
+            return {
+                **self._counters,
+                "threads": len(self._threads),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "max_threads": self.config.max_threads,
+                "ttl_seconds": self.config.ttl_seconds,
+                "store": self.store.stats() if self.store else None,
+            }
+
+
+def create_checkpointer(config: CheckpointConfig) -> BoundedMemorySaver:
+    store = SqliteCheckpointStore(config.path) if config.durable else None
+    return BoundedMemorySaver(config, store)
+
+
+# Shared by all compiled graphs of the process
+checkpointer = create_checkpointer(CheckpointConfig.from_env())
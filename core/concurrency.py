@@ -0,0 +1,241 @@
+import asyncio
+import itertools
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+from core.config.llm_config import SectionConcurrencyConfig
+from core.llm_scheduler import is_rate_limit_error
+
+
+logger = logging.getLogger(__name__)
+
+
+class _ProviderTime:
+    """Model calls a section made to the provider and the time they took there."""
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+
+_provider_time: ContextVar[Optional[_ProviderTime]] = ContextVar("section_provider_time", default=None)
+
+
+def record_provider_call(seconds: float):
+    """
+    Counts a model call answered by the provider, and the time it took from admission
+    by the model scheduler, towards the section the current task runs in, see
+    `AdaptiveConcurrencyLimiter.slot`. Calls answered from the response cache are not
+    recorded, nor is the time spent waiting for the scheduler.
+    """
+    if timing := _provider_time.get():
+        timing.calls += 1
+        timing.seconds += seconds
+
+
+class _Waiter:
+    def __init__(self, key: str, seq: int, loop: asyncio.AbstractEventLoop):
+        self.key = key
+        self.seq = seq
+        self.loop = loop
+        self.enqueued = time.monotonic()
+        self.event = asyncio.Event()
+        self.admitted = False
+
+    def wake(self):
+        self.loop.call_soon_threadsafe(self.event.set)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits how many sections run at the same time across all requests, AIMD-style.
+
+    Every section finished normally raises the limit by `1 / limit`, i.e. by one per
+    limit's worth of sections, up to `max_limit`. A section that failed with a rate
+    limit error, that saw the model scheduler count new rate limit errors while it ran,
+    or whose model calls took more than `latency_tolerance` times the baseline on average
+    cuts the limit by `backoff`, down to `min_limit`. One overload is only answered once:
+    sections that started before the last decrease do not decrease it again.
+
+    Latency is the time of the section's model calls at the provider, see
+    `record_provider_call`, so waiting in our own model scheduler is not mistaken for
+    overload. The baseline is a decaying minimum of it: a faster call pulls it down by
+    `BASELINE_FALL` of the difference and a slower one lifts it by `BASELINE_RISE`, so a
+    few very fast calls cannot drag it towards zero. Sections answered entirely from the
+    response cache say nothing about the provider and leave the limit as it is.
+
+    Waiting sections are queued per request (`key`). A free slot goes to the request
+    with the fewest sections in flight, so a large template cannot starve a small one.
+    """
+
+    LATENCY_WINDOW = 100
+    # Sections observed before a slow one can decrease the limit
+    BASELINE_SAMPLES = 10
+    BASELINE_FALL = 0.25
+    BASELINE_RISE = 0.05
+
+    def __init__(self, config: SectionConcurrencyConfig, rate_limits: Callable[[], int] = lambda: 0):
+        """
+        Args:
+            config: Limits and adaptation parameters
+            rate_limits: Process-wide count of rate limit errors, checked before and after each section
+        """
+        self.config = config
+        self._rate_limits = rate_limits
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._limit = float(min(max(config.initial_limit, config.min_limit), config.max_limit))
+        self._queues: dict[str, deque[_Waiter]] = {}
+        self._in_flight: dict[str, int] = {}
+        self._latencies: deque[float] = deque(maxlen=self.LATENCY_WINDOW)
+        self._baseline_latency: Optional[float] = None
+        self._samples = 0
+        self._decreased_at = 0.0
+        self._total_wait = 0.0
+        self._counters = {"admitted": 0, "completed": 0, "throttled": 0, "slow": 0, "increases": 0, "decreases": 0}
+
+    @property
+    def limit(self) -> int:
+        return max(self.config.min_limit, int(self._limit))
+
+    def stats(self) -> dict:
+        with self._lock:
+            admitted = self._counters["admitted"]
+            return {
+                "limit": self.limit,
+                "in_flight": sum(self._in_flight.values()),
+                "queued": sum(len(q) for q in self._queues.values()),
+                "requests": len(set(self._queues) | set(self._in_flight)),
+                **self._counters,
+                "mean_wait_seconds": round(self._total_wait / admitted, 4) if admitted else 0.0,
+                "median_latency_seconds": round(statistics.median(self._latencies), 4) if self._latencies else None,
+                "baseline_latency_seconds": round(baseline, 4) if (baseline := self._baseline()) else None,
+                "config": self.config.model_dump(),
+            }
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        """Must hold the lock. Oldest waiter of the request with the fewest sections in flight."""
+        heads = [q[0] for q in self._queues.values()]
+        return min(heads, key=lambda w: (self._in_flight.get(w.key, 0), w.seq), default=None)
+
+    def _dispatch(self):
+        """Must hold the lock. Admits waiters while there is room under the limit."""
+        while sum(self._in_flight.values()) < self.limit:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            queue = self._queues[waiter.key]
+            queue.popleft()
+            if not queue:
+                del self._queues[waiter.key]
+            self._in_flight[waiter.key] = self._in_flight.get(waiter.key, 0) + 1
+            self._counters["admitted"] += 1
+            self._total_wait += time.monotonic() - waiter.enqueued
+            waiter.admitted = True
+            waiter.wake()
+
+    def _release(self, key: str):
+        """Must hold the lock."""
+        self._in_flight[key] -= 1
+        if not self._in_flight[key]:
+            del self._in_flight[key]
+
+    def _decrease(self, started: float, reason: str):
+        """Must hold the lock."""
+        self._counters[reason] += 1
+        if started < self._decreased_at:
+            return
+        previous = self.limit
+        self._limit = max(float(self.config.min_limit), self._limit * self.config.backoff)
+        self._decreased_at = time.monotonic()
+        self._counters["decreases"] += 1
+        logger.info(f"Section concurrency {previous} -> {self.limit} ({reason})")
+
+    def _baseline(self) -> Optional[float]:
+        """Must hold the lock. The unloaded latency, once enough sections were observed."""
+        return self._baseline_latency if self._samples >= self.BASELINE_SAMPLES else None
+
+    def _update_baseline(self, latency: float):
+        """Must hold the lock."""
+        self._samples += 1
+        self._latencies.append(latency)
+        if self._baseline_latency is None:
+            self._baseline_latency = latency
+        elif latency < self._baseline_latency:
+            self._baseline_latency -= self.BASELINE_FALL * (self._baseline_latency - latency)
+        else:
+            self._baseline_latency += self.BASELINE_RISE * (latency - self._baseline_latency)
+
+    def _observe(self, started: float, latency: Optional[float], throttled: bool):
+        """
+        Must hold the lock. Adapts the limit to a finished section, `latency` being the
+        mean time of its model calls at the provider, None if it made none.
+        """
+        self._counters["completed"] += 1
+        if latency is None and not throttled:
+            return
+        baseline = self._baseline()
+        if latency is not None:
+            self._update_baseline(latency)
+        if throttled:
+            self._decrease(started, "throttled")
+        elif baseline and latency > self.config.latency_tolerance * baseline:
+            self._decrease(started, "slow")
+        elif self._limit < self.config.max_limit:
+            previous = self.limit
+            self._limit = min(float(self.config.max_limit), self._limit + 1 / self._limit)
+            if self.limit > previous:
+                self._counters["increases"] += 1
+
+    @asynccontextmanager
+    async def slot(self, key: str):
+        """
+        Waits without blocking the event loop until the section may start and adapts
+        the limit to how it went.
+
+        Args:
+            key: The request the section belongs to, e.g. its thread id
+        """
+        waiter = _Waiter(key, next(self._seq), asyncio.get_running_loop())
+        with self._lock:
+            self._queues.setdefault(key, deque()).append(waiter)
+            self._dispatch()
+        try:
+            await waiter.event.wait()
+        except BaseException:
+            with self._lock:
+                if waiter.admitted:
+                    self._release(key)
+                else:
+                    self._queues[key].remove(waiter)
+                    if not self._queues[key]:
+                        del self._queues[key]
+                self._dispatch()
+            raise
+
+        started = time.monotonic()
+        rate_limits = self._rate_limits()
+        timing = _ProviderTime()
+        token = _provider_time.set(timing)
+        throttled = False
+        completed = False
+        try:
+            yield
+            completed = True
+        except Exception as e:
+            throttled = is_rate_limit_error(e)
+            raise
+        finally:
+            _provider_time.reset(token)
+            with self._lock:
+                self._release(key)
+                # Cancelled sections and other failures say nothing about the provider's load
+                if completed or throttled:
+                    self._observe(started, timing.seconds / timing.calls if timing.calls else None,
+                                  throttled or self._rate_limits() > rate_limits)
+                self._dispatch()
@@ -1,7 +1,29 @@
 import os
+from typing import Literal, Optional
+from pydantic import BaseModel, Field
+
+
+def llm_backend() -> str:
+    """
+    The model backend selected with LLM_BACKEND: "openai" (default) or "fake" for the
+    offline stand-in in `core.fake_llm`.
+    """
+    return os.getenv("LLM_BACKEND", "openai").lower()
+
 
 def get_llm_config():
     """Returns a default configuration for all LLM agents."""
+    if llm_backend() == "fake":
+        # AutoGen talks to the OpenAI-compatible server of `python -m core.fake_llm`
+        return {
+            "seed": 42,
+            "config_list": [{
+                "model": "fake-gpt-4.1",
+                "base_url": os.getenv("LLM_FAKE_BASE_URL", "http://127.0.0.1:8100/v1"),
+                "api_key": "fake"
+            }],
+            "temperature": 0
+        }
     return {
         "seed": 42,
         "config_list": [{
@@ -9,4 +31,388 @@ def get_llm_config():
             "api_key": os.getenv("OPENAI_API_KEY")
         }],
         "temperature": 0
-    }
\ No newline at end of file
+    }
+
+
+MODEL_ROLES = ("query", "extractor", "style", "drafting", "editor", "section_editor")
+
+
+class LlmRoutingConfig(BaseModel):
+    """
+    Chat model used by each agent role. Query formulation and fact extraction default to
+    a smaller, faster model; the other roles use `default_model` unless routed elsewhere.
+    """
+    default_model: str = Field(
+        default="gpt-4.1",
+        description="Model for every role without its own setting"
+    )
+    query: Optional[str] = Field(
+        default="gpt-4.1-mini",
+        description="ReAct agents that turn a section into a retriever tool call"
+    )
+    extractor: Optional[str] = Field(
+        default="gpt-4.1-mini",
+        description="Per-source fact extraction"
+    )
+    style: Optional[str] = Field(
+        default=None,
+        description="Style guideline extraction from the example document"
+    )
+    drafting: Optional[str] = Field(
+        default=None,
+        description="Section drafting"
+    )
+    editor: Optional[str] = Field(
+        default=None,
+        description="Whole-document revisions from /documents/chat/"
+    )
+    section_editor: Optional[str] = Field(
+        default=None,
+        description="Section rewrites of the targeted editing workflow"
+    )
+
+    def model_for(self, role: str) -> str:
+        if role not in MODEL_ROLES:
+            raise ValueError(f"Unknown model role {role!r}, expected one of {MODEL_ROLES}")
+        return getattr(self, role) or self.default_model
+
+    @classmethod
+    def from_env(cls) -> "LlmRoutingConfig":
+        """Build the configuration from LLM_MODEL* environment variables, keeping defaults for unset ones."""
+        env = {"default_model": os.getenv("LLM_MODEL")}
+        env.update({role: os.getenv(f"LLM_MODEL_{role.upper()}") for role in MODEL_ROLES})
+        return cls(**{k: v for k, v in env.items() if v is not None})
+
+
+class LlmSchedulerConfig(BaseModel):
+    """
+    Process-wide limits applied to every chat model call made through `core.llm`.
+
+    A limit of 0 disables that limit.
+    """
+    requests_per_second: float = Field(
+        default=5.0,
+        ge=0.0,
+        description="Maximum model requests started per second"
+    )
+    tokens_per_minute: int = Field(
+        default=0,
+        ge=0,
+        description="Maximum prompt plus completion tokens per rolling minute"
+    )
+    max_in_flight: int = Field(
+        default=8,
+        ge=1,
+        description="Maximum number of model calls running at the same time"
+    )
+    completion_token_estimate: int = Field(
+        default=1000,
+        ge=0,
+        description="Completion tokens reserved per call until the real usage is known"
+    )
+
+    @classmethod
+    def from_env(cls) -> "LlmSchedulerConfig":
+        """Build the configuration from LLM_* environment variables, keeping defaults for unset ones."""
+        env = {
+            "requests_per_second": os.getenv("LLM_REQUESTS_PER_SECOND"),
+            "tokens_per_minute": os.getenv("LLM_TOKENS_PER_MINUTE"),
+            "max_in_flight": os.getenv("LLM_MAX_IN_FLIGHT"),
+            "completion_token_estimate": os.getenv("LLM_COMPLETION_TOKEN_ESTIMATE"),
+        }
+        return cls(**{k: v for k, v in env.items() if v is not None})
+
+
+class LlmCacheConfig(BaseModel):
+    """
+    On-disk response cache for chat model calls made through `core.llm`.
+
+    All models run at temperature 0, so identical requests are answered from disk.
+    """
+    enabled: bool = Field(
+        default=True,
+        description="Serve repeated model calls from the cache"
+    )
+    path: str = Field(
+        default="outputs/llm_cache/responses.sqlite",
+        description="SQLite file holding the cached responses"
+    )
+    max_megabytes: float = Field(
+        default=256.0,
+        gt=0.0,
+        description="Least recently used responses are evicted beyond this size"
+    )
+
+    @classmethod
+    def from_env(cls) -> "LlmCacheConfig":
+        """Build the configuration from LLM_CACHE_* environment variables, keeping defaults for unset ones."""
+        env = {
+            "enabled": os.getenv("LLM_CACHE_ENABLED"),
+            "path": os.getenv("LLM_CACHE_PATH"),
+            "max_megabytes": os.getenv("LLM_CACHE_MAX_MB"),
+        }
+        return cls(**{k: v for k, v in env.items() if v is not None})
+
+
+class FakeLlmConfig(BaseModel):
+    """
+    Latency profile of the offline stand-in model (`LLM_BACKEND=fake`).
+    """
+    first_token_seconds: float = Field(
+        default=0.5,
+        ge=0.0,
+        description="Delay before the first token of every response"
+    )
+    tokens_per_second: float = Field(
+        default=60.0,
+        ge=0.0,
+        description="Generation throughput per response; 0 returns the whole response at once"
+    )
+    draft_words: int = Field(
+        default=150,
+        ge=1,
+        description="Length of generated section drafts in words"
+    )
+
+    @classmethod
+    def from_env(cls) -> "FakeLlmConfig":
+        """Build the configuration from LLM_FAKE_* environment variables, keeping defaults for unset ones."""
+        env = {
+            "first_token_seconds": os.getenv("LLM_FAKE_FIRST_TOKEN_SECONDS"),
+            "tokens_per_second": os.getenv("LLM_FAKE_TOKENS_PER_SECOND"),
+            "draft_words": os.getenv("LLM_FAKE_DRAFT_WORDS"),
+        }
+        return cls(**{k: v for k, v in env.items() if v is not None})
+
+
+class CassetteConfig(BaseModel):
+    """
+    Record/replay of chat model and embedding calls (`core.cassette`).
+
+    With mode "record" every call is made for real and written to `path`; with mode
+    "replay" calls are answered from `path` without touching the providers.
+    """
+    path: Optional[str] = Field(
+        default=None,
+        description="Cassette file (JSON lines); no path disables record/replay"
+    )
+    mode: Literal["record", "replay"] = Field(
+        default="replay",
+        description="Record real calls or replay recorded ones"
+    )
+    latency: Literal["recorded", "zero"] = Field(
+        default="recorded",
+        description="Replay with the recorded latency of each call or without delay"
+    )
+
+    @classmethod
+    def from_env(cls) -> "CassetteConfig":
+        """Build the configuration from LLM_CASSETTE* environment variables, keeping defaults for unset ones."""
+        env = {
+            "path": os.getenv("LLM_CASSETTE"),
+            "mode": os.getenv("LLM_CASSETTE_MODE"),
+            "latency": os.getenv("LLM_CASSETTE_LATENCY"),
+        }
+        return cls(**{k: v for k, v in env.items() if v is not None})
+
+
+class StructuredOutputConfig(BaseModel):
+    """
+    Validation of JSON replies of the extractor, style extractor and section editor
+    (`core.structured_output`).
+    """
+    max_repairs: int = Field(
+        default=2,
+        ge=0,
+        le=5,
+        description="Times an invalid reply is sent back to the model with the error before giving up"
+    )
+
+    @classmethod
+    def from_env(cls) -> "StructuredOutputConfig":
+        """Build the configuration from LLM_STRUCTURED_* environment variables, keeping defaults for unset ones."""
+        env = {
+            "max_repairs": os.getenv("LLM_STRUCTURED_MAX_REPAIRS"),
+        }
+        return cls(**{k: v for k, v in env.items() if v is not None})
+
+
+class ExtractionConfig(BaseModel):
+    """
+    Map-reduce fact extraction (`core.agents.extractor`): sources longer than one window
+    are split into token-bounded windows that are extracted concurrently and merged.
+    """
+    window_tokens: int = Field(
+        default=12000,
+        ge=500,
+        description="Maximum source tokens sent in one extraction call"
+    )
+    overlap_tokens: int = Field(
+        default=200,
+        ge=0,
+        description="Tokens shared by neighbouring windows so facts on a boundary are not cut"
+    )
+    max_concurrency: int = Field(
+        default=4,
+        ge=1,
+        description="Windows of one report's sources extracted at the same time"
+    )
+
+    @classmethod
+    def from_env(cls) -> "ExtractionConfig":
+        """Build the configuration from LLM_EXTRACTION_* environment variables, keeping defaults for unset ones."""
+        env = {
+            "window_tokens": os.getenv("LLM_EXTRACTION_WINDOW_TOKENS"),
+            "overlap_tokens": os.getenv("LLM_EXTRACTION_OVERLAP_TOKENS"),
+            "max_concurrency": os.getenv("LLM_EXTRACTION_MAX_CONCURRENCY"),
+        }
+        return cls(**{k: v for k, v in env.items() if v is not None})
+
+
+class SectionConcurrencyConfig(BaseModel):
+    """
+    Adaptive limit on the sections drafted or edited at the same time, shared by all
+    requests of the process. The limit grows by one after a limit's worth of sections
+    finish normally and is cut by `backoff` when a section is throttled by the provider
+    or its model calls take longer than `latency_tolerance` times their unloaded latency
+    at the provider.
+    """
+    initial_limit: int = Field(
+        default=8,
+        ge=1,
+        description="Sections in flight before any latency has been observed"
+    )
+    min_limit: int = Field(
+        default=1,
+        ge=1,
+        description="Lowest limit the controller backs off to"
+    )
+    max_limit: int = Field(
+        default=32,
+        ge=1,
+        description="Highest limit the controller grows to"
+    )
+    latency_tolerance: float = Field(
+        default=3.0,
+        gt=1.0,
+        description="Section latency, relative to the recent minimum, treated as overload"
+    )
+    backoff: float = Field(
+        default=0.5,
+        gt=0.0,
+        lt=1.0,
+        description="Factor the limit is multiplied by on overload"
+    )
+
+    @classmethod
+    def from_env(cls) -> "SectionConcurrencyConfig":
+        """Build the configuration from LLM_SECTION_* environment variables, keeping defaults for unset ones."""
+        env = {
+            "initial_limit": os.getenv("LLM_SECTION_CONCURRENCY"),
+            "min_limit": os.getenv("LLM_SECTION_MIN_CONCURRENCY"),
+            "max_limit": os.getenv("LLM_SECTION_MAX_CONCURRENCY"),
+            "latency_tolerance": os.getenv("LLM_SECTION_LATENCY_TOLERANCE"),
+            "backoff": os.getenv("LLM_SECTION_BACKOFF"),
+        }
+        return cls(**{k: v for k, v in env.items() if v is not None})
+
+
+class CheckpointConfig(BaseModel):
+    """
+    Checkpointer that keeps report threads between the generation of a report and its
+    revisions. Idle threads expire, and the least recently used threads leave memory
+    once the loaded checkpoints exceed the size or thread limit. Durable threads are
+    also written to a SQLite file, so they survive restarts and are loaded back on use.
+
+    A limit of 0 disables that limit.
+    """
+    durable: bool = Field(
+        default=True,
+        description="Persist checkpoints to `path` so interrupted runs can be resumed"
+    )
+    path: str = Field(
+        default="outputs/checkpoints/checkpoints.sqlite",
+        description="SQLite file holding the durable checkpoints"
+    )
+    ttl_seconds: float = Field(
+        default=3600.0,
+        ge=0.0,
+        description="Seconds a thread is kept after its last use"
+    )
+    max_megabytes: float = Field(
+        default=256.0,
+        ge=0.0,
+        description="Maximum serialized size of the checkpoints held in memory"
+    )
+    max_threads: int = Field(
+        default=1000,
+        ge=0,
+        description="Maximum number of threads held in memory at the same time"
+    )
+
+    @classmethod
+    def from_env(cls) -> "CheckpointConfig":
+        """Build the configuration from CHECKPOINT_* environment variables, keeping defaults for unset ones."""
+        env = {
+            "durable": os.getenv("CHECKPOINT_DURABLE"),
+            "path": os.getenv("CHECKPOINT_PATH"),
+            "ttl_seconds": os.getenv("CHECKPOINT_TTL_SECONDS"),
+            "max_megabytes": os.getenv("CHECKPOINT_MAX_MB"),
+            "max_threads": os.getenv("CHECKPOINT_MAX_THREADS"),
+        }
+        return cls(**{k: v for k, v in env.items() if v is not None})
+
+
+class SectionCacheConfig(BaseModel):
+    """
+    On-disk cache of drafted sections. A section is drafted again only when its title,
+    instructions, retrieved source chunks, style guidance or model configuration change.
+    """
+    enabled: bool = Field(
+        default=True,
+        description="Reuse drafts of sections whose inputs did not change"
+    )
+    path: str = Field(
+        default="outputs/section_cache/sections.sqlite",
+        description="SQLite file holding the cached drafts"
+    )
+    max_megabytes: float = Field(
+        default=64.0,
+        gt=0.0,
+        description="Least recently used drafts are evicted beyond this size"
+    )
+
+    @classmethod
+    def from_env(cls) -> "SectionCacheConfig":
+        """Build the configuration from LLM_SECTION_CACHE_* environment variables, keeping defaults for unset ones."""
+        env = {
+            "enabled": os.getenv("LLM_SECTION_CACHE_ENABLED"),
+            "path": os.getenv("LLM_SECTION_CACHE_PATH"),
+            "max_megabytes": os.getenv("LLM_SECTION_CACHE_MAX_MB"),
+        }
+        return cls(**{k: v for k, v in env.items() if v is not None})
+
+
+class DeadlineConfig(BaseModel):
+    """
+    Time limits of requests and of single model calls. A limit of 0 disables that limit.
+    """
+    request_seconds: float = Field(
+        default=0.0,
+        ge=0.0,
+        description="Deadline of a report or targeted edit whose request does not set one"
+    )
+    call_seconds: float = Field(
+        default=300.0,
+        ge=0.0,
+        description="Longest a model call may take once admitted by the scheduler"
+    )
+
+    @classmethod
+    def from_env(cls) -> "DeadlineConfig":
+        """Build the configuration from LLM_*_SECONDS environment variables, keeping defaults for unset ones."""
+        env = {
+            "request_seconds": os.getenv("LLM_REQUEST_DEADLINE_SECONDS"),
+            "call_seconds": os.getenv("LLM_CALL_TIMEOUT_SECONDS"),
+        }
+        return cls(**{k: v for k, v in env.items() if v is not None})
@@ -1,7 +1,12 @@
+import json
+import os
 from pydantic import BaseModel, Field, field_validator
 from typing import Optional
 
 
+RECOMMENDED_PRESETS_DIR = "outputs/rag_presets"
+
+
 class RagParameters(BaseModel):
     similarity_threshold: float = Field(
         default=0.6,
@@ -86,3 +91,22 @@ class RagPreset:
             "fast": cls.FAST
         }
         return presets.get(name.lower(), cls.DEFAULT)
+
+    @classmethod
+    def for_template(cls, template_name: str) -> Optional[RagParameters]:
+        """
+        Load the recommended parameters emitted by the RAG benchmark for a template.
+
+        Args:
+            template_name (str): Template file name, e.g. "proposal_template.json"
+
+        Returns:
+            Optional[RagParameters]: Recommended parameters, or None if the template
+            has not been benchmarked yet
+        """
+        name = os.path.splitext(os.path.basename(template_name))[0]
+        path = os.path.join(RECOMMENDED_PRESETS_DIR, f"{name}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return RagParameters(**json.load(f)["parameters"])
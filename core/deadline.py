@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Hashable, NamedTuple, Optional, TypeVar
+
+
+logger = logging.getLogger(__name__)
+
+
+K = TypeVar("K", bound=Hashable)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's deadline passed before its work was done."""
+
+
+class Deadline(NamedTuple):
+    """
+    Attributes:
+        expires (float): `time.monotonic()` by which the request must be done.
+        partial (bool): Return the sections finished by then instead of failing.
+    """
+    expires: float
+    partial: bool
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("request_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float], partial: bool = False):
+    """
+    Run the enclosed work under a deadline `seconds` from now; None or 0 sets none.
+
+    The deadline is carried by a context variable, so it follows the request into every
+    graph node, section task and model call. A nested deadline never extends the
+    enclosing one.
+    """
+    if not seconds:
+        yield
+        return
+    expires = time.monotonic() + seconds
+    if enclosing := _current_deadline.get():
+        expires = min(expires, enclosing.expires)
+    token = _current_deadline.set(Deadline(expires, partial))
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def partial_results() -> bool:
+    """Whether the current request asked for what is finished by its deadline."""
+    current = _current_deadline.get()
+    return bool(current and current.partial)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left until the current deadline, None without one."""
+    current = _current_deadline.get()
+    return max(0.0, current.expires - time.monotonic()) if current else None
+
+
+def check():
+    """
+    Raises:
+        DeadlineExceeded: If the current deadline has passed.
+    """
+    if remaining() == 0:
+        raise DeadlineExceeded("The request deadline has passed")
+
+
+@asynccontextmanager
+async def enforce(timeout: Optional[float] = None):
+    """
+    Cancels the enclosed work at the current deadline, or after `timeout` seconds if
+    that comes first. A `timeout` of None or 0 sets no limit of its own.
+
+    Raises:
+        DeadlineExceeded: If the deadline cancelled the work.
+        TimeoutError: If `timeout` did.
+    """
+    left = remaining()
+    limits = [t for t in (left, timeout or None) if t is not None]
+    if not limits:
+        yield
+        return
+    limit = min(limits)
+    scope = asyncio.timeout(limit)
+    try:
+        async with scope:
+            yield
+    except TimeoutError as e:
+        if not scope.expired():
+            raise
+        if limit == left:
+            raise DeadlineExceeded("The request deadline has passed") from e
+        raise TimeoutError(f"No result within {timeout:g}s") from e
+
+
+async def finish_by_deadline(tasks: dict[K, asyncio.Task]) -> list[K]:
+    """
+    Waits for the tasks of a fan-out, e.g. one per section, until the current deadline.
+    Tasks still running then are cancelled; tasks that failed with `DeadlineExceeded`
+    did not finish either.
+
+    Returns:
+        list: Keys of the tasks that did not finish, in the order of `tasks`.
+
+    Raises:
+        DeadlineExceeded: If a task did not finish and the request did not ask for
+            partial results.
+        Exception: The error of the first task that failed otherwise. All tasks are
+            cancelled before anything is raised.
+    """
+    running = set(tasks.values())
+    try:
+        while running:
+            done, running = await asyncio.wait(running, timeout=remaining(),
+                                               return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if not task.cancelled() and task.exception() and not isinstance(task.exception(), DeadlineExceeded):
+                    raise task.exception()
+            if remaining() == 0:
+                break
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+
+    unfinished = [
+        key for key, task in tasks.items()
+        if task.cancelled() or isinstance(task.exception(), DeadlineExceeded)
+    ]
+    if unfinished and not partial_results():
+        raise DeadlineExceeded(f"The request deadline passed with {len(unfinished)} of {len(tasks)} task(s) unfinished")
+    return unfinished
@@ -1,25 +1,116 @@
 import json
 import logging
+from contextlib import nullcontext
 from typing import Any
+from typing import AsyncIterator
+from typing import Awaitable
 from typing import Optional
 from langgraph.types import Command
 from core.agents.state import TemplateInstruction
 from core.agents.state import TemplateSectionDef
 from core.agents.state import DocumentPreparationState
+from core.agents.drafting import walk_sections
+from core.agents.extractor import extracting_in_background
 from core.agents.graph import get_graph
-from core.agents.style_extractor import style_extractor_agent, style_extractor_prompt, parse_style_response
+from core.agents.targeted_editing_graph import get_targeted_editing_graph
+from core.checkpoint import checkpointer
+from core.checkpoint import new_thread_id
+from core.llm_scheduler import Priority
+from core.llm_scheduler import priority
+from core.metrics import UsageAccountant
+from core.section_dependencies import dependency_waves
+from core.section_dependencies import template_nodes
+import core.deadline
+import core.llm
 import core.store
 
 
 logger = logging.getLogger(__name__)
 
 
-# Single graph with conditional style extraction routing
+# Graphs are compiled once per process and shared by all requests
 graph = get_graph()
+targeted_editing_graph = get_targeted_editing_graph()
 
 
-def get_agent_config():
-    return {"configurable": {"thread_id": "1"}}
+TERMINATE_MARKER = "TERMINATE"
+
+
+class UnknownThreadError(LookupError):
+    """A revision for a report thread that does not exist, has expired or was evicted."""
+
+    def __init__(self, thread_id: str):
+        super().__init__(f"No report waiting for revision on thread {thread_id!r}; it may have expired")
+        self.thread_id = thread_id
+
+
+def get_agent_config(thread_id: str, usage: Optional[UsageAccountant] = None):
+    config = {"configurable": {"thread_id": thread_id}}
+    if usage:
+        config["callbacks"] = [usage]
+    return config
+
+
+async def awaiting_revision(thread_id: str) -> bool:
+    """Whether the report thread exists and is interrupted for a human revision."""
+    if not await checkpointer.ahas_thread(thread_id):
+        return False
+    return "human_revision_node" in (await graph.aget_state(get_agent_config(thread_id))).next
+
+
+async def check_thread(thread_id: str):
+    """
+    Raises:
+        UnknownThreadError: If the thread cannot be resumed for a revision.
+    """
+    if not await awaiting_revision(thread_id):
+        raise UnknownThreadError(thread_id)
+
+
+async def reused_sections(thread_id: str) -> list[str]:
+    """Titles of the sections of a report that were taken from the section cache."""
+    if not await checkpointer.ahas_thread(thread_id):
+        return []
+    return (await graph.aget_state(get_agent_config(thread_id))).values.get("reused_sections") or []
+
+
+def pending_sections(sections: dict[str, TemplateSectionDef]) -> list[str]:
+    """Titles of the sections not drafted before the deadline of a partial report, in template order."""
+    return [s.title for s in walk_sections(sections) if s.pending]
+
+
+def request_deadline(seconds: Optional[float], partial: bool = False):
+    """The deadline of a request, `DeadlineConfig.request_seconds` if it sets none."""
+    return core.deadline.deadline(core.llm.deadlines.request_seconds if seconds is None else seconds, partial)
+
+
+def whole_run_deadline():
+    """
+    Cancels the enclosed graph run at the deadline, unless the request asked for
+    partial results; its section fan-out then stops at the deadline by itself and keeps
+    what is finished.
+    """
+    return nullcontext() if core.deadline.partial_results() else core.deadline.enforce()
+
+
+async def run_until_deadline(
+        report: Awaitable[dict[str, TemplateSectionDef]],
+        sections: dict[str, TemplateSectionDef]
+) -> dict[str, TemplateSectionDef]:
+    """
+    Runs a report under the current deadline. If the deadline passes before drafting,
+    a request for partial results gets all `sections` back marked pending.
+    """
+    try:
+        async with whole_run_deadline():
+            return await report
+    except core.deadline.DeadlineExceeded:
+        if not core.deadline.partial_results():
+            raise
+        logger.warning("Deadline passed before drafting, all sections are pending")
+        for section in walk_sections(sections):
+            section.pending = bool(section.instructions)
+        return sections
 
 
 def to_instruction(source: dict[str, str]) -> TemplateInstruction:
@@ -39,42 +130,70 @@ def to_section_def(section: dict[str, Any]) -> TemplateSectionDef:
         subsections={ k: to_section_def(s) for k, s in subsections.items() },
         source=section.get("source", ""),
         instructions=to_instruction(instructions) if instructions else None,
-        content=""
+        content="",
+        depends_on=section.get("depends_on", [])
     )
 
 
 async def generate(
         sections: dict[str, Any],
-        source_texts: dict[str, str],
+        source_texts: dict[str, core.store.Source],
         example_document_text: Optional[str] = None,
-        rag_params: Optional[Any] = None
+        rag_params: Optional[Any] = None,
+        usage: Optional[UsageAccountant] = None,
+        drafting_mode: str = "agent",
+        thread_id: Optional[str] = None,
+        deadline_seconds: Optional[float] = None,
+        partial: bool = False
 ) -> dict[str, TemplateSectionDef]:
     """
     Generate a document using the LangGraph pipeline with optional style guidance.
 
     Args:
         sections (dict): Section structure and instructions
-        source_texts (dict): Reference documents for data extraction
+        source_texts (dict): Reference documents for data extraction, by name: their
+            text, or a function returning it, e.g. extracting the text of an uploaded
+            file, which is called in a worker thread while the report is generated
         example_document_text (Optional[str]): Example document for style extraction
         rag_params (Optional[RagParameters]): RAG configuration parameters
+        usage (Optional[UsageAccountant]): Collects token and latency accounting of the run
+        drafting_mode (str): "agent" (default) lets a query model formulate each section's
+            retrieval query; "fast" retrieves with the section title and objective directly
+        thread_id (Optional[str]): Thread the report is kept on for later revisions with
+            `edit`, see `core.checkpoint.new_thread_id`; a new one if not given. A thread
+            whose run was interrupted, e.g. by a restart, is resumed from its last
+            completed node and drafted section; the other arguments are then ignored,
+            except for sources whose texts the thread does not have yet.
+        deadline_seconds (Optional[float]): Seconds the run may take, see `core.deadline`;
+            `DeadlineConfig.request_seconds` if not given, 0 for none
+        partial (bool): At the deadline, return the sections drafted so far and mark the
+            others `pending` instead of failing
 
     Returns:
         dict[str, TemplateSectionDef]: Generated section definitions
+
+    Raises:
+        SectionDependencyError: If sections depend on unknown sections or on each other in a cycle.
+        DeadlineExceeded: If the deadline passed and `partial` is not set. The thread keeps
+            what was done and can be resumed.
     """
+    # Each report runs on its own thread, revisions resume it with the same id
+    thread_id = thread_id or new_thread_id("report")
+    config = get_agent_config(thread_id, usage)
+    if await checkpointer.ahas_thread(thread_id):
+        with request_deadline(deadline_seconds, partial):
+            return await resume(thread_id, config, source_texts)
+
     logger.info("Generating document %s", sections)
+    # Fails before any work is done if the template's section dependencies are invalid
+    dependency_waves(template_nodes(sections))
     section_defs = { k: to_section_def(s) for k, s in sections.items()}
 
-    # Clear vector store to prevent contamination from previous runs
-    core.store.clear_store()
-
     if rag_params:
         logger.info(f"Using custom RAG parameters: threshold={rag_params.similarity_threshold}, "
                    f"top_k={rag_params.top_k}, chunk_size={rag_params.chunk_size}, "
                    f"overlap={rag_params.overlap}%")
 
-    logger.info(f"Loading {len(source_texts)} source document(s) into vector store")
-    core.store.add_sources(source_texts, rag_params=rag_params)
-    
     # Create state - graph will conditionally route based on example_document_text
     if example_document_text and example_document_text.strip():
         logger.info("Example document provided - will extract style during generation")
@@ -83,41 +202,162 @@ async def generate(
     
     state = DocumentPreparationState(
         sections=section_defs,
-        source_texts=source_texts,
+        # The texts of sources still to be loaded are added by extraction_join_node
+        source_texts={name: text for name, text in source_texts.items() if isinstance(text, str)},
         source_extractions={},
         style_guidelines=None,
         example_document_text=example_document_text,
         revision_question="",
-        revision=""
+        revision="",
+        drafting_mode=drafting_mode,
+        rag_params=rag_params
     )
 
-    # Single graph with conditional routing based on state
-    # current using thread_id value of 1,
-    # it should be dynamically generated for each user
-    report_state = await graph.ainvoke(state, config=get_agent_config())
-    return report_state["sections"]
+    async def report() -> dict[str, TemplateSectionDef]:
+        logger.info(f"Loading {len(source_texts)} source document(s) into vector store")
+        # The report's sources go into a vector store of its own. The graph starts right
+        # away, each section is drafted once its own sources are loaded, and the facts
+        # are extracted alongside
+        with core.store.request_store(rag_params):
+            async with core.store.ingesting(source_texts), extracting_in_background():
+                # Report generation is batch work: interactive edits are admitted ahead of it
+                with priority(Priority.BATCH):
+                    report_state = await graph.ainvoke(state, config=config)
+        return report_state["sections"]
 
+    with request_deadline(deadline_seconds, partial):
+        return await run_until_deadline(report(), section_defs)
 
-def edit(question: str, content: str):
+
+async def resume(
+        thread_id: str,
+        config: dict,
+        source_texts: Optional[dict[str, core.store.Source]] = None
+) -> dict[str, TemplateSectionDef]:
+    """
+    Finishes the report of an existing thread. Nodes and sections completed before the
+    run was interrupted are not run again; a finished report is returned as it is.
+    Sources whose texts were not loaded before the interruption are taken from
+    `source_texts`.
+    """
+    snapshot = await graph.aget_state(config)
+    values = snapshot.values
+    if not snapshot.next or "human_revision_node" in snapshot.next:
+        logger.info(f"Report thread {thread_id} is already complete")
+        return values["sections"]
+
+    logger.info(f"Resuming report thread {thread_id} at {', '.join(snapshot.next)}")
+
+    async def report() -> dict[str, TemplateSectionDef]:
+        # The vector store is not part of the checkpoint, rebuild it from the thread's sources
+        sources = {**(source_texts or {}), **values["source_texts"]}
+        with core.store.request_store(values.get("rag_params")):
+            async with core.store.ingesting(sources), extracting_in_background():
+                with priority(Priority.BATCH):
+                    report_state = await graph.ainvoke(None, config=config)
+        return report_state["sections"]
+
+    return await run_until_deadline(report(), values["sections"])
+
+
+async def edit(
+        question: str,
+        content: str,
+        thread_id: str,
+        usage: Optional[UsageAccountant] = None,
+        edit_mode: str = "scoped"
+):
+    """
+    Revises the report of a thread started by `generate`. In the "scoped" edit mode the
+    editor patches only the paragraphs the question concerns and the others are kept
+    byte for byte; "full" has it rewrite the whole document.
+
+    Raises:
+        UnknownThreadError: If the thread does not exist, has expired or was evicted.
+    """
+    await check_thread(thread_id)
     values = {
         "revision_question": question,
-        "revision": content
+        "revision": content,
+        "edit_mode": edit_mode
     }
 
     # Was interrupt for human revision, resume now
-    edited_state = graph.invoke(
-        Command(resume=values),
-        config=get_agent_config()
-    )
+    with priority(Priority.INTERACTIVE):
+        edited_state = await graph.ainvoke(
+            Command(resume=values),
+            config=get_agent_config(thread_id, usage)
+        )
     return edited_state["revision"]
 
 
+async def edit_stream(
+        question: str,
+        content: str,
+        thread_id: str,
+        usage: Optional[UsageAccountant] = None,
+        edit_mode: str = "scoped"
+) -> AsyncIterator[dict[str, str]]:
+    """
+    Streaming variant of `edit`: resumes the graph for a revision and forwards the
+    editor's tokens as they are generated.
+
+    Yields:
+        dict: {"type": "token", "text": ...} for each piece of the revision, then a
+        single {"type": "revision", "revision": ...} with the complete revised document.
+        A scoped edit streams no tokens, its patch is applied once it is complete.
+
+    Raises:
+        UnknownThreadError: If the thread does not exist, has expired or was evicted.
+    """
+    await check_thread(thread_id)
+    values = {
+        "revision_question": question,
+        "revision": content,
+        "edit_mode": edit_mode
+    }
+
+    streamed = ""
+    sent = 0
+    revision = None
+    with priority(Priority.INTERACTIVE):
+        # The editor runs as an agent inside editor_node, so its tokens come from a subgraph
+        async for namespace, mode, chunk in graph.astream(
+                Command(resume=values),
+                config=get_agent_config(thread_id, usage),
+                stream_mode=["messages", "updates"],
+                subgraphs=True
+        ):
+            if mode == "messages":
+                message, _ = chunk
+                if not namespace or not namespace[0].startswith("editor_node:") or not message.text():
+                    continue
+                streamed += message.text()
+                # Hold back anything that could be the start of the TERMINATE marker
+                safe = len(streamed.split(TERMINATE_MARKER)[0])
+                if TERMINATE_MARKER not in streamed:
+                    safe = max(sent, safe - len(TERMINATE_MARKER) + 1)
+                if safe > sent:
+                    yield {"type": "token", "text": streamed[sent:safe]}
+                    sent = safe
+            elif mode == "updates" and not namespace and "editor_node" in chunk:
+                revision = chunk["editor_node"]["revision"]
+
+    tail = streamed.split(TERMINATE_MARKER)[0].rstrip()
+    if len(tail) > sent:
+        yield {"type": "token", "text": tail[sent:]}
+    yield {"type": "revision", "revision": revision if revision is not None else tail.strip()}
+
+
 async def targeted_edit(
     example_document_text: str,
     reference_texts: dict[str, str],
     section_changes: list[dict],
     output_filename: str,
-    rag_params: Optional[Any] = None
+    rag_params: Optional[Any] = None,
+    usage: Optional[UsageAccountant] = None,
+    deadline_seconds: Optional[float] = None,
+    partial: bool = False
 ) -> dict:
     """
     Run targeted section editing workflow using LangGraph.
@@ -134,6 +374,11 @@ async def targeted_edit(
             - user_direction (str): Instructions for how to change it
         output_filename (str): Path where the edited document will be saved
         rag_params (Optional[RagParameters]): RAG configuration parameters
+        usage (Optional[UsageAccountant]): Collects token and latency accounting of the run
+        deadline_seconds (Optional[float]): Seconds the run may take, see `core.deadline`;
+            `DeadlineConfig.request_seconds` if not given, 0 for none
+        partial (bool): At the deadline, keep the sections edited so far and leave the
+            others unchanged instead of failing
 
     Returns:
         dict: Final state containing:
@@ -141,8 +386,13 @@ async def targeted_edit(
                 - total_sections (int): Total number of sections
                 - modified (int): Number of sections that were changed
                 - unchanged (int): Number of sections kept as-is
+                - pending (int): Number of requested changes not made before the deadline
+            - pending_sections (list[str]): Names of those sections
+
+    Raises:
+        DeadlineExceeded: If the deadline passed before the sections were edited, or
+            before all were and `partial` is not set.
     """
-    from core.agents.targeted_editing_graph import get_targeted_editing_graph
     from core.agents.state import TargetedEditingState, SectionChange
 
     logger.info("Starting targeted editing workflow")
@@ -157,15 +407,9 @@ async def targeted_edit(
         for change in section_changes
     ]
 
-    # Clear vector store to prevent contamination from previous runs
-    core.store.clear_store()
-
     if rag_params:
         logger.info(f"Using custom RAG parameters for targeted editing")
 
-    logger.info(f"Loading {len(reference_texts)} source document(s) into vector store")
-    core.store.add_sources(reference_texts, rag_params=rag_params)
-    
     # Create initial state
     initial_state = TargetedEditingState(
         example_document_text=example_document_text,
@@ -174,12 +418,19 @@ async def targeted_edit(
         output_filename=output_filename
     )
     
-    # Build and run graph
-    graph = get_targeted_editing_graph()
-    config = {"configurable": {"thread_id": "targeted_edit"}}
+    # The id only keys the request's share of the section concurrency limit
+    thread_id = new_thread_id("targeted_edit")
+    config = get_agent_config(thread_id, usage)
     
-    logger.info("Executing targeted editing pipeline...")
-    final_state = await graph.ainvoke(initial_state, config=config)
+    with request_deadline(deadline_seconds, partial), core.store.request_store(rag_params):
+        logger.info(f"Loading {len(reference_texts)} source document(s) into vector store")
+        async with core.deadline.enforce():
+            await core.store.aadd_sources(reference_texts)
+
+        logger.info("Executing targeted editing pipeline...")
+        with priority(Priority.BATCH):
+            async with whole_run_deadline():
+                final_state = await targeted_editing_graph.ainvoke(initial_state, config=config)
     
     logger.info("Targeted editing complete")
     logger.info(f"Modified: {final_state['stats']['modified']}, Unchanged: {final_state['stats']['unchanged']}")
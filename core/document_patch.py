@@ -0,0 +1,113 @@
+"""
+Paragraph patches for scoped document revisions.
+
+The editor sees the document split into numbered paragraphs and replies with the edits
+of the paragraphs that change (`DocumentPatch`) instead of the whole revised document.
+`apply_patch` applies them server-side: every paragraph the patch does not name, and
+the whitespace around it, is kept byte for byte.
+"""
+
+import re
+from typing import Literal, Optional
+from pydantic import BaseModel
+
+
+PARAGRAPH_BREAK = re.compile(r"(\n[ \t]*\n\s*)")
+
+
+class PatchError(ValueError):
+    """A patch that names a paragraph the document does not have or edits one twice."""
+
+
+class ParagraphEdit(BaseModel):
+    """
+    Attributes:
+        paragraph (int): Number of the paragraph as shown to the model, starting at 1;
+            0 with "insert_after" inserts before the first paragraph.
+        action (str): "replace" the paragraph with `text`, "insert_after" it a new
+            paragraph `text`, or "delete" it.
+        text (str): The new paragraph, without its number.
+    """
+    paragraph: int
+    action: Literal["replace", "insert_after", "delete"] = "replace"
+    text: str = ""
+
+
+class DocumentPatch(BaseModel):
+    """Reply of the scoped editor: the edits of the paragraphs that change, none if nothing does."""
+    edits: list[ParagraphEdit] = []
+
+
+def split_paragraphs(document: str) -> list[list[str]]:
+    """
+    Splits a document into [paragraph, separator] pairs, the separator being the
+    whitespace that follows the paragraph. Joining all pairs gives the document back.
+    """
+    pieces = PARAGRAPH_BREAK.split(document)
+    units = [[pieces[i], pieces[i + 1] if i + 1 < len(pieces) else ""] for i in range(0, len(pieces), 2)]
+    # Whitespace at the end of the document belongs to no paragraph
+    text = units[-1][0].rstrip()
+    units[-1] = [text, units[-1][0][len(text):]]
+    return units
+
+
+def numbered(units: list[list[str]]) -> list[int]:
+    """Positions of the non-blank paragraphs; paragraph n is at position `numbered(units)[n - 1]`."""
+    return [i for i, (text, _) in enumerate(units) if text.strip()]
+
+
+def number_paragraphs(document: str) -> str:
+    """The document as the scoped editor sees it, each paragraph prefixed with `[n]`."""
+    units = split_paragraphs(document)
+    return "\n\n".join(f"[{n}] {units[i][0]}" for n, i in enumerate(numbered(units), 1))
+
+
+def apply_patch(document: str, patch: DocumentPatch) -> tuple[str, list[int]]:
+    """
+    Applies a patch to the document it was made for.
+
+    Returns:
+        tuple: The revised document and the numbers of the paragraphs the patch replaced,
+            deleted or inserted after (0 for the start).
+
+    Raises:
+        PatchError: If an edit names a paragraph that does not exist, or a paragraph is
+            replaced or deleted more than once.
+    """
+    units = split_paragraphs(document)
+    positions = numbered(units)
+    changed: dict[int, Optional[str]] = {}
+    inserted: dict[int, list[str]] = {}
+    for edit in patch.edits:
+        text = edit.text.strip("\n")
+        if edit.action == "insert_after":
+            if not 0 <= edit.paragraph <= len(positions):
+                raise PatchError(f"cannot insert after paragraph {edit.paragraph}, the document has {len(positions)}")
+            inserted.setdefault(edit.paragraph, []).append(text)
+            continue
+        if not 1 <= edit.paragraph <= len(positions):
+            raise PatchError(f"paragraph {edit.paragraph} does not exist, the document has {len(positions)}")
+        if edit.paragraph in changed:
+            raise PatchError(f"paragraph {edit.paragraph} is edited more than once")
+        changed[edit.paragraph] = None if edit.action == "delete" else text
+
+    number_at = {i: n for n, i in enumerate(positions, 1)}
+    revised: list[list[str]] = [[text, "\n\n"] for text in inserted.get(0, [])]
+    for i, (text, separator) in enumerate(units):
+        n = number_at.get(i)
+        if n in changed:
+            text = changed[n]
+        # Paragraphs inserted after this one follow it even if it is deleted, and the
+        # last of them takes over its separator
+        paragraphs = ([] if text is None else [text]) + (inserted.get(n, []) if n else [])
+        for k, paragraph in enumerate(paragraphs, 1):
+            revised.append([paragraph, separator if k == len(paragraphs) else "\n\n"])
+
+    # Paragraphs that became adjacent to a deletion or insertion still need a break
+    # between them, and the document keeps its original ending
+    for unit in revised[:-1]:
+        if not PARAGRAPH_BREAK.fullmatch(unit[1]):
+            unit[1] = "\n\n"
+    if revised:
+        revised[-1][1] = units[-1][1]
+    return "".join(t + s for t, s in revised), sorted(set(changed) | set(inserted))
@@ -0,0 +1,396 @@
+"""
+Offline stand-in for the OpenAI chat model.
+
+`FakeChatModel` answers every agent of the pipeline with a response of the shape that
+agent expects, after a configurable delay, so the whole LangGraph pipeline can be run
+and load-tested without network access or API spend:
+
+- extractor agents: JSON keyed by the requested section titles, then TERMINATE
+- style extractor: style-guideline JSON, then TERMINATE
+- query agents (tools bound): a call of the bound tool, then an answer built from its result
+- drafting: a draft built from the provided content, then TERMINATE
+- section editor: {"title", "content"} JSON
+- editor: the document unchanged, then TERMINATE
+- scoped editor: {"edits"} JSON replacing the paragraph that best matches the question
+
+`FakeEmbeddings` replaces the HuggingFace embedding model, which would need a download.
+
+Select both with LLM_BACKEND=fake. The legacy AutoGen path needs an HTTP
+endpoint; `python -m core.fake_llm --port 8100` serves the same model as an
+OpenAI-compatible `/v1/chat/completions`, which `get_llm_config()` points at when
+LLM_BACKEND=fake.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+import uuid
+from typing import Any, AsyncIterator, Iterator, Optional
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessageChunk
+from langchain_core.messages import BaseMessage
+from langchain_core.messages import ToolMessage
+from langchain_core.messages import convert_to_messages
+from langchain_core.outputs import ChatGeneration
+from langchain_core.outputs import ChatGenerationChunk
+from langchain_core.outputs import ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from core.config.llm_config import FakeLlmConfig
+from core.utils.text_utils import count_tokens
+
+
+STYLE_GUIDELINES = {
+    "writing_style": {
+        "tone": "Professional and confident",
+        "voice": "Third person, company-centred",
+        "formality_level": "formal",
+        "technical_complexity": "medium"
+    },
+    "sentence_patterns": {
+        "average_length": "medium",
+        "complexity": "compound",
+        "voice_preference": "active"
+    },
+    "paragraph_style": {
+        "length": "medium",
+        "organization": "Topic sentence followed by supporting detail",
+        "transition_style": "Explicit connectives between ideas"
+    },
+    "language_patterns": {
+        "terminology": ["deliverables", "stakeholders", "scope", "milestones"],
+        "professional_language": "Plain business English with domain terms",
+        "industry_specific": ["consulting", "implementation"]
+    },
+    "formatting_preferences": {
+        "heading_style": "Title case headings",
+        "list_usage": "Bulleted lists for enumerations",
+        "emphasis_methods": "Bold for key terms"
+    },
+    "content_characteristics": {
+        "detail_level": "medium",
+        "evidence_usage": "Figures and client outcomes support claims",
+        "example_integration": "Short examples after each claim"
+    },
+    "document_structure": {
+        "section_organization": "Overview first, details after",
+        "flow_pattern": "General to specific",
+        "conclusion_style": "Brief summary with next steps"
+    }
+}
+
+
+def message_text(message: BaseMessage) -> str:
+    return message.text() if hasattr(message, "text") else str(message.content)
+
+
+def sentences(text: str) -> list[str]:
+    return [s.strip() for s in re.split(r"(?<=[.!?])\s+", " ".join(text.split())) if len(s.strip()) > 20]
+
+
+def between(text: str, start: str, end: str) -> Optional[str]:
+    """Text between the last `start` marker and the `end` marker after it; prompts may quote the markers earlier."""
+    if start in text:
+        return text.rsplit(start, 1)[1].split(end, 1)[0].strip()
+    return None
+
+
+def field(text: str, name: str) -> Optional[str]:
+    match = re.search(rf"^\s*{re.escape(name)}:[ \t]*(.+)$", text, re.MULTILINE)
+    return match.group(1).strip() if match else None
+
+
+def section_titles(prompt: str) -> list[str]:
+    """Titles listed under 'Section Titles:', up to the next blank line or document marker."""
+    titles = []
+    lines = prompt.split("Section Titles:", 1)[1].splitlines()[1:] if "Section Titles:" in prompt else []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("---"):
+            if titles:
+                break
+            continue
+        titles.append(line.lstrip("- ").strip())
+    return titles
+
+
+def company_name(text: str) -> str:
+    match = re.search(r"\b((?:[A-Z][\w&.-]+ ){0,3}[A-Z][\w&.-]+),? (?:Inc|LLC|Ltd|Corp|Corporation|Group)\b", text)
+    return match.group(1) if match else "Example Company"
+
+
+def draft(title: str, source: str, words: int) -> str:
+    """A deterministic draft of about `words` words reusing sentences of the source."""
+    pool = sentences(source) or [f"{title} is addressed in this section of the report."]
+    rng = random.Random(hashlib.sha256((title + source).encode("utf-8")).hexdigest())
+    paragraphs, paragraph, count = [], [], 0
+    while count < words:
+        sentence = rng.choice(pool)
+        paragraph.append(sentence)
+        count += len(sentence.split())
+        if len(paragraph) == 4:
+            paragraphs.append(" ".join(paragraph))
+            paragraph = []
+    if paragraph:
+        paragraphs.append(" ".join(paragraph))
+    return "\n\n".join(paragraphs)
+
+
+def respond(messages: list[BaseMessage], tools: Optional[list[dict]] = None, draft_words: int = 150) -> AIMessage:
+    """
+    Builds the response the pipeline expects for the given conversation.
+
+    Args:
+        messages: Conversation sent to the model.
+        tools: Bound tools in OpenAI format, if any.
+        draft_words: Length of generated drafts.
+
+    Returns:
+        AIMessage: Text response, or a tool call for query agents.
+    """
+    prompt = "\n".join(message_text(m) for m in messages)
+    last = messages[-1] if messages else None
+
+    if last is not None and isinstance(last, ToolMessage):
+        # ReAct loop after retrieval: hand the retrieved content back as the answer
+        return AIMessage(content=message_text(last))
+
+    if tools:
+        function = tools[0].get("function", tools[0])
+        properties = function.get("parameters", {}).get("properties", {}) or {"query": {}}
+        query = " ".join(filter(None, [
+            field(prompt, "Title"), field(prompt, "Objective"),
+            field(prompt, "Section Title"), field(prompt, "User's Editing Direction")
+        ])) or message_text(last)[:200]
+        return AIMessage(content="", tool_calls=[{
+            "name": function["name"],
+            "args": {next(iter(properties)): query},
+            "id": f"call_{hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:24]}"
+        }])
+
+    if "Style Extractor" in prompt:
+        return AIMessage(content=json.dumps(STYLE_GUIDELINES, indent=2))
+
+    if "Document Extractor Agent" in prompt:
+        document = between(prompt, "--- START DOCUMENT ---", "--- END DOCUMENT ---") or prompt
+        facts = sentences(document)
+        name = company_name(document)
+        extractions = {}
+        for title in section_titles(prompt):
+            words = {w for w in re.findall(r"[a-z]{4,}", title.lower())}
+            relevant = [s for s in facts if words & set(re.findall(r"[a-z]{4,}", s.lower()))] or facts
+            extractions[title] = {"Company Name": name, "Key Fact": relevant[0] if relevant else ""}
+        return AIMessage(content=json.dumps(extractions, indent=2))
+
+    if '"title" and "content"' in prompt:
+        title = field(prompt, "Section") or "Section"
+        original = between(prompt, f"Section: {title}\n", "**STRUCTURAL") or ""
+        references = between(prompt, "**RETRIEVED REFERENCE MATERIALS:**", "**CHANGE DIRECTION:**") or ""
+        length = field(prompt, "- Original section length")
+        words = int(re.sub(r"\D", "", length.split()[0]) or draft_words) if length else draft_words
+        content = draft(title, references or original.strip("` \n"), max(1, words))
+        return AIMessage(content=json.dumps({"title": title, "content": content}))
+
+    if '{"edits": [...]}' in prompt:
+        document = between(prompt, "--- DOCUMENT START ---", "--- DOCUMENT END ---") or ""
+        question = set(re.findall(r"[a-z]{4,}", prompt.rsplit("User's question:", 1)[-1].lower()))
+        paragraphs = [m.groups() for p in re.split(r"\n\n(?=\[\d+\] )", document)
+                      if (m := re.match(r"\[(\d+)\] (.*)", p, re.DOTALL))]
+        if not paragraphs:
+            return AIMessage(content=json.dumps({"edits": []}))
+        number, text = max(paragraphs, key=lambda p: len(question & set(re.findall(r"[a-z]{4,}", p[1].lower()))))
+        return AIMessage(content=json.dumps({"edits": [{"paragraph": int(number), "text": f"{text} (revised)"}]}))
+
+    if "document revision assistant" in prompt:
+        document = between(prompt, "--- DOCUMENT START ---", "--- DOCUMENT END ---") or ""
+        return AIMessage(content=f"{document}\n\nTERMINATE")
+
+    if "=== END OF SECTION ===" in prompt:
+        titles = re.findall(r"^\s*SECTION:\s*(.+)$", prompt, re.MULTILINE)
+        drafts = [f"{draft(t, prompt, draft_words)}\n=== END OF SECTION ===" for t in titles]
+        return AIMessage(content="\n\n".join(drafts) + "\nTERMINATE")
+
+    title = field(prompt, "Title") or field(prompt, "Section") or "Section"
+    content = prompt.split("# Content", 1)[1] if "# Content" in prompt else prompt
+    return AIMessage(content=f"{draft(title, content, draft_words)}\n\nTERMINATE")
+
+
+def with_usage(message: AIMessage, messages: list[BaseMessage], model_name: str) -> AIMessage:
+    """Adds the token usage and response metadata a provider reports, under the model the call was made with."""
+    output = message.text() + (json.dumps([c["args"] for c in message.tool_calls]) if message.tool_calls else "")
+    input_tokens = sum(count_tokens(message_text(m)) for m in messages)
+    output_tokens = count_tokens(output)
+    message.usage_metadata = {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": input_tokens + output_tokens
+    }
+    message.response_metadata = {"model_name": model_name, "finish_reason": "tool_calls" if message.tool_calls else "stop"}
+    return message
+
+
+def stream_pieces(text: str) -> list[str]:
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers with `respond()` after the delays of `config`: the
+    first token after `first_token_seconds`, then `tokens_per_second`.
+    """
+    config: FakeLlmConfig = FakeLlmConfig()
+    model_name: str = "fake-gpt-4.1"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {"model_name": self.model_name, **self.config.model_dump()}
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _respond(self, messages: list[BaseMessage], kwargs: dict) -> AIMessage:
+        return with_usage(respond(messages, kwargs.get("tools"), self.config.draft_words), messages, self.model_name)
+
+    def _generation_seconds(self, message: AIMessage) -> float:
+        tps = self.config.tokens_per_second
+        return message.usage_metadata["output_tokens"] / tps if tps else 0.0
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._respond(messages, kwargs)
+        time.sleep(self.config.first_token_seconds + self._generation_seconds(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._respond(messages, kwargs)
+        await asyncio.sleep(self.config.first_token_seconds + self._generation_seconds(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, message: AIMessage) -> Iterator[tuple[AIMessageChunk, float]]:
+        """Yields the stream chunks of a response with the delay before each."""
+        if message.tool_calls:
+            yield AIMessageChunk(content="", tool_call_chunks=[
+                {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+                for i, c in enumerate(message.tool_calls)
+            ]), self.config.first_token_seconds
+        else:
+            pieces = stream_pieces(message.text())
+            tps = self.config.tokens_per_second
+            for i, piece in enumerate(pieces):
+                delay = (count_tokens(piece) / tps if tps else 0.0) + (self.config.first_token_seconds if i == 0 else 0.0)
+                yield AIMessageChunk(content=piece), delay
+        yield AIMessageChunk(
+            content="",
+            usage_metadata=message.usage_metadata,
+            response_metadata=message.response_metadata
+        ), 0.0
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        for chunk, delay in self._chunks(self._respond(messages, kwargs)):
+            time.sleep(delay)
+            if run_manager and chunk.content:
+                run_manager.on_llm_new_token(chunk.text(), chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        for chunk, delay in self._chunks(self._respond(messages, kwargs)):
+            await asyncio.sleep(delay)
+            if run_manager and chunk.content:
+                await run_manager.on_llm_new_token(chunk.text(), chunk=ChatGenerationChunk(message=chunk))
+            yield ChatGenerationChunk(message=chunk)
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Hashed bag-of-words embeddings. Texts sharing words score higher, so retrieval still
+    ranks chunks by lexical overlap. A constant component lifts every cosine similarity
+    to at least 0.64, so the similarity thresholds of the RAG presets keep the top_k
+    best chunks instead of filtering everything out.
+    """
+
+    def __init__(self, size: int = 384):
+        self.size = size
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.size
+        for word in re.findall(r"[a-z0-9]{3,}", text.lower()):
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.size
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [0.6 * v / norm for v in vector] + [0.8]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+def create_app(config: Optional[FakeLlmConfig] = None):
+    """
+    OpenAI-compatible HTTP front end of `FakeChatModel` for clients that cannot take a
+    LangChain model, such as the AutoGen agents. Implements non-streaming
+    `POST /v1/chat/completions`.
+    """
+    from fastapi import FastAPI
+
+    model = FakeChatModel(config=config or FakeLlmConfig.from_env())
+    app = FastAPI(title="Fake LLM")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(body: dict[str, Any]):
+        messages = convert_to_messages(body.get("messages", []))
+        result = await model._agenerate(messages, tools=body.get("tools"))
+        message = result.generations[0].message
+        tool_calls = [
+            {"id": c["id"], "type": "function",
+             "function": {"name": c["name"], "arguments": json.dumps(c["args"])}}
+            for c in message.tool_calls
+        ]
+        usage = message.usage_metadata
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake-gpt-4.1"),
+            "choices": [{
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": message.text() or None,
+                    **({"tool_calls": tool_calls} if tool_calls else {})
+                },
+                "finish_reason": message.response_metadata["finish_reason"]
+            }],
+            "usage": {
+                "prompt_tokens": usage["input_tokens"],
+                "completion_tokens": usage["output_tokens"],
+                "total_tokens": usage["total_tokens"]
+            }
+        }
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the fake chat model as an OpenAI-compatible API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+    uvicorn.run(create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,251 @@
+from typing import Any
+from typing import AsyncIterator
+from typing import Iterator
+from typing import Optional
+import logging
+import time
 from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
-from langchain_core.rate_limiters import InMemoryRateLimiter
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.language_models.chat_models import generate_from_stream
+from langchain_core.messages import AIMessageChunk
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk
+from langchain_core.outputs import ChatResult
+from core.cassette import CassetteChatModel
+from core.cassette import cassette
+from core.concurrency import AdaptiveConcurrencyLimiter
+from core.concurrency import record_provider_call
+from core.config.llm_config import DeadlineConfig
+from core.config.llm_config import FakeLlmConfig
+from core.config.llm_config import LlmCacheConfig
+from core.config.llm_config import LlmRoutingConfig
+from core.config.llm_config import LlmSchedulerConfig
+from core.config.llm_config import SectionCacheConfig
+from core.config.llm_config import SectionConcurrencyConfig
+from core.config.llm_config import llm_backend
+from core.deadline import check as check_deadline
+from core.deadline import enforce
+from core.llm_cache import LlmResponseCache
+from core.llm_cache import cache_key
+from core.llm_scheduler import LlmScheduler
+from core.llm_scheduler import cached_prompt_tokens
+from core.section_cache import SectionDraftCache
+from core.utils.text_utils import count_tokens
 
 
 load_dotenv()
 
 
-rate_limiter = InMemoryRateLimiter(
-    requests_per_second=0.05
-)
+logger = logging.getLogger(__name__)
+
 
-model = init_chat_model(
-    "gpt-4.1",
-    temperature=0
+scheduler = LlmScheduler(LlmSchedulerConfig.from_env())
+deadlines = DeadlineConfig.from_env()
+# Section fan-out of all requests, backs off when the scheduler sees rate limit errors
+section_limiter = AdaptiveConcurrencyLimiter(
+    SectionConcurrencyConfig.from_env(),
+    rate_limits=lambda: scheduler.rate_limited
+)
+# Recording and replaying must see every call, so a cassette turns the response cache off
+cache = LlmResponseCache(
+    LlmCacheConfig.from_env().model_copy(update={"enabled": False}) if cassette else LlmCacheConfig.from_env()
 )
+section_cache = SectionDraftCache(
+    SectionCacheConfig.from_env().model_copy(update={"enabled": False}) if cassette else SectionCacheConfig.from_env()
+)
+
+
+def estimate_prompt_tokens(messages: list[BaseMessage]) -> int:
+    return sum(count_tokens(m.text()) for m in messages)
+
+
+def result_usage(result: ChatResult) -> Optional[dict[str, Any]]:
+    return getattr(result.generations[0].message, "usage_metadata", None) if result.generations else None
+
+
+def log_usage(model_name: str, usage: Optional[dict[str, Any]]):
+    """Logs the token usage of a single call, including prompt tokens read from the provider's prefix cache."""
+    if usage:
+        logger.info(
+            "%s call: %d prompt tokens (%d cached), %d completion tokens",
+            model_name, usage.get("input_tokens", 0), cached_prompt_tokens(usage), usage.get("output_tokens", 0)
+        )
+
+
+class ScheduledChatModel(BaseChatModel):
+    """
+    Chat model that runs every call of the wrapped model through the process-wide
+    `scheduler`, so all agents share one set of rate, token and concurrency limits.
+
+    Responses are kept in the on-disk `cache`; a repeated call with the same model,
+    parameters and messages is answered from disk without taking a scheduler slot.
+    Only calls answered by the provider count towards the latency the section
+    concurrency limit adapts to, see `core.concurrency.record_provider_call`.
+
+    Tool binding is re-pointed at this wrapper, so ReAct agents built with
+    `create_react_agent(core.llm.model, ...)` stay scheduled too.
+
+    Async calls are cancelled at the request deadline (see `core.deadline`), waiting
+    for a scheduler slot included, and after `deadlines.call_seconds` once admitted.
+    Sync calls only refuse to start after the deadline.
+    """
+    inner: BaseChatModel
+
+    @property
+    def _llm_type(self) -> str:
+        return f"scheduled-{self.inner._llm_type}"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return self.inner._identifying_params
+
+    def _get_ls_params(self, stop: Optional[list[str]] = None, **kwargs: Any):
+        return self.inner._get_ls_params(stop=stop, **kwargs)
+
+    def bind_tools(self, tools, **kwargs):
+        bound = self.inner.bind_tools(tools, **kwargs)
+        return self.bind(**bound.kwargs)
+
+    def _inner_streams(self) -> bool:
+        return type(self.inner)._stream is not BaseChatModel._stream
+
+    def _model_name(self) -> str:
+        params = self._identifying_params
+        return str(params.get("model_name") or params.get("model") or self.inner._llm_type)
+
+    def _cache_key(self, messages: list[BaseMessage], stop: Optional[list[str]], kwargs: dict) -> str:
+        return cache_key(self._identifying_params, messages, stop=stop, **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        check_deadline()
+        key = self._cache_key(messages, stop, kwargs)
+        cached = cache.lookup(key)
+        if cached:
+            return cached
+        with scheduler.slot(estimate_prompt_tokens(messages)) as grant:
+            started = time.monotonic()
+            result = self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            record_provider_call(time.monotonic() - started)
+            grant.record_usage(result_usage(result))
+        log_usage(self._model_name(), result_usage(result))
+        cache.update(key, self._model_name(), result)
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key = self._cache_key(messages, stop, kwargs)
+        cached = await cache.alookup(key)
+        if cached:
+            return cached
+        async with enforce(), scheduler.aslot(estimate_prompt_tokens(messages)) as grant, enforce(deadlines.call_seconds):
+            started = time.monotonic()
+            result = await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            record_provider_call(time.monotonic() - started)
+            grant.record_usage(result_usage(result))
+        log_usage(self._model_name(), result_usage(result))
+        await cache.aupdate(key, self._model_name(), result)
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        check_deadline()
+        if not self._inner_streams():
+            result = self._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            yield as_chunk(result)
+            return
+        key = self._cache_key(messages, stop, kwargs)
+        cached = cache.lookup(key)
+        if cached:
+            yield as_chunk(cached)
+            return
+        chunks = []
+        with scheduler.slot(estimate_prompt_tokens(messages)) as grant:
+            started = time.monotonic()
+            for chunk in self.inner._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                if chunk.message.usage_metadata:
+                    grant.record_usage(chunk.message.usage_metadata)
+                    log_usage(self._model_name(), chunk.message.usage_metadata)
+                chunks.append(chunk)
+                yield chunk
+            record_provider_call(time.monotonic() - started)
+        if chunks:
+            cache.update(key, self._model_name(), generate_from_stream(iter(chunks)))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        if not self._inner_streams():
+            result = await self._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            yield as_chunk(result)
+            return
+        key = self._cache_key(messages, stop, kwargs)
+        cached = await cache.alookup(key)
+        if cached:
+            yield as_chunk(cached)
+            return
+        chunks = []
+        async with enforce(), scheduler.aslot(estimate_prompt_tokens(messages)) as grant, enforce(deadlines.call_seconds):
+            started = time.monotonic()
+            async for chunk in self.inner._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                if chunk.message.usage_metadata:
+                    grant.record_usage(chunk.message.usage_metadata)
+                    log_usage(self._model_name(), chunk.message.usage_metadata)
+                chunks.append(chunk)
+                yield chunk
+            record_provider_call(time.monotonic() - started)
+        if chunks:
+            await cache.aupdate(key, self._model_name(), generate_from_stream(iter(chunks)))
+
+
+def as_chunk(result: ChatResult) -> ChatGenerationChunk:
+    """Turn a complete result into a single stream chunk, for models that cannot stream."""
+    message = result.generations[0].message
+    return ChatGenerationChunk(message=AIMessageChunk(
+        content=message.content,
+        additional_kwargs=message.additional_kwargs,
+        response_metadata=message.response_metadata,
+        tool_calls=getattr(message, "tool_calls", []),
+        usage_metadata=getattr(message, "usage_metadata", None),
+        id=message.id
+    ))
+
+
+def create_provider_model(model_name: str) -> BaseChatModel:
+    """The provider model selected by LLM_BACKEND."""
+    if llm_backend() == "fake":
+        from core.fake_llm import FakeChatModel
+        logger.info("Using the offline fake chat model for %s", model_name)
+        return FakeChatModel(config=FakeLlmConfig.from_env(), model_name=f"fake-{model_name}")
+    return init_chat_model(
+        model_name,
+        temperature=0,
+        stream_usage=True
+    )
+
+
+def create_inner_model(model_name: str) -> BaseChatModel:
+    """The provider model, recorded to or replayed from the cassette if one is configured."""
+    if cassette and cassette.replaying:
+        return CassetteChatModel(cassette=cassette, model_name=model_name)
+    if cassette:
+        return CassetteChatModel(cassette=cassette, inner=create_provider_model(model_name), model_name=model_name)
+    return create_provider_model(model_name)
+
+
+routing = LlmRoutingConfig.from_env()
+_models: dict[str, ScheduledChatModel] = {}
+
+
+def model_named(model_name: str) -> ScheduledChatModel:
+    """The scheduled model for a provider model name, created once per process."""
+    if model_name not in _models:
+        _models[model_name] = ScheduledChatModel(inner=create_inner_model(model_name))
+    return _models[model_name]
+
+
+def get_model(role: str) -> ScheduledChatModel:
+    """
+    The model an agent role is routed to (see `LlmRoutingConfig`), e.g.
+    `get_model("query")` for the retriever query agents.
+    """
+    return model_named(routing.model_for(role))
+
+
+model = model_named(routing.default_model)
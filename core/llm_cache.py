@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Optional
+from langchain_core.messages import BaseMessage
+from langchain_core.messages import messages_from_dict
+from langchain_core.messages import message_to_dict
+from langchain_core.outputs import ChatGeneration
+from langchain_core.outputs import ChatResult
+from core.config.llm_config import LlmCacheConfig
+
+
+logger = logging.getLogger(__name__)
+
+
+_bypass: ContextVar[bool] = ContextVar("llm_cache_bypass", default=False)
+
+
+@contextmanager
+def bypass(enabled: bool = True):
+    """
+    Skip the response cache for the enclosed model calls, e.g. for a request that
+    asks for fresh answers. Fresh responses still replace the cached ones.
+    """
+    token = _bypass.set(enabled)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def bypassed() -> bool:
+    """Whether the current context asked for fresh answers with `bypass`."""
+    return _bypass.get()
+
+
+def normalize_message(message: BaseMessage) -> dict[str, Any]:
+    """
+    Reduces a message to what the model actually sees. Run ids, response metadata
+    and usage counts differ between otherwise identical conversations and are dropped,
+    whitespace at line ends and around the text is ignored.
+    """
+    content = message.content
+    if isinstance(content, str):
+        content = "\n".join(line.rstrip() for line in content.strip().splitlines())
+    normalized = {"type": message.type, "content": content}
+    if message.name:
+        normalized["name"] = message.name
+    if getattr(message, "tool_calls", None):
+        normalized["tool_calls"] = [
+            {"name": c["name"], "args": c["args"], "id": c.get("id")} for c in message.tool_calls
+        ]
+    if getattr(message, "tool_call_id", None):
+        normalized["tool_call_id"] = message.tool_call_id
+    return normalized
+
+
+def cache_key(model_params: dict[str, Any], messages: list[BaseMessage], **call_params) -> str:
+    """
+    Hash of the model identity, its call parameters (stop words, bound tools,
+    response format, ...) and the normalized messages.
+    """
+    payload = {
+        "model": model_params,
+        "params": {k: v for k, v in call_params.items() if v is not None},
+        "messages": [normalize_message(m) for m in messages],
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def serialize_result(result: ChatResult) -> str:
+    return json.dumps({
+        "messages": [message_to_dict(g.message) for g in result.generations],
+        "generation_info": [g.generation_info for g in result.generations],
+        "llm_output": result.llm_output,
+    }, default=str)
+
+
+def deserialize_result(value: str) -> ChatResult:
+    data = json.loads(value)
+    messages = messages_from_dict(data["messages"])
+    return ChatResult(
+        generations=[
+            ChatGeneration(message=m, generation_info=info)
+            for m, info in zip(messages, data["generation_info"])
+        ],
+        llm_output=data["llm_output"]
+    )
+
+
+class LlmResponseCache:
+    """
+    Persistent cache of chat model responses in a SQLite file.
+
+    Entries are evicted least recently used first once the stored responses grow
+    beyond `max_megabytes`. Hit, miss and bypass counts are kept for the life of
+    the process and reported by `stats()`.
+    """
+
+    def __init__(self, config: LlmCacheConfig):
+        self.config = config
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._counters = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0}
+
+    @property
+    def max_bytes(self) -> int:
+        return int(self.config.max_megabytes * 1024 * 1024)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Must hold the lock. Opens the database on first use."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.config.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.config.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_used REAL NOT NULL,"
+                " hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self._conn.commit()
+        return self._conn
+
+    def lookup(self, key: str) -> Optional[ChatResult]:
+        if not self.config.enabled:
+            return None
+        with self._lock:
+            if _bypass.get():
+                self._counters["bypassed"] += 1
+                return None
+            conn = self._connection()
+            row = conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+            conn.execute(
+                "UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                (time.time(), key)
+            )
+            conn.commit()
+            self._counters["hits"] += 1
+        result = deserialize_result(row[0])
+        for generation in result.generations:
+            generation.message.response_metadata["cache_hit"] = True
+        return result
+
+    async def alookup(self, key: str) -> Optional[ChatResult]:
+        """`lookup` in a worker thread, so the read and the hit's LRU update stay off the event loop."""
+        if not self.config.enabled:
+            return None
+        return await asyncio.to_thread(self.lookup, key)
+
+    def update(self, key: str, model: str, result: ChatResult):
+        if not self.config.enabled:
+            return
+        value = serialize_result(result)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, value, size, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, value, len(value.encode("utf-8")), now, now)
+            )
+            self._counters["stores"] += 1
+            self._evict(conn)
+            conn.commit()
+
+    async def aupdate(self, key: str, model: str, result: ChatResult):
+        """`update` in a worker thread."""
+        if self.config.enabled:
+            await asyncio.to_thread(self.update, key, model, result)
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Must hold the lock. Drops least recently used entries until under the size limit."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._counters["evictions"] += evicted
+        logger.info(f"LLM cache evicted {evicted} response(s), {total} bytes remain")
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            entries, size = (0, 0)
+            if self.config.enabled:
+                entries, size = self._connection().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+                ).fetchone()
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "enabled": self.config.enabled,
+        }
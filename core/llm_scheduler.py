@@ -0,0 +1,270 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Optional
+from core.config.llm_config import LlmSchedulerConfig
+
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """
+    Priority classes for model calls. Lower values are admitted first.
+
+    INTERACTIVE is for user-facing edits such as `/documents/chat/`, BATCH for
+    report generation, DEFAULT for everything that does not say.
+    """
+    INTERACTIVE = 0
+    DEFAULT = 1
+    BATCH = 2
+
+
+_current_priority: ContextVar[Priority] = ContextVar("llm_priority", default=Priority.DEFAULT)
+
+
+@contextmanager
+def priority(level: Priority):
+    """
+    Run the enclosed model calls under the given priority class.
+
+    The priority is carried by a context variable, so it follows asyncio tasks
+    and the executor threads LangGraph runs synchronous nodes in.
+    """
+    token = _current_priority.set(level)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def current_priority() -> Priority:
+    return _current_priority.get()
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Whether a model call failed because the provider throttled it (HTTP 429)."""
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def cached_prompt_tokens(usage: Optional[dict[str, Any]]) -> int:
+    """Prompt tokens the provider served from its prompt-prefix cache, per the response's usage metadata."""
+    details = (usage or {}).get("input_token_details") or {}
+    return details.get("cache_read") or 0
+
+
+class _Waiter:
+    """A queued model call. Sync waiters block on a threading.Event, async ones on an asyncio.Event."""
+
+    def __init__(self, level: Priority, seq: int, tokens: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.level = level
+        self.seq = seq
+        self.tokens = tokens
+        self.loop = loop
+        self.enqueued = time.monotonic()
+        self.event = asyncio.Event() if loop else threading.Event()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.level, self.seq) < (other.level, other.seq)
+
+    def wake(self):
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.event.set)
+        else:
+            self.event.set()
+
+
+class Grant:
+    """An admitted model call. Report the real token usage so the per-minute budget stays accurate."""
+
+    def __init__(self, scheduler: "LlmScheduler", window_entry: list):
+        self._scheduler = scheduler
+        self._window_entry = window_entry
+
+    def record_usage(self, usage: Optional[dict[str, Any]]):
+        """
+        Args:
+            usage: The `usage_metadata` of the response, if the provider reported it.
+        """
+        if usage:
+            self._window_entry[1] = usage["total_tokens"]
+            self._scheduler._record_usage(usage)
+
+
+class LlmScheduler:
+    """
+    Admission control shared by every model call in the process.
+
+    Calls queue by priority class (FIFO within a class) and the head of the queue
+    is admitted once it fits under all limits: `max_in_flight` concurrent calls,
+    `requests_per_second` (token bucket) and `tokens_per_minute` (rolling window,
+    charged with an estimate up front and corrected once usage is reported).
+    Works from both threads and event loops.
+    """
+
+    def __init__(self, config: LlmSchedulerConfig):
+        self.config = config
+        self._lock = threading.Lock()
+        self._queue: list[_Waiter] = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._bucket = max(1.0, config.requests_per_second)
+        self._bucket_updated = time.monotonic()
+        self._token_window: deque[list] = deque()
+        self._admitted = 0
+        self._total_wait = 0.0
+        self.rate_limited = 0
+        self._usage = {"prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "queued": len(self._queue),
+                "queued_by_priority": {
+                    p.name.lower(): sum(1 for w in self._queue if w.level == p) for p in Priority
+                },
+                "admitted": self._admitted,
+                "rate_limited": self.rate_limited,
+                "mean_wait_seconds": round(self._total_wait / self._admitted, 4) if self._admitted else 0.0,
+                "tokens_last_minute": self._tokens_in_window(time.monotonic()),
+                **self._usage,
+                "prompt_cache_rate": round(self._usage["cached_prompt_tokens"] / self._usage["prompt_tokens"], 4)
+                if self._usage["prompt_tokens"] else 0.0,
+                "limits": self.config.model_dump(),
+            }
+
+    def _tokens_in_window(self, now: float) -> int:
+        while self._token_window and self._token_window[0][0] <= now - 60:
+            self._token_window.popleft()
+        return sum(tokens for _, tokens in self._token_window)
+
+    def _admission_delay(self, waiter: _Waiter) -> Optional[float]:
+        """
+        Must hold the lock. Returns 0 and admits the waiter if it can start now,
+        the seconds until a rate limit frees up, or None to wait for a wake-up.
+        """
+        if self._queue[0] is not waiter or self._in_flight >= self.config.max_in_flight:
+            return None
+
+        now = time.monotonic()
+        delay = 0.0
+
+        rps = self.config.requests_per_second
+        if rps:
+            self._bucket = min(max(1.0, rps), self._bucket + (now - self._bucket_updated) * rps)
+            self._bucket_updated = now
+            if self._bucket < 1.0:
+                delay = (1.0 - self._bucket) / rps
+
+        tpm = self.config.tokens_per_minute
+        if tpm:
+            used = self._tokens_in_window(now)
+            if used and used + waiter.tokens > tpm:
+                delay = max(delay, self._token_window[0][0] + 60 - now)
+
+        if delay > 0:
+            return delay
+
+        if rps:
+            self._bucket -= 1.0
+        heapq.heappop(self._queue)
+        self._in_flight += 1
+        self._admitted += 1
+        self._total_wait += now - waiter.enqueued
+        self._wake_all()
+        return 0.0
+
+    def _wake_all(self):
+        for w in self._queue:
+            w.wake()
+
+    def _enqueue(self, tokens: int, loop=None) -> _Waiter:
+        waiter = _Waiter(current_priority(), next(self._seq), tokens, loop)
+        with self._lock:
+            heapq.heappush(self._queue, waiter)
+        return waiter
+
+    def _admit(self, waiter: _Waiter) -> Grant:
+        entry = [time.monotonic(), waiter.tokens + self.config.completion_token_estimate]
+        self._token_window.append(entry)
+        return Grant(self, entry)
+
+    def _record_usage(self, usage: dict[str, Any]):
+        with self._lock:
+            self._usage["prompt_tokens"] += usage.get("input_tokens", 0)
+            self._usage["cached_prompt_tokens"] += cached_prompt_tokens(usage)
+            self._usage["completion_tokens"] += usage.get("output_tokens", 0)
+
+    def _cancel(self, waiter: _Waiter):
+        with self._lock:
+            if waiter in self._queue:
+                self._queue.remove(waiter)
+                heapq.heapify(self._queue)
+                self._wake_all()
+
+    def _release(self, error: Optional[BaseException] = None):
+        with self._lock:
+            self._in_flight -= 1
+            if error is not None and is_rate_limit_error(error):
+                self.rate_limited += 1
+            self._wake_all()
+
+    @contextmanager
+    def slot(self, prompt_tokens: int = 0):
+        """Block the calling thread until the call may start; release on exit."""
+        waiter = self._enqueue(prompt_tokens)
+        try:
+            while True:
+                with self._lock:
+                    delay = self._admission_delay(waiter)
+                    if delay == 0:
+                        grant = self._admit(waiter)
+                        break
+                    waiter.event.clear()
+                waiter.event.wait(timeout=delay)
+        except BaseException:
+            self._cancel(waiter)
+            raise
+        try:
+            yield grant
+        except BaseException as e:
+            self._release(e)
+            raise
+        else:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, prompt_tokens: int = 0):
+        """Wait without blocking the event loop until the call may start; release on exit."""
+        waiter = self._enqueue(prompt_tokens, asyncio.get_running_loop())
+        try:
+            while True:
+                with self._lock:
+                    delay = self._admission_delay(waiter)
+                    if delay == 0:
+                        grant = self._admit(waiter)
+                        break
+                    waiter.event.clear()
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._cancel(waiter)
+            raise
+        try:
+            yield grant
+        except BaseException as e:
+            self._release(e)
+            raise
+        else:
+            self._release()
@@ -0,0 +1,275 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Optional
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from core.llm_scheduler import cached_prompt_tokens
+
+
+logger = logging.getLogger(__name__)
+
+
+SECTION_METADATA_KEY = "section"
+# Custom callback event dispatched when a template section is drafted, see `UsageAccountant`
+SECTION_DRAFTED_EVENT = "section_drafted"
+
+
+# USD per million prompt, cached prompt and completion tokens
+MODEL_PRICES: dict[str, tuple[float, float, float]] = {
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+}
+
+
+def empty_usage() -> dict[str, Any]:
+    return {
+        "calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_prompt_tokens": 0,
+        "cache_hits": 0,
+        "retries": 0,
+        "errors": 0,
+        "cost_usd": 0.0,
+        "llm_seconds": 0.0,
+        "wall_seconds": 0.0,
+    }
+
+
+def add_usage(total: dict[str, Any], usage: dict[str, Any]):
+    for key, value in usage.items():
+        total[key] = round(total.get(key, 0) + value, 6) if isinstance(value, float) else total.get(key, 0) + value
+
+
+def model_prices(model_name: Optional[str]) -> Optional[tuple[float, float, float]]:
+    """
+    Prices of a model, matched by the longest known name it starts with, so dated
+    snapshots ("gpt-4.1-mini-2025-04-14") and the offline stand-ins ("fake-gpt-4.1")
+    are priced like the model they stand for.
+    """
+    if not model_name:
+        return None
+    name = model_name.removeprefix("fake-")
+    known = [k for k in MODEL_PRICES if name == k or name.startswith(f"{k}-")]
+    return MODEL_PRICES[max(known, key=len)] if known else None
+
+
+def call_cost(model_name: Optional[str], prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> float:
+    """Estimated USD cost of one call, 0.0 for models without known prices."""
+    prices = model_prices(model_name)
+    if prices is None:
+        return 0.0
+    prompt, cached, completion = prices
+    return ((prompt_tokens - cached_tokens) * prompt + cached_tokens * cached
+            + completion_tokens * completion) / 1_000_000
+
+
+def top_level_node(metadata: dict[str, Any]) -> Optional[str]:
+    """
+    The node of the outermost graph a run belongs to. Runs of subgraphs and of agents
+    invoked inside a node carry that node as the first segment of their checkpoint namespace.
+    """
+    namespace = metadata.get("langgraph_checkpoint_ns") or ""
+    if namespace:
+        return namespace.split("|")[0].split(":")[0]
+    return metadata.get("langgraph_node")
+
+
+class UsageAccountant(BaseCallbackHandler):
+    """
+    Callback handler that accounts model usage of one request per graph node and per
+    template section.
+
+    Every model call is attributed to the top-level graph node it ran in, to the model
+    it was routed to and, when the run carries a "section" metadata entry, to that
+    section. Per call it records prompt, completion and provider-cached prompt tokens,
+    their estimated cost (`MODEL_PRICES`) and latency; response-cache hits are counted
+    instead of their tokens. Node and section wall time is measured from the
+    start and end of their runs. Drafted sections (`SECTION_DRAFTED_EVENT`) are timed
+    from the start of the request, the first of them as the time to first section.
+
+    Pass it in the `callbacks` of the graph config and read `report()` afterwards.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self._finished: Optional[float] = None
+        self._llm_runs: dict[UUID, tuple[float, Optional[str], Optional[str], Optional[str]]] = {}
+        self._chain_runs: dict[UUID, tuple[float, str, str]] = {}
+        self._section_runs: dict[UUID, Optional[str]] = {}
+        self._nodes: dict[str, dict[str, Any]] = {}
+        self._sections: dict[str, dict[str, Any]] = {}
+        self._models: dict[str, dict[str, Any]] = {}
+        self._ready: dict[str, float] = {}
+
+    def _usage_for(self, node: Optional[str], section: Optional[str],
+                   model_name: Optional[str] = None) -> list[dict[str, Any]]:
+        targets = [self._nodes.setdefault(node or "other", empty_usage())]
+        if model_name:
+            targets.append(self._models.setdefault(model_name, empty_usage()))
+        if section:
+            targets.append(self._sections.setdefault(section, empty_usage()))
+        return targets
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, parent_run_id=None,
+                            tags=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        with self._lock:
+            self._llm_runs[run_id] = (
+                time.perf_counter(), top_level_node(metadata), metadata.get(SECTION_METADATA_KEY),
+                metadata.get("ls_model_name")
+            )
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        with self._lock:
+            if run_id not in self._llm_runs:
+                return
+            start, node, section, model_name = self._llm_runs.pop(run_id)
+            generation = response.generations[0][0] if response.generations and response.generations[0] else None
+            message = getattr(generation, "message", None)
+            usage = getattr(message, "usage_metadata", None) or {}
+            cache_hit = bool(message is not None and message.response_metadata.get("cache_hit"))
+            call = {
+                "calls": 1,
+                "llm_seconds": time.perf_counter() - start,
+                "cache_hits": int(cache_hit),
+            }
+            if not cache_hit:
+                call["prompt_tokens"] = usage.get("input_tokens", 0)
+                call["completion_tokens"] = usage.get("output_tokens", 0)
+                call["cached_prompt_tokens"] = cached_prompt_tokens(usage)
+                call["cost_usd"] = call_cost(
+                    model_name, call["prompt_tokens"], call["cached_prompt_tokens"], call["completion_tokens"]
+                )
+            for target in self._usage_for(node, section, model_name):
+                add_usage(target, call)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        with self._lock:
+            if run_id not in self._llm_runs:
+                return
+            start, node, section, model_name = self._llm_runs.pop(run_id)
+            for target in self._usage_for(node, section, model_name):
+                add_usage(target, {"errors": 1, "llm_seconds": time.perf_counter() - start})
+
+    def on_retry(self, retry_state, *, run_id: UUID, parent_run_id=None, **kwargs):
+        with self._lock:
+            node, section = None, None
+            if parent_run_id in self._chain_runs:
+                _, kind, name = self._chain_runs[parent_run_id]
+                node, section = (name, None) if kind == "node" else (None, name)
+            for target in self._usage_for(node, section):
+                add_usage(target, {"retries": 1})
+
+    def on_custom_event(self, name: str, data: Any, *, run_id: UUID, tags=None, metadata=None, **kwargs):
+        if name != SECTION_DRAFTED_EVENT:
+            return
+        with self._lock:
+            self._ready.setdefault(data["title"], time.perf_counter() - self._started)
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id=None,
+                       tags=None, metadata=None, **kwargs):
+        metadata = metadata or {}
+        name = kwargs.get("name")
+        section = metadata.get(SECTION_METADATA_KEY)
+        with self._lock:
+            self._section_runs[run_id] = section
+            if (name and name == metadata.get("langgraph_node")
+                    and "|" not in (metadata.get("langgraph_checkpoint_ns") or "")):
+                self._chain_runs[run_id] = (time.perf_counter(), "node", name)
+            elif section and self._section_runs.get(parent_run_id) != section:
+                # Outermost run of a section, e.g. its section graph
+                self._chain_runs[run_id] = (time.perf_counter(), "section", section)
+
+    def _end_chain(self, run_id: UUID):
+        with self._lock:
+            self._section_runs.pop(run_id, None)
+            if run_id not in self._chain_runs:
+                return
+            start, kind, name = self._chain_runs.pop(run_id)
+            target = self._nodes if kind == "node" else self._sections
+            add_usage(target.setdefault(name, empty_usage()), {"wall_seconds": time.perf_counter() - start})
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs):
+        self._end_chain(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        self._end_chain(run_id)
+
+    def finish(self):
+        self._finished = time.perf_counter()
+
+    def report(self) -> dict[str, Any]:
+        """
+        Returns:
+            dict: "total", "nodes", "models" and "sections", each with calls, prompt_tokens,
+            completion_tokens, cached_prompt_tokens, cache_hits, retries, errors,
+            cost_usd, llm_seconds and wall_seconds. Drafted sections also have
+            ready_seconds, the time from the start of the request until they were
+            drafted, and "first_section_seconds" is the earliest of these, None if no
+            section was drafted.
+        """
+        with self._lock:
+            nodes = {k: dict(v) for k, v in self._nodes.items()}
+            models = {k: dict(v) for k, v in self._models.items()}
+            sections = {k: dict(v) for k, v in self._sections.items()}
+            ready = dict(self._ready)
+        for title, seconds in ready.items():
+            sections.setdefault(title, empty_usage())["ready_seconds"] = round(seconds, 4)
+        total = empty_usage()
+        for usage in nodes.values():
+            add_usage(total, {k: v for k, v in usage.items() if k != "wall_seconds"})
+        total["wall_seconds"] = round((self._finished or time.perf_counter()) - self._started, 4)
+        return {
+            "total": total,
+            "nodes": nodes,
+            "models": models,
+            "sections": sections,
+            "first_section_seconds": round(min(ready.values()), 4) if ready else None
+        }
+
+
+class MetricsRegistry:
+    """
+    Process-wide aggregate of the per-request usage reports, served by the metrics
+    endpoint. Keeps cumulative totals per endpoint, node and model and the most recent reports.
+    """
+
+    def __init__(self, recent: int = 20):
+        self._lock = threading.Lock()
+        self._requests: dict[str, int] = {}
+        self._totals: dict[str, dict[str, Any]] = {}
+        self._nodes: dict[str, dict[str, dict[str, Any]]] = {}
+        self._models: dict[str, dict[str, Any]] = {}
+        self._recent: deque = deque(maxlen=recent)
+
+    def record(self, endpoint: str, report: dict[str, Any]):
+        with self._lock:
+            self._requests[endpoint] = self._requests.get(endpoint, 0) + 1
+            add_usage(self._totals.setdefault(endpoint, empty_usage()), report["total"])
+            nodes = self._nodes.setdefault(endpoint, {})
+            for node, usage in report["nodes"].items():
+                add_usage(nodes.setdefault(node, empty_usage()), usage)
+            for model_name, usage in report.get("models", {}).items():
+                add_usage(self._models.setdefault(model_name, empty_usage()), usage)
+            self._recent.append({"endpoint": endpoint, "finished_at": time.time(), **report})
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": dict(self._requests),
+                "totals": {k: dict(v) for k, v in self._totals.items()},
+                "nodes": {k: {n: dict(u) for n, u in v.items()} for k, v in self._nodes.items()},
+                "models": {k: dict(v) for k, v in self._models.items()},
+                "recent": list(self._recent),
+            }
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+from core.config.llm_config import SectionCacheConfig
+from core.llm_cache import bypassed
+
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def section_cache_key(
+        title: str,
+        instructions: Optional[dict[str, Any]],
+        chunk_ids: list[str],
+        style_guidance: str,
+        model_config: dict[str, Any]
+) -> str:
+    """
+    Hash of everything a section draft depends on: its title and instructions, the ids
+    of the source chunks it is drafted from, the style guidance and the models and
+    prompts that draft it.
+    """
+    payload = {
+        "title": title,
+        "instructions": instructions,
+        "chunks": chunk_ids,
+        "style": fingerprint(style_guidance),
+        "model": model_config,
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class SectionDraftCache:
+    """
+    Persistent cache of drafted sections in a SQLite file, so a report generated again
+    after a small change only drafts the sections whose inputs changed.
+
+    Entries are evicted least recently used first once the stored drafts grow beyond
+    `max_megabytes`. Inside `core.llm_cache.bypass` lookups are skipped, fresh drafts
+    still replace the cached ones.
+    """
+
+    def __init__(self, config: SectionCacheConfig):
+        self.config = config
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._counters = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0}
+
+    @property
+    def max_bytes(self) -> int:
+        return int(self.config.max_megabytes * 1024 * 1024)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Must hold the lock. Opens the database on first use."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.config.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.config.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sections ("
+                " key TEXT PRIMARY KEY,"
+                " title TEXT NOT NULL,"
+                " content TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_used REAL NOT NULL,"
+                " hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sections_last_used ON sections (last_used)")
+            self._conn.commit()
+        return self._conn
+
+    def lookup(self, key: str) -> Optional[str]:
+        if not self.config.enabled:
+            return None
+        with self._lock:
+            if bypassed():
+                self._counters["bypassed"] += 1
+                return None
+            conn = self._connection()
+            row = conn.execute("SELECT content FROM sections WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+            conn.execute(
+                "UPDATE sections SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                (time.time(), key)
+            )
+            conn.commit()
+            self._counters["hits"] += 1
+        return row[0]
+
+    def update(self, key: str, title: str, content: str):
+        if not self.config.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO sections (key, title, content, size, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, title, content, len(content.encode("utf-8")), now, now)
+            )
+            self._counters["stores"] += 1
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Must hold the lock. Drops least recently used drafts until under the size limit."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM sections").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM sections ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM sections WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._counters["evictions"] += evicted
+        logger.info(f"Section cache evicted {evicted} draft(s), {total} bytes remain")
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM sections")
+            conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            entries, size = (0, 0)
+            if self.config.enabled:
+                entries, size = self._connection().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sections"
+                ).fetchone()
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "enabled": self.config.enabled,
+        }
@@ -0,0 +1,89 @@
+from typing import Any, NamedTuple
+
+
+class SectionDependencyError(ValueError):
+    """A template whose `depends_on` names an unknown or ambiguous section, or forms a cycle."""
+
+
+class SectionNode(NamedTuple):
+    """
+    A section of a template in drafting order (each section before its subsections).
+
+    Attributes:
+        key (str): The section's key in its parent's `subsections` or in the template.
+        depends_on (list[str]): Keys of the sections whose drafts this section is written from.
+        descendants (int): Number of subsections at any depth; they directly follow the section.
+    """
+    key: str
+    depends_on: list[str]
+    descendants: int
+
+
+def template_nodes(sections: dict[str, Any]) -> list[SectionNode]:
+    """The sections of a template as loaded from its JSON file, in drafting order."""
+    nodes = []
+    for key, section in sections.items():
+        subsections = template_nodes(section.get("subsections") or {})
+        nodes.append(SectionNode(key, list(section.get("depends_on") or []), len(subsections)))
+        nodes.extend(subsections)
+    return nodes
+
+
+def resolve_dependencies(nodes: list[SectionNode]) -> list[list[int]]:
+    """
+    Positions of the sections each section is written from, in drafting order. Depending
+    on a section means depending on its subsections as well, so a section can be written
+    from a whole chapter.
+
+    Raises:
+        SectionDependencyError: If a dependency names no section or several sections.
+    """
+    positions: dict[str, list[int]] = {}
+    for i, node in enumerate(nodes):
+        positions.setdefault(node.key, []).append(i)
+
+    resolved = []
+    for node in nodes:
+        upstream = set()
+        for key in node.depends_on:
+            match positions.get(key):
+                case None:
+                    raise SectionDependencyError(f"Section {node.key!r} depends on unknown section {key!r}")
+                case [j]:
+                    upstream.update(range(j, j + nodes[j].descendants + 1))
+                case _:
+                    raise SectionDependencyError(
+                        f"Section {node.key!r} depends on {key!r}, which names {len(positions[key])} sections"
+                    )
+        resolved.append(sorted(upstream))
+    return resolved
+
+
+def dependency_waves(nodes: list[SectionNode]) -> list[list[int]]:
+    """
+    Groups sections into waves: every section only depends on sections of earlier waves,
+    and each section is in the earliest wave it can be.
+
+    Args:
+        nodes: The template's sections, see `template_nodes`
+
+    Returns:
+        list[list[int]]: Positions in `nodes` of the sections of each wave.
+
+    Raises:
+        SectionDependencyError: If a dependency names no section or several sections, or
+            the dependencies form a cycle.
+    """
+    upstream = [set(u) for u in resolve_dependencies(nodes)]
+    waves = []
+    done: set[int] = set()
+    remaining = set(range(len(nodes)))
+    while remaining:
+        wave = sorted(i for i in remaining if upstream[i] <= done)
+        if not wave:
+            cycle = ", ".join(sorted({nodes[i].key for i in remaining}))
+            raise SectionDependencyError(f"Section dependencies form a cycle among: {cycle}")
+        waves.append(wave)
+        done.update(wave)
+        remaining.difference_update(wave)
+    return waves
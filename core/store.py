@@ -1,15 +1,99 @@
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable
+from typing import Callable
 from typing import Mapping
 from typing import Tuple
 from typing import Optional
+from typing import Union
+from langchain_core.documents import Document
 from langchain_core.vectorstores import InMemoryVectorStore
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_text_splitters.character import RecursiveCharacterTextSplitter
+from core.cassette import CassetteEmbeddings
+from core.cassette import cassette
+from core.config.llm_config import llm_backend
 from core.config.rag_config import RagParameters
 
 
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2")
-vector_store = InMemoryVectorStore(embeddings)
-current_rag_params = RagParameters()
+logger = logging.getLogger(__name__)
+
+
+class ScoredInMemoryVectorStore(InMemoryVectorStore):
+    """
+    InMemoryVectorStore already scores by cosine similarity but does not declare a
+    relevance function, which "similarity_score_threshold" retrieval requires.
+    Cosine similarity is used as the relevance score, clipped to 0.0-1.0.
+    """
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        return lambda score: min(1.0, max(0.0, score))
+
+
+def create_provider_embeddings():
+    if llm_backend() == "fake":
+        from core.fake_llm import FakeEmbeddings
+        return FakeEmbeddings()
+    return HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2")
+
+
+def create_embeddings():
+    if cassette and cassette.replaying:
+        return CassetteEmbeddings(cassette)
+    if cassette:
+        return CassetteEmbeddings(cassette, create_provider_embeddings())
+    return create_provider_embeddings()
+
+
+embeddings = create_embeddings()
+
+
+# A source's text, or a function returning it, e.g. extracting the text of an uploaded file
+Source = Union[str, Callable[[], str]]
+
+
+class SourceStore:
+    """
+    The vector store a request's sources are added to, with the RAG parameters they are
+    chunked and retrieved with. Every request gets its own, see `request_store`, so
+    concurrent reports neither retrieve nor clear each other's chunks.
+    """
+
+    def __init__(self, rag_params: Optional[RagParameters] = None):
+        self.vector_store = ScoredInMemoryVectorStore(embeddings)
+        self.rag_params = rag_params or RagParameters()
+        # Sources being loaded and added in the background, by name, see `ingesting`
+        self.texts: dict[str, asyncio.Task] = {}
+        self.ingestion: dict[str, asyncio.Task] = {}
+
+
+_current_store: ContextVar[Optional[SourceStore]] = ContextVar("source_store", default=None)
+# The store outside of any request, e.g. of the benchmarks
+default_store = SourceStore()
+
+
+def current_store() -> SourceStore:
+    """The store of the current request, `default_store` outside of one."""
+    return _current_store.get() or default_store
+
+
+@contextmanager
+def request_store(rag_params: Optional[RagParameters] = None):
+    """
+    Runs the enclosed work on a new, empty store, which is dropped afterwards.
+
+    The store is carried by a context variable, so it follows the request into every
+    graph node, section task and worker thread.
+    """
+    token = _current_store.set(SourceStore(rag_params))
+    try:
+        yield _current_store.get()
+    finally:
+        _current_store.reset(token)
 
 
 def prepare_documents(
@@ -19,19 +103,28 @@ def prepare_documents(
     return tuple(map(list, text_meta))
 
 
+def chunk_id(chunk: Document) -> str:
+    """
+    Id of a chunk derived from its source and text, so the same chunk of the same file
+    has the same id in every request.
+    """
+    source = chunk.metadata.get("source", "")
+    return hashlib.sha256(f"{source}\n{chunk.page_content}".encode("utf-8")).hexdigest()[:32]
+
+
 def add_sources(
     source_texts: Mapping[str, str],
     rag_params: Optional[RagParameters] = None
 ) -> list[str]:
-    global current_rag_params
-
+    store = current_store()
     if rag_params:
-        current_rag_params = rag_params
+        store.rag_params = rag_params
+    params = store.rag_params
 
-    chunk_overlap_tokens = int(current_rag_params.chunk_size * (current_rag_params.overlap / 100.0))
+    chunk_overlap_tokens = int(params.chunk_size * (params.overlap / 100.0))
 
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=current_rag_params.chunk_size,
+        chunk_size=params.chunk_size,
         chunk_overlap=chunk_overlap_tokens,
         add_start_index=True
     )
@@ -39,21 +132,117 @@ def add_sources(
     docs = text_splitter.create_documents(texts, metadatas)
     all_splits = text_splitter.split_documents(docs)
 
-    return vector_store.add_documents(documents=all_splits)
+    return store.vector_store.add_documents(documents=all_splits, ids=[chunk_id(c) for c in all_splits])
 
 
-def as_retriever(
-    limit_to_sources: list[str] = [],
+async def aadd_sources(
+    source_texts: Mapping[str, str],
+    rag_params: Optional[RagParameters] = None
+) -> list[str]:
+    """`add_sources` in a worker thread: splitting and embedding the sources is CPU-bound."""
+    return await asyncio.to_thread(add_sources, source_texts, rag_params)
+
+
+async def load_source(name: str, source: Source) -> str:
+    """The text of a source, calling its loader in a worker thread."""
+    if isinstance(source, str):
+        return source
+    text = await asyncio.to_thread(source)
+    logger.info(f"Extracted {len(text)} chars from {name}")
+    return text
+
+
+async def add_loaded_source(name: str, text: Awaitable[str]):
+    await aadd_sources({name: await text})
+
+
+@asynccontextmanager
+async def ingesting(
+    sources: Mapping[str, Source],
     rag_params: Optional[RagParameters] = None
 ):
-    global current_rag_params
+    """
+    Loads each source and adds it to the current store, see `request_store`, in its own
+    worker thread while the enclosed work runs, so a section can be drafted as soon as its
+    own sources are in, see `sources_ready`, instead of waiting for the largest one. The
+    texts are available as soon as they are loaded, see `source_texts`.
 
+    Sources still being loaded or added when the work is done are cancelled, as no section
+    needs them; all of them are cancelled if the work fails.
+    """
+    store = current_store()
     if rag_params:
-        current_rag_params = rag_params
+        store.rag_params = rag_params
+    texts = {name: asyncio.create_task(load_source(name, source)) for name, source in sources.items()}
+    tasks = {name: asyncio.create_task(add_loaded_source(name, text)) for name, text in texts.items()}
+    store.texts.update(texts)
+    store.ingestion.update(tasks)
+    try:
+        yield
+    finally:
+        for name, task in tasks.items():
+            if store.texts.get(name) is texts[name]:
+                del store.texts[name]
+            if store.ingestion.get(name) is task:
+                del store.ingestion[name]
+            texts[name].cancel()
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled() and task.exception():
+                logger.warning(f"Source {name} could not be added to the vector store: {task.exception()}")
+
+
+async def source_texts() -> dict[str, str]:
+    """
+    The texts of the sources being added to the current store, see `ingesting`, once
+    they are all loaded.
+
+    Raises:
+        Exception: The error of a source that could not be loaded.
+    """
+    texts = current_store().texts
+    # Waiting does not cancel the loading when the waiting task is cancelled
+    return dict(zip(texts, await asyncio.gather(*(asyncio.shield(t) for t in texts.values()))))
+
+
+async def sources_ready(sources: list[str]):
+    """
+    Waits until the given sources, all sources for `[]` or `[""]`, are in the current
+    store. Sources that are not being added are not waited for.
+
+    Raises:
+        Exception: The error of a source that could not be added.
+    """
+    everything = not [s for s in sources if s]
+    tasks = [task for name, task in current_store().ingestion.items() if everything or name in sources]
+    if tasks:
+        # Waiting does not cancel the ingestion when the waiting section is cancelled
+        await asyncio.wait(tasks)
+        for task in tasks:
+            task.result()
+
+
+def source_chunk_ids(sources: list[str]) -> list[str]:
+    """Sorted ids of all chunks of the given sources, of all sources for `[]` or `[""]`."""
+    everything = not [s for s in sources if s]
+    return sorted(
+        doc_id for doc_id, doc in current_store().vector_store.store.items()
+        if everything or doc["metadata"].get("source") in sources
+    )
+
+
+def as_retriever(
+    limit_to_sources: list[str] = [],
+    rag_params: Optional[RagParameters] = None
+):
+    """Retriever of the current store, with its RAG parameters unless others are given."""
+    store = current_store()
+    params = rag_params or store.rag_params
+    vector_store = store.vector_store
 
     search_kwargs = {
-        "k": current_rag_params.top_k,
-        "score_threshold": current_rag_params.similarity_threshold
+        "k": params.top_k,
+        "score_threshold": params.similarity_threshold
     }
 
     match limit_to_sources:
@@ -63,13 +252,14 @@ def as_retriever(
                 search_kwargs=search_kwargs
             )
         case [source]:
-            search_kwargs["filter"] = {"source": {"$eq": source}}
+            search_kwargs["filter"] = lambda doc: doc.metadata.get("source") == source
             return vector_store.as_retriever(
                 search_type="similarity_score_threshold",
                 search_kwargs=search_kwargs
             )
         case _:
-            search_kwargs["filter"] = {"source": {"$in": limit_to_sources}}
+            sources = set(limit_to_sources)
+            search_kwargs["filter"] = lambda doc: doc.metadata.get("source") in sources
             return vector_store.as_retriever(
                 search_type="similarity_score_threshold",
                 search_kwargs=search_kwargs
@@ -77,6 +267,5 @@ def as_retriever(
 
 
 def clear_store():
-    """Clear all documents from the vector store."""
-    global vector_store
-    vector_store = InMemoryVectorStore(embeddings)
\ No newline at end of file
+    """Clear all documents from the current store."""
+    current_store().vector_store = ScoredInMemoryVectorStore(embeddings)
\ No newline at end of file
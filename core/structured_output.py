@@ -0,0 +1,133 @@
+"""
+Schema-validated JSON replies from chat models.
+
+The model is called in JSON mode (`response_format={"type": "json_object"}`) and its
+reply is validated against a pydantic model. A reply that is not valid JSON or does not
+match the schema is sent back to the model together with the validation error, up to
+`StructuredOutputConfig.max_repairs` times, so a malformed reply is repaired inside the
+node instead of failing the whole request.
+"""
+
+import json
+import logging
+import re
+from typing import Any, Optional, TypeVar
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.messages import BaseMessage
+from langchain_core.messages import HumanMessage
+from langchain_core.messages import SystemMessage
+from langchain_core.runnables import RunnableConfig
+from pydantic import BaseModel
+from pydantic import ValidationError
+from core.config.llm_config import StructuredOutputConfig
+
+
+logger = logging.getLogger(__name__)
+
+
+T = TypeVar("T", bound=BaseModel)
+
+
+config = StructuredOutputConfig.from_env()
+
+
+REPAIR_PROMPT = """Your previous reply could not be used: {error}
+
+Reply again with only the corrected JSON object, without any other text."""
+
+
+class StructuredOutputError(ValueError):
+    """A model reply that still did not match its schema after all repair attempts."""
+
+    def __init__(self, message: str, reply: str):
+        super().__init__(message)
+        self.reply = reply
+
+
+def parse_json_object(text: str) -> Any:
+    """
+    Parses a JSON reply, tolerating a trailing TERMINATE marker, markdown code
+    fences and text around the outermost braces.
+
+    Raises:
+        json.JSONDecodeError: If no JSON object can be read from the text.
+    """
+    cleaned = text.split("TERMINATE")[0].strip()
+    cleaned = re.sub(r"^```\w*\s*|\s*```$", "", cleaned)
+    try:
+        return json.loads(cleaned)
+    except json.JSONDecodeError:
+        start, end = cleaned.find("{"), cleaned.rfind("}")
+        if start == -1 or end < start:
+            raise
+        return json.loads(cleaned[start:end + 1])
+
+
+def to_messages(prompt: str, system_prompt: Optional[str] = None) -> list[BaseMessage]:
+    messages: list[BaseMessage] = [SystemMessage(system_prompt)] if system_prompt else []
+    return messages + [HumanMessage(prompt)]
+
+
+def validate_reply(reply: AIMessage, schema: type[T]) -> T:
+    """
+    Raises:
+        ValueError: If the reply is not JSON or does not match the schema.
+    """
+    try:
+        return schema.model_validate(parse_json_object(reply.text()))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"the reply is not valid JSON ({e})") from e
+    except ValidationError as e:
+        raise ValueError(f"the JSON does not match the expected schema: {e}") from e
+
+
+def next_attempt(messages: list[BaseMessage], reply: AIMessage, error: ValueError,
+                 schema: type[BaseModel], attempt: int) -> list[BaseMessage]:
+    """The conversation for the next attempt, or raises once the repairs are used up."""
+    if attempt >= config.max_repairs:
+        raise StructuredOutputError(
+            f"{schema.__name__} reply still invalid after {config.max_repairs} repair(s): {error}",
+            reply.text()
+        )
+    logger.warning("Invalid %s reply, asking for a repair (%d/%d): %s",
+                   schema.__name__, attempt + 1, config.max_repairs, error)
+    return messages + [reply, HumanMessage(REPAIR_PROMPT.format(error=error))]
+
+
+def invoke_structured(
+        model: BaseChatModel,
+        messages: list[BaseMessage],
+        schema: type[T],
+        run_config: Optional[RunnableConfig] = None
+) -> T:
+    """
+    Calls the model in JSON mode and returns its reply validated against `schema`,
+    repairing invalid replies.
+
+    Raises:
+        StructuredOutputError: If the reply is still invalid after the last repair.
+    """
+    json_model = model.bind(response_format={"type": "json_object"})
+    for attempt in range(config.max_repairs + 1):
+        reply = json_model.invoke(messages, config=run_config)
+        try:
+            return validate_reply(reply, schema)
+        except ValueError as e:
+            messages = next_attempt(messages, reply, e, schema, attempt)
+
+
+async def ainvoke_structured(
+        model: BaseChatModel,
+        messages: list[BaseMessage],
+        schema: type[T],
+        run_config: Optional[RunnableConfig] = None
+) -> T:
+    """Async variant of `invoke_structured`."""
+    json_model = model.bind(response_format={"type": "json_object"})
+    for attempt in range(config.max_repairs + 1):
+        reply = await json_model.ainvoke(messages, config=run_config)
+        try:
+            return validate_reply(reply, schema)
+        except ValueError as e:
+            messages = next_attempt(messages, reply, e, schema, attempt)
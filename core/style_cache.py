@@ -0,0 +1,106 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Any, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+STYLE_GUIDELINES_DIR = "outputs/style_guidelines"
+
+
+def style_cache_key(example_text: str, prompt_version: str) -> str:
+    """
+    Hash of the example text and the version of the prompt that analyses it. Whitespace
+    is normalized, so re-extracted text of the same document maps to the same key.
+    """
+    normalized = re.sub(r"\s+", " ", example_text).strip()
+    return hashlib.sha256(f"{prompt_version}\n{normalized}".encode("utf-8")).hexdigest()
+
+
+class StyleGuidelineCache:
+    """
+    Style guidelines stored in `outputs/style_guidelines/`, one file per example text
+    and prompt version (`style_<key>.json`), so an example document is analysed once no
+    matter how often it is uploaded or what its file is called.
+
+    The first store of a process also removes timestamped files
+    (`style_guidelines_<timestamp>.json`) whose guidelines duplicate another file.
+    """
+
+    def __init__(self, directory: str = STYLE_GUIDELINES_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._deduplicated = False
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"style_{key[:32]}.json")
+
+    def lookup(self, key: str) -> Optional[dict[str, Any]]:
+        path = self.path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if data.get("cache_key") != key:
+            return None
+        logger.info("Style guidelines loaded from cache: %s", path)
+        return data.get("style_guidelines")
+
+    def store(self, key: str, style_guidelines: dict[str, Any], **metadata) -> str:
+        """Writes the guidelines under their key and returns the file path."""
+        path = self.path(key)
+        data = {
+            "extracted_at": datetime.now().isoformat(),
+            "cache_key": key,
+            **metadata,
+            "style_guidelines": style_guidelines
+        }
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            if not self._deduplicated:
+                self._deduplicated = True
+                self.deduplicate()
+        return path
+
+    def deduplicate(self) -> int:
+        """
+        Removes timestamped guideline files whose content is already stored in another
+        file, preferring to keep cache entries and then the oldest file. Files with other
+        names are never removed.
+
+        Returns:
+            int: Number of files removed.
+        """
+        kept: dict[str, str] = {}
+        removed = 0
+        files = sorted(glob.glob(os.path.join(self.directory, "*.json")),
+                       key=lambda p: (not os.path.basename(p).startswith("style_") or
+                                      os.path.basename(p).startswith("style_guidelines_"), p))
+        for path in files:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    content = json.dumps(json.load(f).get("style_guidelines"), sort_keys=True)
+            except (OSError, json.JSONDecodeError, AttributeError):
+                continue
+            if content not in kept:
+                kept[content] = path
+            elif os.path.basename(path).startswith("style_guidelines_"):
+                os.remove(path)
+                removed += 1
+                logger.info("Removed %s, duplicate of %s", path, kept[content])
+        return removed
+
+
+style_cache = StyleGuidelineCache()
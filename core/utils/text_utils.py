@@ -1,6 +1,8 @@
 import re
+from functools import lru_cache
 from typing import Optional, Tuple
 import json
+from langchain_text_splitters.character import RecursiveCharacterTextSplitter
 
 def clean_extracted_text(text):
     """
@@ -69,4 +71,71 @@ def normalize_title_for_lookup(title: str) -> str:
     if lower_title.startswith("why "):
         return "Why Company A"
 
-    return title
\ No newline at end of file
+    return title
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    """Loads the tiktoken encoding for a model, or None when unavailable (offline or not installed)."""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4.1") -> int:
+    """
+    Counts the tokens in a piece of text for the given model.
+
+    Uses tiktoken when its encoding can be loaded and falls back to the usual
+    four-characters-per-token estimate otherwise.
+
+    Args:
+        text (str): Text to measure.
+        model (str): Model name used to pick the tokenizer.
+
+    Returns:
+        int: Number of tokens (exact with tiktoken, estimated without).
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def split_token_windows(text: str, max_tokens: int, overlap_tokens: int = 0) -> list[str]:
+    """
+    Splits text into windows of at most `max_tokens` tokens, breaking at paragraph,
+    line and sentence boundaries where possible. Text that fits is returned whole.
+
+    Args:
+        text (str): Text to split.
+        max_tokens (int): Maximum tokens per window.
+        overlap_tokens (int): Tokens repeated at the start of the next window.
+
+    Returns:
+        list[str]: The windows in document order.
+    """
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    # The splitter adds up the tokens of the pieces it joins, which can undercount the
+    # joined text by a few tokens; split again with a smaller budget until every window fits
+    chunk_size = max_tokens
+    while True:
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=min(overlap_tokens, chunk_size // 2),
+            length_function=count_tokens,
+            separators=["\n\n", "\n", ". ", " ", ""]
+        )
+        windows = splitter.split_text(text)
+        excess = max(count_tokens(w) for w in windows) - max_tokens
+        if excess <= 0 or chunk_size == 1:
+            return windows
+        chunk_size = max(1, chunk_size - excess)
@@ -6,21 +6,30 @@ from core.agents.user_proxy_agent import get_user_proxy_agent
 from core.utils.style_utils import (
     extract_document_style, 
     apply_style_to_instructions, 
-    save_style_guidelines,
-    load_style_guidelines
+    save_style_guidelines
 )
 from core.workflows.document_extraction import extract_and_clean_text
 from core.workflows.document_pipeline import generate_report
+from core.style_cache import style_cache
+from core.style_cache import style_cache_key
+from core.agents.style_extractor import STYLE_PROMPT_VERSION
+import core.llm
 from typing import Dict, List, Tuple, Optional
 import os
 
-def extract_style_from_example(example_file_path: str, save_guidelines: bool = True) -> Dict:
+def extract_style_from_example(
+    example_file_path: str,
+    save_guidelines: bool = True,
+    example_text: Optional[str] = None
+) -> Dict:
     """
     Extract style guidelines from an example document.
     
     Args:
         example_file_path (str): Path to the example document
         save_guidelines (bool): Whether to save the extracted guidelines
+        example_text (Optional[str]): Text already extracted from the example document,
+            which is then not extracted again
         
     Returns:
         Dict: Extracted style guidelines
@@ -31,7 +40,8 @@ def extract_style_from_example(example_file_path: str, save_guidelines: bool = T
     user_proxy = get_user_proxy_agent(llm_config)
     
     # Extract text from example document
-    example_text = extract_and_clean_text(example_file_path)
+    if example_text is None:
+        example_text = extract_and_clean_text(example_file_path)
     
     if not example_text.strip():
         raise ValueError("Could not extract text from example document")
@@ -138,19 +148,31 @@ def generate_report_with_example_style(
     Returns:
         Tuple[dict, str, Dict]: Report structure, full text, and style guidelines used
     """
-    # Check for cached style guidelines
-    example_name = os.path.splitext(os.path.basename(example_file_path))[0]
-    cache_path = f"outputs/style_guidelines/example_{example_name}.json"
+    # Cached by content, so renamed or edited example files are handled correctly. The
+    # example is parsed once, its text is passed on to the style extraction
+    example_text = extract_and_clean_text(example_file_path)
+    prompt_version = f"{STYLE_PROMPT_VERSION}:{core.llm.routing.model_for('style')}"
+    cache_key = style_cache_key(example_text, prompt_version)
     
     style_guidelines = {}
     
-    if use_cached_style and os.path.exists(cache_path):
-        print(f"[Style-Guided] Loading cached style guidelines from: {cache_path}")
-        style_guidelines = load_style_guidelines(cache_path)
+    if use_cached_style:
+        style_guidelines = style_cache.lookup(cache_key) or {}
+        if style_guidelines:
+            print(f"[Style-Guided] Loaded cached style guidelines from: {style_cache.path(cache_key)}")
     
     if not style_guidelines:
         print(f"[Style-Guided] Extracting new style guidelines from: {example_file_path}")
-        style_guidelines = extract_style_from_example(example_file_path, save_guidelines=True)
+        style_guidelines = extract_style_from_example(
+            example_file_path, save_guidelines=False, example_text=example_text
+        )
+        if style_guidelines:
+            style_cache.store(
+                cache_key,
+                style_guidelines,
+                prompt_version=STYLE_PROMPT_VERSION,
+                model=core.llm.routing.model_for("style")
+            )
     
     if not style_guidelines:
         print("[Style-Guided] Warning: No style guidelines extracted, using standard generation")
@@ -1,4 +1,5 @@
 let currentDocumentUUID = null;
+let currentThreadId = null;
 
 // Reveal sections on scroll
 const fadeSections = document.querySelectorAll('.fade-section');
@@ -51,16 +52,35 @@ async function sendQuestion() {
   appendChat("user", question);
   document.getElementById("userInput").value = "";
 
-  const res = await fetch("/documents/chat/", {
+  const res = await fetch("/documents/chat/stream/", {
     method: "POST",
     headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ document_content: docContent, question: question })
+    // Scoped edits patch only the paragraphs the question concerns and arrive with the
+    // "done" event; an invalid patch falls back to a full rewrite, which streams tokens
+    body: JSON.stringify({ document_content: docContent, question: question, thread_id: currentThreadId, edit_mode: "scoped" })
   });
 
-  const result = await res.json();
-  const reply = result.answer || "No response.";
+  // Render the revision while it streams in
+  const botMsg = appendChat("bot", "");
+  let streamed = "";
+  let result = {};
+
+  await readEventStream(res, (event, data) => {
+    if (event === "token") {
+      streamed += data.text;
+      botMsg.innerHTML = formatReportText(streamed);
+      const chatWindow = document.getElementById("chatWindow");
+      chatWindow.scrollTop = chatWindow.scrollHeight;
+    } else if (event === "done") {
+      result = data;
+    } else if (event === "error") {
+      result = { answer: data.detail };
+    }
+  });
 
-  appendChat("bot", reply);
+  const reply = result.answer || streamed || "No response.";
+
+  botMsg.innerHTML = formatReportText(reply);
   document.getElementById("docContent").value = reply;
 
   currentDocumentUUID = result.uuid || currentDocumentUUID;
@@ -70,6 +90,36 @@ async function sendQuestion() {
   }
 }
 
+/**
+ * Reads a server-sent event stream from a fetch response and calls
+ * onEvent(eventName, parsedData) for every complete event.
+ */
+async function readEventStream(res, onEvent) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const raw = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = "message";
+      let data = "";
+      for (const line of raw.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+}
+
 function appendChat(role, message) {
   const chatWindow = document.getElementById("chatWindow");
   const msgContainer = document.createElement("div");
@@ -78,6 +128,7 @@ function appendChat(role, message) {
   msgContainer.innerHTML = `<div class="chat-msg ${role}">${formatted}</div>`;
   chatWindow.appendChild(msgContainer);
   chatWindow.scrollTop = chatWindow.scrollHeight;
+  return msgContainer.firstElementChild;
 }
 
 function updateDownloadLinks(docx, pdf) {
@@ -1,4 +1,5 @@
 let currentDocumentUUID = null;
+let currentThreadId = null;
 
 // For dropdown customization
 const CUSTOMIZE_VALUE = "__customize__";
@@ -95,6 +96,7 @@ async function uploadFile() {
     console.log("Upload API response:", result);
     
     currentDocumentUUID = result.uuid;
+    currentThreadId = result.thread_id;
     
     const sections = Object.values(result.flattened_sections);
     
@@ -318,10 +320,12 @@ async function sendQuestion() {
   document.getElementById("userInput").value = "";
 
   try {
-    const res = await fetch("/documents/chat/", {
+    const res = await fetch("/documents/chat/stream/", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ document_content: docContent, question: question })
+      // Scoped edits patch only the paragraphs the question concerns and arrive with the
+      // "done" event; an invalid patch falls back to a full rewrite, which streams tokens
+      body: JSON.stringify({ document_content: docContent, question: question, thread_id: currentThreadId, edit_mode: "scoped" })
     });
 
     if (!res.ok) {
@@ -330,7 +334,31 @@ async function sendQuestion() {
       return;
     }
 
-    const result = await res.json();
+    // Bot message that is re-rendered as tokens stream in
+    const chatWindow = document.getElementById("chatWindow");
+    const botMsgDiv = document.createElement("div");
+    botMsgDiv.classList.add("chat-msg", "bot", "mb-3");
+    chatWindow.appendChild(botMsgDiv);
+    document.getElementById("chatSection").style.display = "block";
+
+    let streamed = "";
+    let result = null;
+
+    await readEventStream(res, (event, data) => {
+      if (event === "token") {
+        streamed += data.text;
+        botMsgDiv.innerHTML = marked.parse(streamed);
+        chatWindow.scrollTop = chatWindow.scrollHeight;
+      } else if (event === "done") {
+        result = data;
+      } else if (event === "error") {
+        throw new Error(data.detail);
+      }
+    });
+
+    if (!result) {
+      throw new Error("Stream ended before the revision was saved");
+    }
     console.log("Chat API response:", result);
 
     const reply = (result.answer || "No response.").replace(/TERMINATE/g, "");
@@ -339,23 +367,15 @@ async function sendQuestion() {
 
     // Format reply as Markdown → HTML
     const formattedReply = reply.trim();
-    const renderedHTML = marked.parse(formattedReply);
+    botMsgDiv.innerHTML = marked.parse(formattedReply);
 
     // Append raw markdown to textarea (history)
     document.getElementById("docContent").value += "\n\n" + formattedReply;
 
-    // Append formatted HTML to chat window
-    const chatWindow = document.getElementById("chatWindow");
-    const botMsgDiv = document.createElement("div");
-    botMsgDiv.classList.add("chat-msg", "bot", "mb-3");
-    botMsgDiv.innerHTML = renderedHTML;
-    chatWindow.appendChild(botMsgDiv);
-
     // Auto-scroll to bottom
     chatWindow.scrollTop = chatWindow.scrollHeight;
 
     // Reveal feedback section if hidden
-    document.getElementById("chatSection").style.display = "block";
     document.getElementById("feedbackSection").classList.remove("d-none");
 
     // Update download links if provided
@@ -368,6 +388,36 @@ async function sendQuestion() {
   }
 }
 
+/**
+ * Reads a server-sent event stream from a fetch response and calls
+ * onEvent(eventName, parsedData) for every complete event.
+ */
+async function readEventStream(res, onEvent) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const raw = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = "message";
+      let data = "";
+      for (const line of raw.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+}
+
 // ============================================================
 // Rating & Feedback
 // ============================================================
@@ -0,0 +1,261 @@
+"""
+Tests for the adaptive section concurrency limiter.
+
+The limiter reads a fake clock, so section latencies are exactly what each test says.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import core.concurrency
+from core.concurrency import AdaptiveConcurrencyLimiter, record_provider_call
+from core.config.llm_config import SectionConcurrencyConfig
+
+
+class RateLimitError(Exception):
+    """Named like the provider's error, which is how the limiter recognizes throttling."""
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(core.concurrency, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+async def settle():
+    """Lets woken sections run until they wait again."""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+async def run_section(limiter: AdaptiveConcurrencyLimiter, clock: FakeClock, seconds: float = 1.0, key: str = "r",
+                      waiting: float = 0.0):
+    """A section making one model call that waits `waiting` for the scheduler and `seconds` at the provider."""
+    async with limiter.slot(key):
+        clock.now += waiting + seconds
+        record_provider_call(seconds)
+
+
+async def cached_section(limiter: AdaptiveConcurrencyLimiter, key: str = "r"):
+    """A section whose model calls are all answered from the response cache."""
+    async with limiter.slot(key):
+        pass
+
+
+async def throttled_section(limiter: AdaptiveConcurrencyLimiter, key: str = "r"):
+    async with limiter.slot(key):
+        raise RateLimitError()
+
+
+def test_additive_increase(clock):
+    """Test that the limit grows by one per limit's worth of sections, up to max_limit"""
+    limiter = AdaptiveConcurrencyLimiter(SectionConcurrencyConfig(initial_limit=2, max_limit=4))
+
+    async def run():
+        limits = []
+        for _ in range(8):
+            await run_section(limiter, clock)
+            limits.append(limiter.limit)
+        return limits
+
+    assert asyncio.run(run()) == [2, 2, 3, 3, 3, 4, 4, 4]
+    assert limiter.stats()["increases"] == 2
+
+
+def test_decrease_on_rate_limit_error(clock):
+    """Test that a throttled section cuts the limit by the backoff factor"""
+    limiter = AdaptiveConcurrencyLimiter(SectionConcurrencyConfig(initial_limit=8, backoff=0.5))
+
+    with pytest.raises(RateLimitError):
+        asyncio.run(throttled_section(limiter))
+
+    assert limiter.limit == 4
+    assert limiter.stats()["throttled"] == 1
+
+
+def test_decrease_on_rate_limits_seen_by_scheduler(clock):
+    """Test that a section counts as throttled if the model scheduler saw rate limit errors meanwhile"""
+    rate_limits = [0]
+    limiter = AdaptiveConcurrencyLimiter(SectionConcurrencyConfig(initial_limit=8), lambda: rate_limits[0])
+
+    async def retried_section():
+        async with limiter.slot("r"):
+            rate_limits[0] += 1
+
+    asyncio.run(retried_section())
+    assert limiter.limit == 4
+
+
+def test_decrease_on_slow_section(clock):
+    """Test that a section slower than latency_tolerance times the baseline cuts the limit"""
+    limiter = AdaptiveConcurrencyLimiter(SectionConcurrencyConfig(initial_limit=8, max_limit=8, latency_tolerance=3.0))
+
+    async def run():
+        for _ in range(10):
+            await run_section(limiter, clock, 1.0)
+        await run_section(limiter, clock, 2.9)
+        assert limiter.limit == 8
+        await run_section(limiter, clock, 3.5)
+
+    asyncio.run(run())
+    assert limiter.limit == 4
+    assert limiter.stats()["slow"] == 1
+
+
+def test_cached_sections_do_not_lower_the_baseline(clock):
+    """Test that sections answered from the response cache neither count as fast nor make real calls slow"""
+    limiter = AdaptiveConcurrencyLimiter(SectionConcurrencyConfig(initial_limit=8, max_limit=8))
+
+    async def run():
+        for _ in range(10):
+            await run_section(limiter, clock, 1.0)
+        for _ in range(20):
+            for _ in range(5):
+                await cached_section(limiter)
+            await run_section(limiter, clock, 1.2)
+
+    asyncio.run(run())
+    assert limiter.limit == 8
+    assert limiter.stats()["slow"] == 0
+    assert limiter.stats()["completed"] == 130
+    assert 1.0 <= limiter.stats()["baseline_latency_seconds"] <= 1.2
+
+
+def test_scheduler_wait_is_not_overload(clock):
+    """Test that time spent waiting for the model scheduler does not make a section slow"""
+    limiter = AdaptiveConcurrencyLimiter(SectionConcurrencyConfig(initial_limit=8, max_limit=8))
+
+    async def run():
+        for _ in range(10):
+            await run_section(limiter, clock, 1.0)
+        await run_section(limiter, clock, 1.0, waiting=10.0)
+
+    asyncio.run(run())
+    assert limiter.limit == 8
+    assert limiter.stats()["slow"] == 0
+
+
+def test_baseline_survives_a_few_very_fast_calls(clock):
+    """Test that a few near-instant calls do not make every normal call count as slow"""
+    limiter = AdaptiveConcurrencyLimiter(SectionConcurrencyConfig(initial_limit=8, max_limit=8))
+
+    async def run():
+        for _ in range(10):
+            await run_section(limiter, clock, 1.0)
+        for _ in range(3):
+            await run_section(limiter, clock, 0.001)
+        for _ in range(10):
+            await run_section(limiter, clock, 1.0)
+
+    asyncio.run(run())
+    assert limiter.limit == 8
+    assert limiter.stats()["slow"] == 0
+
+
+def test_one_overload_decreases_once(clock):
+    """Test that sections started before a decrease do not decrease the limit again"""
+    limiter = AdaptiveConcurrencyLimiter(SectionConcurrencyConfig(initial_limit=8, backoff=0.5))
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def section():
+            async with limiter.slot("r"):
+                await gate.wait()
+                raise RateLimitError()
+
+        tasks = [asyncio.create_task(section()) for _ in range(2)]
+        await settle()
+        clock.now += 1
+        gate.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        assert limiter.limit == 4
+
+        # A section started after the decrease reports a new overload
+        clock.now += 1
+        with pytest.raises(RateLimitError):
+            await throttled_section(limiter)
+
+    asyncio.run(run())
+    assert limiter.limit == 2
+    assert limiter.stats()["throttled"] == 3
+    assert limiter.stats()["decreases"] == 2
+
+
+def test_min_limit(clock):
+    """Test that the limit never drops below min_limit"""
+    limiter = AdaptiveConcurrencyLimiter(SectionConcurrencyConfig(initial_limit=2, min_limit=2))
+
+    with pytest.raises(RateLimitError):
+        asyncio.run(throttled_section(limiter))
+
+    assert limiter.limit == 2
+
+
+def test_free_slot_goes_to_request_with_fewest_in_flight(clock):
+    """Test that a small request is not starved by a large one queued before it"""
+    limiter = AdaptiveConcurrencyLimiter(SectionConcurrencyConfig(initial_limit=2, max_limit=2))
+    admitted = []
+
+    async def run():
+        gates = [asyncio.Event() for _ in range(5)]
+
+        async def section(key: str, gate: asyncio.Event):
+            async with limiter.slot(key):
+                admitted.append(key)
+                await gate.wait()
+
+        keys = ["large", "large", "large", "large", "small"]
+        tasks = [asyncio.create_task(section(key, gate)) for key, gate in zip(keys, gates)]
+        await settle()
+        assert admitted == ["large", "large"]
+        assert limiter.stats()["queued"] == 3
+
+        # One large section is still in flight, the small request has none
+        gates[0].set()
+        await settle()
+        assert admitted == ["large", "large", "small"]
+
+        for gate in gates:
+            gate.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert admitted == ["large", "large", "small", "large", "large"]
+
+
+def test_cancelled_section_leaves_the_queue(clock):
+    """Test that a section cancelled while queued frees its place without changing the limit"""
+    limiter = AdaptiveConcurrencyLimiter(SectionConcurrencyConfig(initial_limit=1, max_limit=1))
+
+    async def run():
+        gate = asyncio.Event()
+
+        async def section():
+            async with limiter.slot("r"):
+                await gate.wait()
+
+        running = asyncio.create_task(section())
+        queued = asyncio.create_task(section())
+        await settle()
+        queued.cancel()
+        await settle()
+        assert limiter.stats()["queued"] == 0
+        gate.set()
+        await running
+
+    asyncio.run(run())
+    assert limiter.stats()["in_flight"] == 0
+    assert limiter.stats()["completed"] == 1
+    assert limiter.limit == 1
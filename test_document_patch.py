@@ -0,0 +1,74 @@
+"""
+Tests for applying the paragraph patches of scoped document revisions.
+"""
+
+import pytest
+
+from core.document_patch import DocumentPatch, ParagraphEdit, PatchError, apply_patch, number_paragraphs
+
+
+DOCUMENT = "A\n\nB\n\nC\n"
+
+
+def patch(*edits: tuple) -> DocumentPatch:
+    return DocumentPatch(edits=[ParagraphEdit(paragraph=n, action=action, text=text) for n, action, text in edits])
+
+
+def test_number_paragraphs():
+    """Test that paragraphs are shown to the model numbered from 1"""
+    assert number_paragraphs(DOCUMENT) == "[1] A\n\n[2] B\n\n[3] C"
+
+
+def test_untouched_paragraphs_are_kept():
+    """Test that an empty patch gives the document back byte for byte"""
+    assert apply_patch("A\n\n\nB  \n\n", patch()) == ("A\n\n\nB  \n\n", [])
+
+
+def test_replace():
+    """Test replacing a paragraph"""
+    assert apply_patch(DOCUMENT, patch((2, "replace", "B2"))) == ("A\n\nB2\n\nC\n", [2])
+
+
+def test_delete():
+    """Test deleting the middle and the last paragraph"""
+    assert apply_patch(DOCUMENT, patch((2, "delete", ""))) == ("A\n\nC\n", [2])
+    assert apply_patch(DOCUMENT, patch((3, "delete", ""))) == ("A\n\nB\n", [3])
+
+
+def test_delete_and_insert_after():
+    """Test that a paragraph inserted after a deleted one takes its place"""
+    revised, changed = apply_patch(DOCUMENT, patch((2, "delete", ""), (2, "insert_after", "X")))
+    assert revised == "A\n\nX\n\nC\n"
+    assert changed == [2]
+
+
+def test_replace_and_insert_after():
+    """Test that a paragraph inserted after a replaced one follows the replacement"""
+    revised, changed = apply_patch(DOCUMENT, patch((2, "replace", "B2"), (2, "insert_after", "X"), (2, "insert_after", "Y")))
+    assert revised == "A\n\nB2\n\nX\n\nY\n\nC\n"
+    assert changed == [2]
+
+
+def test_insert_at_start_and_end():
+    """Test inserting before the first paragraph and after the last one"""
+    revised, changed = apply_patch(DOCUMENT, patch((0, "insert_after", "Z"), (3, "insert_after", "D")))
+    assert revised == "Z\n\nA\n\nB\n\nC\n\nD\n"
+    assert changed == [0, 3]
+
+
+@pytest.mark.parametrize("edit", [
+    (4, "replace", "X"),
+    (0, "delete", ""),
+    (-1, "insert_after", "X"),
+    (4, "insert_after", "X"),
+])
+def test_out_of_range_paragraph(edit):
+    """Test that edits of paragraphs the document does not have are rejected"""
+    with pytest.raises(PatchError):
+        apply_patch(DOCUMENT, patch(edit))
+
+
+def test_paragraph_edited_twice():
+    """Test that a paragraph cannot be replaced and deleted in one patch"""
+    with pytest.raises(PatchError):
+        apply_patch(DOCUMENT, patch((1, "replace", "X"), (1, "delete", "")))
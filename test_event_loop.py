@@ -0,0 +1,78 @@
+"""
+Event loop blocking test.
+
+Generates and revises a report on the fake model backend (see conftest.py) while a
+watchdog coroutine measures how late the event loop wakes it up. Every graph node and
+endpoint helper awaits its model, retriever and file calls, so the loop must never be
+held longer than EVENT_LOOP_BLOCK_THRESHOLD_SECONDS (default 0.25).
+"""
+
+import asyncio
+import os
+import time
+
+
+THRESHOLD_SECONDS = float(os.environ.get("EVENT_LOOP_BLOCK_THRESHOLD_SECONDS", "0.25"))
+TICK_SECONDS = 0.01
+
+SOURCE_TEXTS = {
+    "SOW.docx": "Acme Consulting LLC will deliver a data platform within six months. " * 20,
+    "company_overview.pdf": "Acme Consulting LLC is a data consultancy founded in 2010. " * 20,
+}
+
+
+class LoopWatchdog:
+    """Sleeps in short ticks and records how much later than asked each tick woke up."""
+
+    def __init__(self, tick: float = TICK_SECONDS):
+        self.tick = tick
+        self.max_lag = 0.0
+        self.ticks = 0
+        self._task = None
+
+    async def _watch(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.tick)
+            self.max_lag = max(self.max_lag, time.perf_counter() - start - self.tick)
+            self.ticks += 1
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._watch())
+        # Let the first tick start before the measured work does
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+async def generate_and_edit() -> tuple[LoopWatchdog, str]:
+    import core.document
+    from core.checkpoint import new_thread_id
+    from core.workflows.document_extraction import load_report_structure
+
+    sections = load_report_structure("templates/proposal_template.json")
+    thread_id = new_thread_id("test")
+    async with LoopWatchdog() as watchdog:
+        report_sections = await core.document.generate(sections, SOURCE_TEXTS, thread_id=thread_id)
+        document = "\n\n".join(f"{s.title}\n\n{s.content}" for s in report_sections.values())
+        revision = await core.document.edit("Shorten the executive summary", document, thread_id)
+    return watchdog, revision
+
+
+def test_event_loop_not_blocked():
+    """Test that generating and revising a report never blocks the event loop"""
+    watchdog, revision = asyncio.run(generate_and_edit())
+
+    assert watchdog.ticks > 0, "Watchdog never ran"
+    assert revision, "Edit returned an empty revision"
+    assert watchdog.max_lag < THRESHOLD_SECONDS, (
+        f"Event loop blocked for {watchdog.max_lag:.3f}s, threshold is {THRESHOLD_SECONDS}s"
+    )
+
+
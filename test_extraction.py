@@ -0,0 +1,145 @@
+"""
+Tests for splitting long sources into extraction windows and merging what each window yields.
+"""
+
+import asyncio
+
+import pytest
+
+import core.agents.extractor
+from core.agents.extractor import SourceExtraction, extract_sources, merge_extractions
+from core.agents.state import DocumentPreparationState, TemplateSectionDef
+from core.config.llm_config import ExtractionConfig
+from core.utils.text_utils import count_tokens, split_token_windows
+
+
+TEXT = " ".join(f"Sentence number {i} is here." for i in range(200))
+
+
+def test_text_that_fits_is_one_window():
+    """Test that text within the limit is returned whole"""
+    assert split_token_windows("A short source.", 50, 10) == ["A short source."]
+
+
+@pytest.mark.parametrize("max_tokens", [20, 50, 120])
+def test_windows_stay_within_the_limit(max_tokens):
+    """Test that no window has more than max_tokens tokens"""
+    windows = split_token_windows(TEXT, max_tokens, 10)
+    assert len(windows) > 1
+    assert max(count_tokens(w) for w in windows) <= max_tokens
+
+
+def test_windows_overlap():
+    """Test that each window starts with text from the end of the one before it"""
+    windows = split_token_windows(TEXT, 50, 10)
+    for previous, window in zip(windows, windows[1:]):
+        start = window.split(". ")[0]
+        assert start in previous
+    # Every sentence of the source is in some window, in document order
+    sentences = [f"Sentence number {i} is here" for i in range(200)]
+    found = [s for s in sentences if any(s in w for w in windows)]
+    assert found == sentences
+
+
+def test_windows_without_overlap():
+    """Test that windows without overlap share no sentence"""
+    windows = split_token_windows(TEXT, 50, 0)
+    for i in range(200):
+        assert sum(f"number {i} is" in w for w in windows) == 1
+
+
+def test_overlap_is_capped_at_half_a_window():
+    """Test that an overlap larger than the window does not stop the split"""
+    windows = split_token_windows(TEXT, 40, 100)
+    assert len(windows) > 1
+    assert max(count_tokens(w) for w in windows) <= 40
+
+
+def test_merge_keeps_facts_found_once():
+    """Test that facts found in a single window are kept as is, for every title"""
+    merged = merge_extractions(["Scope", "Team"], [
+        {"Scope": {"Deliverable": "Data platform"}},
+        {"Team": {"Size": 5}},
+    ])
+    assert merged == {"Scope": {"Deliverable": "Data platform"}, "Team": {"Size": 5}}
+
+
+def test_merge_collects_conflicting_values_in_window_order():
+    """Test that differing values of one fact are collected in window order without duplicates"""
+    merged = merge_extractions(["Scope"], [
+        {"Scope": {"Budget": "$1M", "Duration": "6 months"}},
+        {"Scope": {"Budget": "$2M"}},
+        {"Scope": {"Budget": "$1M", "Duration": "6 months"}},
+        {"Scope": {"Budget": 3}},
+    ])
+    assert merged["Scope"] == {"Budget": ["$1M", "$2M", 3], "Duration": "6 months"}
+
+
+def test_merge_keeps_the_type_of_values():
+    """Test that lists, numbers and objects are neither turned into strings nor joined"""
+    merged = merge_extractions(["Team"], [
+        {"Team": {"Size": 5, "Roles": ["Lead", "Engineer"], "Lead": {"Name": "Ann"}}},
+        {"Team": {"Size": 5, "Roles": ["Analyst"], "Lead": {"Name": "Bob"}}},
+    ])
+    assert merged["Team"] == {
+        "Size": 5,
+        "Roles": [["Lead", "Engineer"], ["Analyst"]],
+        "Lead": [{"Name": "Ann"}, {"Name": "Bob"}],
+    }
+
+
+def test_merge_takes_company_name_from_first_window():
+    """Test that the company name is not joined but taken from the first window that has one"""
+    merged = merge_extractions(["Overview"], [
+        {"Overview": {"Company Name": ""}},
+        {"Overview": {"Company Name": "Acme Consulting LLC"}},
+        {"Overview": {"Company Name": "Acme"}},
+    ])
+    assert merged["Overview"] == {"Company Name": "Acme Consulting LLC"}
+
+
+def test_merge_skips_empty_values():
+    """Test that empty values neither count as facts nor as conflicts"""
+    merged = merge_extractions(["Scope"], [
+        {"Scope": {"Budget": None, "Risks": []}},
+        {"Scope": {"Budget": "$1M", "Risks": {}}},
+        {"Scope": {"Budget": ""}},
+    ])
+    assert merged == {"Scope": {"Budget": "$1M"}}
+
+
+def test_window_limit_is_shared_by_the_sources_of_a_report(monkeypatch):
+    """Test that no more than max_concurrency windows are extracted at a time, over all sources"""
+    monkeypatch.setattr(core.agents.extractor, "extraction_config",
+                        ExtractionConfig(window_tokens=500, overlap_tokens=0, max_concurrency=2))
+    calls = {"in_flight": 0, "max_in_flight": 0, "total": 0}
+
+    async def fake_ainvoke_structured(model, messages, schema):
+        calls["in_flight"] += 1
+        calls["total"] += 1
+        calls["max_in_flight"] = max(calls["max_in_flight"], calls["in_flight"])
+        await asyncio.sleep(0.01)
+        calls["in_flight"] -= 1
+        return SourceExtraction({})
+
+    monkeypatch.setattr(core.agents.extractor, "ainvoke_structured", fake_ainvoke_structured)
+
+    sources = ["a.pdf", "b.pdf", "c.pdf"]
+    state = DocumentPreparationState(
+        sections={
+            s: TemplateSectionDef(title=s, subsections={}, source=s, instructions=None, content="")
+            for s in sources
+        },
+        source_texts={s: TEXT for s in sources},
+        source_extractions={},
+        style_guidelines=None,
+        example_document_text=None,
+        revision_question="",
+        revision=""
+    )
+    extractions = asyncio.run(extract_sources(state))
+
+    assert set(extractions) == set(sources)
+    # Every source has several windows, so each could fill the limit on its own
+    assert calls["total"] > 2 * len(sources)
+    assert calls["max_in_flight"] == 2
@@ -0,0 +1,194 @@
+"""
+Tests for admission control of model calls.
+
+The scheduler reads a fake clock, so rate limits only free up when a test advances it.
+"""
+
+import asyncio
+from contextlib import AsyncExitStack
+from types import SimpleNamespace
+
+import pytest
+
+import core.llm_scheduler
+from core.config.llm_config import LlmSchedulerConfig
+from core.llm_scheduler import LlmScheduler, Priority, priority
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(core.llm_scheduler, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+async def settle():
+    """Lets woken calls run until they wait again."""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+async def hold(scheduler: LlmScheduler, prompt_tokens: int = 0):
+    """Admits a call and keeps it in flight until the returned stack is closed."""
+    stack = AsyncExitStack()
+    grant = await stack.enter_async_context(scheduler.aslot(prompt_tokens))
+    return stack, grant
+
+
+def test_priority_order(clock):
+    """Test that queued calls are admitted by priority class, first come first served within one"""
+    scheduler = LlmScheduler(LlmSchedulerConfig(requests_per_second=0, max_in_flight=1))
+    admitted = []
+
+    async def call(name: str, level: Priority):
+        with priority(level):
+            async with scheduler.aslot():
+                admitted.append(name)
+
+    async def run():
+        running, _ = await hold(scheduler)
+        tasks = [
+            asyncio.create_task(call("batch 1", Priority.BATCH)),
+            asyncio.create_task(call("default", Priority.DEFAULT)),
+            asyncio.create_task(call("batch 2", Priority.BATCH)),
+            asyncio.create_task(call("interactive", Priority.INTERACTIVE)),
+        ]
+        await settle()
+        assert admitted == []
+        assert scheduler.stats()["queued_by_priority"] == {"interactive": 1, "default": 1, "batch": 2}
+        await running.aclose()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert admitted == ["interactive", "default", "batch 1", "batch 2"]
+
+
+def test_max_in_flight(clock):
+    """Test that no more than max_in_flight calls run at the same time"""
+    scheduler = LlmScheduler(LlmSchedulerConfig(requests_per_second=0, max_in_flight=2))
+
+    async def run():
+        first, _ = await hold(scheduler)
+        second, _ = await hold(scheduler)
+        third = asyncio.create_task(hold(scheduler))
+        await settle()
+        assert scheduler.stats()["in_flight"] == 2
+        assert not third.done()
+        await first.aclose()
+        stack, _ = await asyncio.wait_for(third, 1)
+        await second.aclose()
+        await stack.aclose()
+
+    asyncio.run(run())
+    assert scheduler.stats()["admitted"] == 3
+
+
+def test_requests_per_second(clock):
+    """Test that a burst of one second's requests starts at once and the next waits for the bucket"""
+    scheduler = LlmScheduler(LlmSchedulerConfig(requests_per_second=20))
+
+    async def run():
+        for _ in range(20):
+            stack, _ = await hold(scheduler)
+            await stack.aclose()
+
+        next_call = asyncio.create_task(hold(scheduler))
+        # Longer than the 0.05s the call waits for, but the clock did not move
+        await asyncio.sleep(0.1)
+        assert not next_call.done()
+
+        clock.now += 0.1
+        stack, _ = await asyncio.wait_for(next_call, 1)
+        await stack.aclose()
+
+    asyncio.run(run())
+    assert scheduler.stats()["admitted"] == 21
+
+
+def test_tokens_per_minute(clock):
+    """Test that a call waits until the tokens charged in the last minute leave room for it"""
+    scheduler = LlmScheduler(LlmSchedulerConfig(requests_per_second=0, tokens_per_minute=1000,
+                                                completion_token_estimate=0))
+
+    async def run():
+        other, _ = await hold(scheduler)
+        first, _ = await hold(scheduler, 600)
+        second = asyncio.create_task(hold(scheduler, 600))
+        await settle()
+        assert not second.done()
+
+        # Finishing does not return the tokens, only leaving the rolling minute does
+        await first.aclose()
+        await settle()
+        assert not second.done()
+
+        clock.now += 60
+        await other.aclose()
+        stack, _ = await asyncio.wait_for(second, 1)
+        await stack.aclose()
+
+    asyncio.run(run())
+    assert scheduler.stats()["admitted"] == 3
+
+
+def test_tokens_per_minute_corrected_by_usage(clock):
+    """Test that reported usage replaces the estimate charged when the call was admitted"""
+    scheduler = LlmScheduler(LlmSchedulerConfig(requests_per_second=0, tokens_per_minute=1000,
+                                                completion_token_estimate=400))
+
+    async def run():
+        first, grant = await hold(scheduler, 400)
+        second = asyncio.create_task(hold(scheduler, 400))
+        await settle()
+        assert not second.done()
+
+        grant.record_usage({"input_tokens": 400, "output_tokens": 50, "total_tokens": 450})
+        await first.aclose()
+        stack, _ = await asyncio.wait_for(second, 1)
+        await stack.aclose()
+
+    asyncio.run(run())
+    stats = scheduler.stats()
+    assert stats["tokens_last_minute"] == 450 + 800
+    assert stats["prompt_tokens"] == 400
+    assert stats["completion_tokens"] == 50
+
+
+def test_rate_limit_errors_are_counted(clock):
+    """Test that calls failing with HTTP 429 are counted for the section limiter"""
+    scheduler = LlmScheduler(LlmSchedulerConfig(requests_per_second=0))
+
+    class Throttled(Exception):
+        status_code = 429
+
+    async def run():
+        with pytest.raises(Throttled):
+            async with scheduler.aslot():
+                raise Throttled()
+        with pytest.raises(ValueError):
+            async with scheduler.aslot():
+                raise ValueError()
+
+    asyncio.run(run())
+    assert scheduler.rate_limited == 1
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_sync_slot(clock):
+    """Test that threads are admitted through the same queue"""
+    scheduler = LlmScheduler(LlmSchedulerConfig(requests_per_second=0, max_in_flight=1))
+
+    with scheduler.slot(100) as grant:
+        assert scheduler.stats()["in_flight"] == 1
+        grant.record_usage({"input_tokens": 100, "output_tokens": 5, "total_tokens": 105})
+
+    assert scheduler.stats()["in_flight"] == 0
+    assert scheduler.stats()["tokens_last_minute"] == 105
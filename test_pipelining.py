@@ -0,0 +1,91 @@
+"""
+Tests that drafting does not wait for fact extraction or for sources it does not use.
+
+Runs on the fake model backend (see conftest.py) with fact extraction or the loading of
+a source slowed down, so that either finishes well after the first section could be drafted.
+"""
+
+import asyncio
+import time
+
+import core.agents.extractor
+
+
+EXTRACTION_SECONDS = 2.0
+
+SOURCE_TEXTS = {
+    "SOW.docx": "Acme Consulting LLC will deliver a data platform within six months. " * 20,
+    "company_overview.pdf": "Acme Consulting LLC is a data consultancy founded in 2010. " * 20,
+}
+
+
+def test_section_drafted_before_extraction_finishes(monkeypatch):
+    """Test that a section is drafted while the facts are still extracted, and the report waits for them"""
+    import core.document
+    from core.checkpoint import new_thread_id
+    from core.metrics import UsageAccountant
+    from core.workflows.document_extraction import load_report_structure
+
+    extracted = []
+    extract_key_data = core.agents.extractor.extract_key_data
+
+    async def slow_extract_key_data(*args, **kwargs):
+        await asyncio.sleep(EXTRACTION_SECONDS)
+        result = await extract_key_data(*args, **kwargs)
+        extracted.append(time.perf_counter() - started)
+        return result
+
+    monkeypatch.setattr(core.agents.extractor, "extract_key_data", slow_extract_key_data)
+
+    sections = load_report_structure("templates/proposal_template.json")
+    thread_id = new_thread_id("test")
+    usage = UsageAccountant()
+    started = time.perf_counter()
+    asyncio.run(core.document.generate(sections, SOURCE_TEXTS, usage=usage, thread_id=thread_id))
+    usage.finish()
+
+    first_section = usage.report()["first_section_seconds"]
+    assert first_section is not None
+    assert len(extracted) == len(SOURCE_TEXTS)
+    assert first_section < min(extracted), (
+        f"First section drafted after {first_section:.2f}s, extraction finished after {min(extracted):.2f}s"
+    )
+
+    # The report still went to the first revision with the facts
+    state = asyncio.run(core.document.graph.aget_state(core.document.get_agent_config(thread_id)))
+    assert state.next == ("human_revision_node",)
+    assert set(state.values["source_extractions"]) == set(SOURCE_TEXTS)
+
+
+def test_section_drafted_before_slow_source_is_loaded():
+    """Test that sections wait for their own sources only, while a slow one is loaded in a worker thread"""
+    import core.document
+    from core.checkpoint import new_thread_id
+    from core.metrics import UsageAccountant
+    from core.workflows.document_extraction import load_report_structure
+
+    loaded = []
+
+    def load_slowly() -> str:
+        time.sleep(EXTRACTION_SECONDS)
+        loaded.append(time.perf_counter() - started)
+        return SOURCE_TEXTS["company_overview.pdf"]
+
+    sources = {"SOW.docx": SOURCE_TEXTS["SOW.docx"], "company_overview.pdf": load_slowly}
+    sections = load_report_structure("templates/proposal_template.json")
+    thread_id = new_thread_id("test")
+    usage = UsageAccountant()
+    started = time.perf_counter()
+    asyncio.run(core.document.generate(sections, sources, usage=usage, thread_id=thread_id))
+    usage.finish()
+
+    first_section = usage.report()["first_section_seconds"]
+    assert first_section is not None
+    assert loaded and first_section < loaded[0], (
+        f"First section drafted after {first_section:.2f}s, source loaded after {loaded[0]:.2f}s"
+    )
+
+    # The loaded text is kept with the report, which can be resumed from it
+    state = asyncio.run(core.document.graph.aget_state(core.document.get_agent_config(thread_id)))
+    assert state.values["source_texts"] == SOURCE_TEXTS
+    assert set(state.values["source_extractions"]) == set(SOURCE_TEXTS)
@@ -0,0 +1,75 @@
+"""
+Tests for ordering template sections by their `depends_on` dependencies.
+"""
+
+import pytest
+
+from core.section_dependencies import SectionDependencyError, dependency_waves, resolve_dependencies, template_nodes
+
+
+def section(*depends_on: str, subsections: dict = None) -> dict:
+    return {"depends_on": list(depends_on), "subsections": subsections or {}}
+
+
+def test_independent_sections():
+    """Test that sections without dependencies are all drafted in the first wave"""
+    nodes = template_nodes({"a": section(), "b": section(), "c": section()})
+    assert resolve_dependencies(nodes) == [[], [], []]
+    assert dependency_waves(nodes) == [[0, 1, 2]]
+
+
+def test_chain():
+    """Test that a chain of dependencies gives one wave per section"""
+    nodes = template_nodes({"summary": section("risks"), "risks": section("scope"), "scope": section()})
+    assert resolve_dependencies(nodes) == [[1], [2], []]
+    assert dependency_waves(nodes) == [[2], [1], [0]]
+
+
+def test_diamond():
+    """Test that a section depending on two siblings waits for both, which share one upstream"""
+    nodes = template_nodes({
+        "summary": section("pricing", "timeline"),
+        "pricing": section("scope"),
+        "timeline": section("scope"),
+        "scope": section(),
+    })
+    assert resolve_dependencies(nodes) == [[1, 2], [3], [3], []]
+    assert dependency_waves(nodes) == [[3], [1, 2], [0]]
+
+
+def test_depending_on_a_chapter():
+    """Test that depending on a section includes its subsections"""
+    nodes = template_nodes({
+        "summary": section("approach"),
+        "approach": section(subsections={"phase_1": section(), "phase_2": section()}),
+    })
+    assert [n.key for n in nodes] == ["summary", "approach", "phase_1", "phase_2"]
+    assert resolve_dependencies(nodes) == [[1, 2, 3], [], [], []]
+    assert dependency_waves(nodes) == [[1, 2, 3], [0]]
+
+
+def test_cycle():
+    """Test that a cycle is rejected, naming only the sections in it"""
+    nodes = template_nodes({"a": section("b"), "b": section("c"), "c": section("a"), "d": section()})
+    with pytest.raises(SectionDependencyError, match="a, b, c$"):
+        dependency_waves(nodes)
+
+
+def test_unknown_dependency():
+    """Test that depending on a section the template does not have is rejected"""
+    nodes = template_nodes({"a": section("missing")})
+    with pytest.raises(SectionDependencyError, match="unknown section 'missing'"):
+        resolve_dependencies(nodes)
+    with pytest.raises(SectionDependencyError):
+        dependency_waves(nodes)
+
+
+def test_ambiguous_dependency():
+    """Test that depending on a key used by several subsections is rejected"""
+    nodes = template_nodes({
+        "a": section(subsections={"details": section()}),
+        "b": section(subsections={"details": section()}),
+        "c": section("details"),
+    })
+    with pytest.raises(SectionDependencyError, match="names 2 sections"):
+        resolve_dependencies(nodes)